@@ -1,22 +1,78 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+import copy
 import logging
 
-from data_loader.transaction_data_loader import ModelDataLoader
+from data_loader.transaction_data_loader import ModelDataLoader, concat_transactions
 from data_loader.clean_transaction_data import DataCleaner
 from data_loader.enrich_transaction_data import DataEnricher
-from data_loader.transform_transaction_data import DataTransformer
+from data_loader.weather_fetcher import WeatherFetcher, DEFAULT_REQUESTS_PER_SECOND
+from data_loader.transform_transaction_data import DataTransformer, DAILY_DIMENSION_COLUMNS
 from data_loader.create_prediction_data import PredictionData
+from data_loader.auxiliary_data_loader import AuxDataSession
+from data_loader.calendar_features import CalendarFeatureTable
+from data_loader.sales_statistics import SalesStatistics
+from data_loader.checkpoint_cache import CheckpointedPipeline, PipelineStage, code_version, fingerprint_dataframe
+from data_loader import clean_transaction_data, sales_statistics, enrich_transaction_data, weather_fetcher, \
+    daily_feature_index, calendar_features, transform_transaction_data
 from prediction_handeler.process_prediction import ProcessPrediction
 from prediction_handeler.predicted_sales_impact_uploader import BusinessTranslator
 
 import pandas as pd
 
 
+def _clean_partition(model, df_model_data:pd.DataFrame) -> pd.DataFrame:
+    """runs the clean stage of model, module level so it can be sent to a worker process"""
+    return model.clean_model_data(DataCleaner(df_model_data, aux_data_session=model.aux_data_session,
+                                              lazy=model.lazy_cleaning))
+
+
+def _enrich_partition(model, df_model_data:pd.DataFrame) -> pd.DataFrame:
+    """runs the enrich stage of model, module level so it can be sent to a worker process"""
+    return model.enrich_model_data(DataEnricher(df_model_data, model.aux_data_session,
+                                                WeatherFetcher(requests_per_second=model.weather_requests_per_second),
+                                                calendar_table=model.calendar_table))
+
+
+def _enrich_partition_with_row_order(model, df_model_data:pd.DataFrame) -> tuple[pd.DataFrame, bool]:
+    """runs the enrich stage of model, and returns whether the enrichment ordered the rows by Location and day"""
+    enricher = DataEnricher(df_model_data, model.aux_data_session,
+                            WeatherFetcher(requests_per_second=model.weather_requests_per_second),
+                            calendar_table=model.calendar_table)
+    return model.enrich_model_data(enricher), enricher.rows_by_location_and_day
+
+
+def _clean_and_enrich_partition(model, df_model_data:pd.DataFrame) -> pd.DataFrame:
+    """runs the clean and enrich stages of model, module level so it can be sent to a worker process"""
+    return _enrich_partition(model, _clean_partition(model, df_model_data))
+
+
 class DeployableModel(ABC):
+    # plan the cleaning steps and filter the model data once, see DataCleaner
+    lazy_cleaning = False
+    # calendar features per day shared by the enrichers, None lets every enricher compute its own
+    calendar_table = None
+    # rate of the weather requests of an enrichment, shared by the Location partitions when those run in parallel
+    weather_requests_per_second = DEFAULT_REQUESTS_PER_SECOND
+    # the features per day and Location that are columns of X, declare the features added in enrich_model_data here
+    daily_columns = DAILY_DIMENSION_COLUMNS
+    # CheckpointCache of the clean, enrich and transform outputs, None recomputes every stage, see data_loader.checkpoint_cache
+    checkpoint_cache = None
+    # checkpoint key of the last training transform, None until the model data is transformed for training
+    training_transform_key = None
     
-    def __init__(self, days_of_prediction:int = 3):
+    def __init__(self, days_of_prediction:int = 3, n_partitions:int = None):
+        # number of Location partitions enriched in parallel, None runs in this process
+        self.n_partitions = n_partitions
+        # one session per deploy, so every auxiliary dataset is queried once and shared by all stages
+        self.aux_data_session = AuxDataSession()
         self.df_model_data = self.load_model_data(ModelDataLoader())
-        self.df_p_model_data = PredictionData(days_of_prediction).df_prediction_transactions
+        # statistics of the loaded transactions, the outlier correction reads its average daily sales from them
+        self.sales_statistics = SalesStatistics(self.df_model_data)
+        self.df_p_model_data = PredictionData(days_of_prediction, self.aux_data_session).df_prediction_transactions
+        # one calendar over the training and prediction days, shared by every enricher
+        sale_dates = pd.concat([self.df_model_data["SaleDate"], self.df_p_model_data["SaleDate"]])
+        self.calendar_table = CalendarFeatureTable(sale_dates.min(), sale_dates.max())
         
 
     def default_deployment(self):
@@ -28,7 +84,8 @@ class DeployableModel(ABC):
         prediction = self.predict_on_model(model,df_p_x)
         
         df_prediction_hrf = self.process_prediction_to_human_readable_format(prediction,ProcessPrediction(prediction))
-        self.process_hrf_to_business_impact(df_prediction_hrf, BusinessTranslator(df_prediction_hrf))
+        self.process_hrf_to_business_impact(df_prediction_hrf, BusinessTranslator(df_prediction_hrf, self.aux_data_session,
+                                                                                   self.sales_statistics))
         
     @abstractmethod
     def deploy(self):
@@ -53,21 +110,131 @@ class DeployableModel(ABC):
         pass
     
     # standardize procedure for processing transormation dataframe to trainable data
-    def transform_df_model_data_to_df_x_df_y(self,df_model_data:pd.DataFrame, train:bool) -> tuple[pd.DataFrame, pd.DataFrame]:
+    def transform_df_model_data_to_df_x_df_y(self,df_model_data:pd.DataFrame, train:bool, n_partitions:int = None) -> tuple[pd.DataFrame, pd.DataFrame]:
         if train:
             logging.info("Training data is being manipulated") 
         else:
             logging.info("Prediction data is being manipulated")
-            
-        df_model_data = self.clean_model_data(DataCleaner(df_model_data))
-        df_model_data = self.enrich_model_data(DataEnricher(df_model_data))
+        
+        n_partitions = n_partitions if n_partitions is not None else self.n_partitions
+        if self.checkpoint_cache is not None:
+            return self.transform_df_model_data_with_checkpoints(df_model_data, train, n_partitions)
+        
+        if n_partitions is not None and n_partitions > 1:
+            # cleaning rules can compare across Locations, so only the enrichment runs per partition
+            df_model_data = self.enrich_partitioned_by_location(_clean_partition(self, df_model_data), n_partitions)
+        else:
+            df_model_data = _clean_and_enrich_partition(self, df_model_data)
         
         if train:
             self.df_model_data = df_model_data
-        df_x, df_y = self.transform_model_data(DataTransformer(df_model_data), train)
+        # the static Location columns of X come from the machine information, the same for training and prediction
+        df_x, df_y = self.transform_model_data(
+            DataTransformer(df_model_data, self.aux_data_session.load_machine_information(),
+                            daily_columns=self.daily_columns), train)
         return df_x, df_y
     
     
+    def transform_df_model_data_with_checkpoints(self, df_model_data:pd.DataFrame, train:bool, n_partitions:int = None) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """runs clean -> enrich -> transform as a CheckpointedPipeline, unchanged stages are loaded from the checkpoint_cache
+        
+        A stage output is keyed on its input data, the source of its model method and data_loader modules,
+        and the auxiliary data it reads. Changing e.g. the cutoff in clean_model_data reruns clean and the
+        stages after it, changing only define_model reruns nothing. The weather is not part of the key.
+        The training transform fits state on the model (e.g. the encoders of the DataTransformer), so it
+        always runs and only its key is kept. That state can be built by any model method (e.g.
+        define_data_transformer), so the transform is keyed on the source of the whole model class, and the
+        prediction transform also on the training key. The enrich output does not depend on n_partitions.
+        """
+        df_machine_information = self.aux_data_session.load_machine_information()
+        machine_information_fingerprint = fingerprint_dataframe(df_machine_information)
+        
+        def enrich(df_clean):
+            if n_partitions is not None and n_partitions > 1:
+                return self.enrich_partitioned_by_location(df_clean, n_partitions)
+            return _enrich_partition(self, df_clean)
+        
+        def transform(df_enriched):
+            return self.transform_model_data(
+                DataTransformer(df_enriched, df_machine_information, daily_columns=self.daily_columns), train)
+        
+        transform_params = {"train": train, "machine_information": machine_information_fingerprint,
+                            "daily_columns": list(self.daily_columns)}
+        if not train:
+            transform_params["training_transform"] = self.training_transform_key
+        
+        pipeline = CheckpointedPipeline(self.checkpoint_cache, {"model_data": df_model_data}, [
+            PipelineStage("clean", lambda df: _clean_partition(self, df), ["model_data"],
+                          code_version(type(self).clean_model_data, clean_transaction_data, sales_statistics),
+                          {"lazy_cleaning": self.lazy_cleaning,
+                           "location_stock": fingerprint_dataframe(self.aux_data_session.load_location_stock())}),
+            PipelineStage("enrich", enrich, ["clean"],
+                          code_version(type(self).enrich_model_data, enrich_transaction_data, weather_fetcher,
+                                       daily_feature_index, calendar_features),
+                          {"machine_information": machine_information_fingerprint}),
+            PipelineStage("transform", transform, ["enrich"],
+                          code_version(type(self), transform_transaction_data), transform_params),
+        ])
+        
+        if train:
+            self.df_model_data = pipeline.run("enrich")
+            self.training_transform_key = pipeline.key("transform")
+            return transform(self.df_model_data)
+        return pipeline.run("transform")
+    
+    def enrich_partitioned_by_location(self, df_model_data:pd.DataFrame, n_partitions:int) -> pd.DataFrame:
+        """enrich the cleaned model data per Location partition in a process pool
+        
+        The Locations are divided round robin (in sorted order) over n_partitions partitions,
+        each partition is enriched in its own process and the results are put back in the row
+        order and index of a single process run, so the outcome does not depend on the partitioning.
+        Only the enrichment runs per partition, its steps work per Location. The cleaning rules
+        can compare across Locations (e.g. remove_products_with_no_recent_sales with per_machine=False)
+        and the transform stage fits model state on all data, so both run once on all data.
+        """
+        # the auxiliary data is loaded once here and sent along, instead of queried per process
+        self.aux_data_session.load_concurrently(["machine_information", "location_stock"])
+        
+        location_codes, _ = pd.factorize(df_model_data["Location"], sort=True)
+        partition_ids = location_codes % n_partitions
+        df_numbered = df_model_data.assign(_row_number=range(len(df_model_data)))
+        df_partitions = [df_numbered[partition_ids == partition_id] for partition_id in range(n_partitions)]
+        df_partitions = [df_partition for df_partition in df_partitions if not df_partition.empty]
+        
+        # the model is sent to every process, without the full model data it holds
+        worker_model = copy.copy(self)
+        worker_model.df_model_data = None
+        worker_model.df_p_model_data = None
+        worker_model.sales_statistics = None
+        # every process has its own rate limiter, together they request the weather at the configured rate
+        worker_model.weather_requests_per_second = self.weather_requests_per_second / len(df_partitions)
+        
+        with ProcessPoolExecutor(max_workers=len(df_partitions)) as executor:
+            results = list(executor.map(_enrich_partition_with_row_order,
+                                        [worker_model] * len(df_partitions), df_partitions))
+        
+        df_enriched = concat_transactions([df_partition for df_partition, _ in results])
+        if any(rows_by_location_and_day for _, rows_by_location_and_day in results):
+            # as add_missing_days on all data: Locations in groupby order, then days, the added day of a
+            # Location last within its day, the transactions of a day in their original order
+            locations = df_model_data["Location"]
+            location_order = locations.cat.categories if isinstance(locations.dtype, pd.CategoricalDtype) \
+                else pd.Index(locations.dropna().unique()).sort_values()
+            df_enriched = df_enriched.assign(
+                _location_order=pd.Categorical(df_enriched["Location"], categories=location_order).codes,
+                _sale_day=df_enriched["SaleDate"].dt.normalize()).sort_values(
+                ["_location_order", "_sale_day", "_row_number"], kind="stable", na_position="last").drop(
+                columns=["_location_order", "_sale_day"]).reset_index(drop=True)
+        else:
+            df_enriched = df_enriched.sort_values("_row_number", kind="stable")
+            # the index labels are kept, unless the enrichment reset the index as it does for all data
+            if all(df_result.index.equals(df_partition.index) for df_partition, (df_result, _) in zip(df_partitions, results)):
+                df_enriched.index = df_model_data.index[df_enriched["_row_number"].to_numpy(dtype="int64")]
+            else:
+                df_enriched = df_enriched.reset_index(drop=True)
+        logging.info(f"Model data is enriched in {len(df_partitions)} Location partitions")
+        return df_enriched.drop(columns=["_row_number"])
+    
     @abstractmethod
     def define_model(self):
         pass
@@ -1,9 +1,47 @@
 import config
 import os
+import atexit
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import time
+import logging
 import pandas as pd
-from sqlalchemy.engine import URL
-from sqlalchemy import create_engine
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy import create_engine, text, types, inspect
 from sqlalchemy.orm import Session
+from azure_connectors.query_cache import get_query_cache
+from azure_connectors.sql_backend import get_sql_backend, attach_sqlite_schemas
+from azure_connectors.query_metrics import QueryMetrics, emit_query_metrics
+
+# default pool settings for every engine in the registry, see configure_engine_pool
+ENGINE_POOL_SETTINGS = {
+    "pool_size": 5,
+    "max_overflow": 10,
+    "pool_pre_ping": True,
+    "pool_recycle": 1800,
+}
+
+# default number of rows per chunk for execute_query_and_yield_dataframe_chunks
+DEFAULT_CHUNK_SIZE = 100_000
+
+# default number of rows per insert batch for bulk_replace_sql_table_by_dataframe
+DEFAULT_BULK_CHUNK_SIZE = 10_000
+
+# directory in which upsert_dataframe_delta_to_sql_table keeps the hash per row of the last upload
+DEFAULT_SNAPSHOT_DIRECTORY = "upload_snapshots"
+
+# width of the string columns of tables that receive upserts, so later rows with longer strings still fit
+UPSERT_STRING_LENGTH = 4000
+
+# query text -> .sql file it was read from, so results can be traced back to their file
+_QUERY_FILE_OF_QUERY = {}
+
+# default number of queries (and so pooled connections) that execute_queries_concurrently runs at once
+DEFAULT_MAX_CONCURRENT_QUERIES = 4
+
+_ENGINE_REGISTRY = {}
+_ENGINE_REGISTRY_LOCK = threading.Lock()
 
 def create_azure_connection_url(driver, server, database, username, password):
     connection_string = f"DRIVER={driver};SERVER={server};DATABASE={database};UID={username};PWD={password}"
@@ -11,28 +49,314 @@ def create_azure_connection_url(driver, server, database, username, password):
     return connection_url
 
 
+def configure_engine_pool(**pool_settings) -> None:
+    '''Function that updates the pool settings (pool_size, max_overflow, pool_pre_ping, pool_recycle)
+    used for engines created after this call. Already registered engines are disposed so they are
+    recreated with the new settings on next use.'''
+    unknown_settings = set(pool_settings) - set(ENGINE_POOL_SETTINGS)
+    if unknown_settings:
+        raise ValueError(f"Unknown pool settings: {sorted(unknown_settings)}")
 
-def replace_sql_table_by_dataframe(connection_url, table_name, dataframe, schema = 'API'):
-    engine = create_engine(connection_url, fast_executemany = True)
+    ENGINE_POOL_SETTINGS.update(pool_settings)
+    dispose_engines()
+
+
+def get_engine(connection_url):
+    '''Function that returns the pooled engine for connection_url from the process wide registry.
+
+    The engine is created on first use and reused by every later call with the same connection url,
+    so connections (and their TLS handshake) are shared between all loaders in one process.
+    The connection url is first resolved by the active sql backend, so offline backends get a local engine.
+    SQLite engines get a database attached per schema, see sql_backend.attach_sqlite_schemas.'''
+    url = make_url(get_sql_backend().resolve_connection_url(connection_url))
+    registry_key = url.render_as_string(hide_password=False)
+
+    with _ENGINE_REGISTRY_LOCK:
+        engine = _ENGINE_REGISTRY.get(registry_key)
+        if engine is None:
+            engine_kwargs = {"pool_pre_ping": ENGINE_POOL_SETTINGS["pool_pre_ping"],
+                             "pool_recycle": ENGINE_POOL_SETTINGS["pool_recycle"]}
+            # sqlite (local stand-in) uses its own pool classes that do not accept sizing
+            if url.get_backend_name() != "sqlite":
+                engine_kwargs["pool_size"] = ENGINE_POOL_SETTINGS["pool_size"]
+                engine_kwargs["max_overflow"] = ENGINE_POOL_SETTINGS["max_overflow"]
+            if url.get_driver_name() == "pyodbc":
+                engine_kwargs["fast_executemany"] = True
+
+            engine = create_engine(url, **engine_kwargs)
+            if url.get_backend_name() == "sqlite":
+                attach_sqlite_schemas(engine)
+            _ENGINE_REGISTRY[registry_key] = engine
+    return engine
+
+
+def dispose_engines() -> None:
+    '''Function that closes all pooled connections and empties the engine registry. Runs at process exit.'''
+    with _ENGINE_REGISTRY_LOCK:
+        for engine in _ENGINE_REGISTRY.values():
+            engine.dispose()
+        _ENGINE_REGISTRY.clear()
+
+
+atexit.register(dispose_engines)
+
+
+def _create_query_metrics(query: str) -> QueryMetrics:
+    return QueryMetrics(query_file=get_query_file_of_query(query) or "<inline>",
+                        backend=type(get_sql_backend()).__name__)
+
+
+def _create_write_metrics(table_name: str, schema: str) -> QueryMetrics:
+    return QueryMetrics(query_file=f"<write {schema}.{table_name}>", backend=type(get_sql_backend()).__name__)
+
+
+@contextmanager
+def _measured(query_metrics: QueryMetrics):
+    '''Context manager that times its block as the execution of query_metrics and emits them, also when the block fails'''
+    started = time.perf_counter()
     try:
-        dataframe.to_sql(table_name, engine, schema= schema, if_exists= 'replace', index= False)
-        # config.QUERY_LOGGER.info(f'Replaced {table_name}')
-    except Exception as e:
-        print(e)
-        # config.QUERY_LOGGER.exception(f'Error in replacing {table_name} :')
+        yield query_metrics
     finally:
-        engine.dispose()
+        query_metrics.execute_seconds += time.perf_counter() - started
+        emit_query_metrics(query_metrics)
+
+
+def replace_sql_table_by_dataframe(connection_url, table_name, dataframe, schema = 'API'):
+    engine = get_engine(connection_url)
+    try:
+        with _measured(_create_write_metrics(table_name, schema)) as query_metrics:
+            dataframe.to_sql(table_name, engine, schema= schema, if_exists= 'replace', index= False)
+            query_metrics.add_result(dataframe)
+        logging.info(f'Replaced {table_name}')
+    except Exception:
+        logging.exception(f'Error in replacing {table_name} :')
 
 def append_dataframe_to_sql_table(connection_url, table_name, dataframe, schema = 'API'):
-    engine = create_engine(connection_url, fast_executemany = True)
+    engine = get_engine(connection_url)
     try:
-        dataframe.to_sql(table_name, engine, schema= schema, if_exists= 'append', index= False)
-        # config.QUERY_LOGGER.info(f'Appended {table_name}')
-    except Exception as e:
-        print(e)
-        # config.QUERY_LOGGER.exception(f'Error in appending {table_name} :')
+        with _measured(_create_write_metrics(table_name, schema)) as query_metrics:
+            dataframe.to_sql(table_name, engine, schema= schema, if_exists= 'append', index= False)
+            query_metrics.add_result(dataframe)
+        logging.info(f'Appended {table_name}')
+    except Exception:
+        logging.exception(f'Error in appending {table_name} :')
+
+
+def infer_sql_column_types(dataframe: pd.DataFrame, string_length: int = None) -> dict:
+    '''Function that returns explicit sqlalchemy column types for the columns of dataframe.
+    String columns are as wide as their longest value, or string_length if given.
+    Columns of which the type cannot be determined are left out, so pandas falls back to its own inference.'''
+    column_types = {}
+    for column in dataframe.columns:
+        series = dataframe[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            series = series.astype(series.cat.categories.dtype)
+        inferred_type = pd.api.types.infer_dtype(series, skipna=True)
+
+        if inferred_type == "integer":
+            column_types[column] = types.BigInteger()
+        elif inferred_type in ("floating", "mixed-integer-float", "decimal"):
+            column_types[column] = types.Float()
+        elif inferred_type == "boolean":
+            column_types[column] = types.Boolean()
+        elif inferred_type in ("datetime64", "datetime"):
+            column_types[column] = types.DateTime()
+        elif inferred_type == "date":
+            column_types[column] = types.Date()
+        elif inferred_type == "string":
+            max_length = int(series.dropna().str.len().max()) if series.notna().any() else 1
+            column_length = max(max_length, string_length or 1)
+            column_types[column] = types.Unicode(column_length) if column_length <= 4000 else types.UnicodeText()
+    return column_types
+
+
+def _drop_table_statement(dialect_name: str, table_name: str, schema: str) -> str:
+    '''Function that returns the statement that drops table_name if it exists, for the given dialect'''
+    if dialect_name == "mssql":
+        return f"DROP TABLE IF EXISTS [{schema or 'dbo'}].[{table_name}]"
+    prefix = f'"{schema}".' if schema else ""
+    return f'DROP TABLE IF EXISTS {prefix}"{table_name}"'
+
+
+def _swap_staging_table_statements(dialect_name: str, table_name: str, staging_table_name: str, schema: str) -> list:
+    '''Function that returns the statements that replace table_name by staging_table_name for the given dialect'''
+    if dialect_name == "mssql":
+        schema = schema or "dbo"
+        return [_drop_table_statement(dialect_name, table_name, schema),
+                f"EXEC sp_rename '{schema}.{staging_table_name}', '{table_name}'"]
+
+    prefix = f'"{schema}".' if schema else ""
+    return [_drop_table_statement(dialect_name, table_name, schema),
+            f'ALTER TABLE {prefix}"{staging_table_name}" RENAME TO "{table_name}"']
+
+
+def _snapshot_path(table_name: str, schema: str, snapshot_directory: str = DEFAULT_SNAPSHOT_DIRECTORY) -> str:
+    return os.path.join(snapshot_directory, f"{schema}.{table_name}.parquet")
+
+
+def delete_upload_snapshot(table_name: str, schema: str = 'API', snapshot_directory: str = DEFAULT_SNAPSHOT_DIRECTORY) -> None:
+    '''Function that removes the snapshot of the last delta upload of a table, so the next delta upload replaces the table'''
+    try:
+        os.remove(_snapshot_path(table_name, schema, snapshot_directory))
+    except FileNotFoundError:
+        pass
+
+
+def bulk_replace_sql_table_by_dataframe(connection_url, table_name, dataframe, schema = 'API',
+                                        dtype: dict = None, chunk_size: int = DEFAULT_BULK_CHUNK_SIZE,
+                                        snapshot_directory: str = DEFAULT_SNAPSHOT_DIRECTORY):
+    '''Function that replaces a table without readers ever seeing it empty or half written.
+
+    1) bulk insert dataframe into a staging table, in batches of chunk_size rows with explicit column types
+    2) drop the old table and rename the staging table to table_name in one transaction
+    A staging table that is left by a failure is dropped. Once the table is replaced, the snapshot of the
+    last delta upload no longer describes it, so it is removed; a failed replacement keeps it.
+    Returns the achieved rows/sec, or None if the replacement failed.'''
+    engine = get_engine(connection_url)
+    staging_table_name = f"{table_name}_staging"
+    column_types = infer_sql_column_types(dataframe)
+    column_types.update(dtype or {})
+
+    start_time = time.perf_counter()
+    try:
+        with _measured(_create_write_metrics(table_name, schema)) as query_metrics:
+            dataframe.to_sql(staging_table_name, engine, schema= schema, if_exists= 'replace', index= False,
+                             chunksize= chunk_size, dtype= column_types)
+            with engine.begin() as connection:
+                for statement in _swap_staging_table_statements(engine.dialect.name, table_name, staging_table_name, schema):
+                    connection.execute(text(statement))
+            query_metrics.add_result(dataframe)
+    except Exception:
+        logging.exception(f'Error in bulk replacing {table_name} :')
+        return None
     finally:
-        engine.dispose()
+        # after a successful swap the staging table is renamed, so there is nothing left to drop
+        try:
+            with engine.begin() as connection:
+                connection.execute(text(_drop_table_statement(engine.dialect.name, staging_table_name, schema)))
+        except Exception:
+            logging.warning(f'Staging table {staging_table_name} could not be dropped', exc_info=True)
+
+    delete_upload_snapshot(table_name, schema, snapshot_directory)
+    elapsed_seconds = time.perf_counter() - start_time
+    rows_per_second = len(dataframe) / elapsed_seconds if elapsed_seconds > 0 else float("inf")
+    logging.info(f'Bulk replaced {table_name}: {len(dataframe)} rows in {elapsed_seconds:.2f}s ({rows_per_second:.0f} rows/sec)')
+    return rows_per_second
+
+
+def _hash_rows(dataframe: pd.DataFrame, key_columns: list) -> pd.DataFrame:
+    '''Function that returns a DataFrame with the key_columns and a RowHash of all other columns per row'''
+    value_columns = [column for column in dataframe.columns if column not in key_columns]
+    df_row_hashes = dataframe[key_columns].copy()
+    df_row_hashes["RowHash"] = pd.util.hash_pandas_object(dataframe[value_columns], index=False).values
+    df_row_hashes.attrs["columns"] = [str(column) for column in dataframe.columns]
+    return df_row_hashes
+
+
+def _delta_merge_statements(dialect_name: str, table_name: str, delta_table_name: str, schema: str,
+                            key_columns: list, value_columns: list) -> list:
+    '''Function that returns the set based statements that apply the delta table to table_name.
+    Rows in the delta table are marked by the DeltaAction column as 'upsert' or 'delete'.'''
+    if dialect_name == "mssql":
+        schema = schema or "dbo"
+        on_clause = " AND ".join(f"target.[{column}] = source.[{column}]" for column in key_columns)
+        update_clause = ", ".join(f"target.[{column}] = source.[{column}]" for column in value_columns)
+        all_columns = ", ".join(f"[{column}]" for column in key_columns + value_columns)
+        source_columns = ", ".join(f"source.[{column}]" for column in key_columns + value_columns)
+        return [f"MERGE [{schema}].[{table_name}] AS target "
+                f"USING [{schema}].[{delta_table_name}] AS source ON {on_clause} "
+                f"WHEN MATCHED AND source.[DeltaAction] = 'delete' THEN DELETE "
+                f"WHEN MATCHED THEN UPDATE SET {update_clause} "
+                f"WHEN NOT MATCHED BY TARGET AND source.[DeltaAction] = 'upsert' "
+                f"THEN INSERT ({all_columns}) VALUES ({source_columns});",
+                f"DROP TABLE [{schema}].[{delta_table_name}]"]
+
+    # dialects without MERGE (e.g. the local SQLite stand-in): delete every changed key, insert the upserts
+    prefix = f'"{schema}".' if schema else ""
+    keys = ", ".join(f'"{column}"' for column in key_columns)
+    all_columns = ", ".join(f'"{column}"' for column in key_columns + value_columns)
+    return [f'DELETE FROM {prefix}"{table_name}" WHERE ({keys}) IN (SELECT {keys} FROM {prefix}"{delta_table_name}")',
+            f'INSERT INTO {prefix}"{table_name}" ({all_columns}) '
+            f'SELECT {all_columns} FROM {prefix}"{delta_table_name}" WHERE "DeltaAction" = \'upsert\'',
+            f'DROP TABLE {prefix}"{delta_table_name}"']
+
+
+def _exceeds_string_widths(engine, table_name: str, schema: str, dataframe: pd.DataFrame) -> bool:
+    '''Function that returns True if a string in dataframe is longer than its column in the existing table'''
+    column_lengths = {column["name"]: getattr(column["type"], "length", None)
+                      for column in inspect(engine).get_columns(table_name, schema=schema)}
+    for column, column_type in infer_sql_column_types(dataframe).items():
+        column_length = column_lengths.get(column)
+        if isinstance(column_type, types.UnicodeText) and column_length is not None:
+            return True
+        if isinstance(column_type, types.Unicode) and column_length is not None and column_type.length > column_length:
+            return True
+    return False
+
+
+def upsert_dataframe_delta_to_sql_table(connection_url, table_name, dataframe, key_columns: list, schema = 'API',
+                                        snapshot_directory: str = DEFAULT_SNAPSHOT_DIRECTORY,
+                                        force_replace: bool = False):
+    '''Function that uploads only the rows of dataframe that changed since the last upload.
+
+    1) hash every row and diff the hashes against the local snapshot of the last upload on key_columns
+    2) write the inserted, updated and deleted keys to a delta table
+    3) apply the delta table in one set based MERGE (or delete + insert on dialects without MERGE)
+    Without a usable snapshot, when the columns changed, when a string is longer than its column or with
+    force_replace, the table is fully replaced instead, with string columns of UPSERT_STRING_LENGTH.
+    Returns a dict with the number of inserted, updated and deleted rows, or None if the upload failed.'''
+    engine = get_engine(connection_url)
+    snapshot_path = _snapshot_path(table_name, schema, snapshot_directory)
+    df_new_hashes = _hash_rows(dataframe, key_columns)
+
+    df_old_hashes = pd.read_parquet(snapshot_path) if os.path.exists(snapshot_path) and not force_replace else None
+    if (df_old_hashes is None or df_old_hashes.attrs.get("columns") != df_new_hashes.attrs["columns"]
+            or not inspect(engine).has_table(table_name, schema=schema)
+            or _exceeds_string_widths(engine, table_name, schema, dataframe)):
+        if bulk_replace_sql_table_by_dataframe(connection_url, table_name, dataframe, schema,
+                                               dtype=infer_sql_column_types(dataframe, UPSERT_STRING_LENGTH),
+                                               snapshot_directory=snapshot_directory) is None:
+            return None
+        os.makedirs(snapshot_directory, exist_ok=True)
+        df_new_hashes.to_parquet(snapshot_path, index=False)
+        return {"inserted": len(dataframe), "updated": 0, "deleted": 0}
+
+    df_compared = pd.merge(df_new_hashes.assign(RowPosition=range(len(df_new_hashes))), df_old_hashes, on=key_columns, how="outer",
+                           suffixes=("", "_old"), indicator=True)
+    mask_inserted = (df_compared["_merge"] == "left_only").values
+    mask_updated = ((df_compared["_merge"] == "both") & (df_compared["RowHash"] != df_compared["RowHash_old"])).values
+    mask_deleted = (df_compared["_merge"] == "right_only").values
+    delta_counts = {"inserted": int(mask_inserted.sum()), "updated": int(mask_updated.sum()),
+                    "deleted": int(mask_deleted.sum())}
+
+    if sum(delta_counts.values()) == 0:
+        logging.info(f'No changes to upload for {table_name}')
+        return delta_counts
+
+    value_columns = [column for column in dataframe.columns if column not in key_columns]
+    df_upserts = dataframe.iloc[df_compared.loc[mask_inserted | mask_updated, "RowPosition"].astype(int)].copy()
+    df_upserts["DeltaAction"] = "upsert"
+    df_deletes = df_compared.loc[mask_deleted, key_columns].copy()
+    df_deletes["DeltaAction"] = "delete"
+    df_delta = pd.concat([df_upserts, df_deletes], ignore_index=True)[key_columns + value_columns + ["DeltaAction"]]
+
+    delta_table_name = f"{table_name}_delta"
+    try:
+        with _measured(_create_write_metrics(table_name, schema)) as query_metrics:
+            df_delta.to_sql(delta_table_name, engine, schema= schema, if_exists= 'replace', index= False,
+                            chunksize= DEFAULT_BULK_CHUNK_SIZE, dtype= infer_sql_column_types(df_delta, UPSERT_STRING_LENGTH))
+            with engine.begin() as connection:
+                for statement in _delta_merge_statements(engine.dialect.name, table_name, delta_table_name, schema,
+                                                         key_columns, value_columns):
+                    connection.execute(text(statement))
+            query_metrics.add_result(df_delta)
+    except Exception:
+        logging.exception(f'Error in upserting delta into {table_name} :')
+        return None
+
+    df_new_hashes.to_parquet(snapshot_path, index=False)
+    logging.info(f'Upserted delta into {table_name}: {delta_counts}')
+    return delta_counts
 
 
 def get_query_from_file(relative_file_path: str) -> str:
@@ -40,13 +364,72 @@ def get_query_from_file(relative_file_path: str) -> str:
     with open(relative_file_path) as file:
         query = file.read()
 
+    _QUERY_FILE_OF_QUERY[query] = relative_file_path
     return query
 
 
-def execute_query_and_load_results_into_dataframe(connection_url, query):
-    engine = create_engine(connection_url, fast_executemany = True)
-    return pd.read_sql(sql= query, con= engine)
+def get_query_file_of_query(query: str):
+    '''Function that returns the .sql file the query was read from, or None if it was not read from a file'''
+    return _QUERY_FILE_OF_QUERY.get(query)
+
+
+def execute_query_and_load_results_into_dataframe(connection_url, query, params = None, force_refresh: bool = False):
+    '''Function that loads the query results into a dataframe.
+
+    When the query cache is enabled (azure_connectors.query_cache.enable_query_cache) the result is served
+    from disk while it is within the time to live of its .sql file, unless force_refresh is set.'''
+    query_metrics = _create_query_metrics(query)
+    query_cache = get_query_cache()
+    if query_cache is not None:
+        cache_key = query_cache.create_key(connection_url, query, params)
+        if not force_refresh:
+            started = time.perf_counter()
+            dataframe = query_cache.get(cache_key, query_cache.get_ttl(get_query_file_of_query(query)))
+            if dataframe is not None:
+                query_metrics.cache = "hit"
+                query_metrics.fetch_seconds = time.perf_counter() - started
+                query_metrics.add_result(dataframe)
+                emit_query_metrics(query_metrics)
+                return dataframe
+        query_metrics.cache = "miss"
+
+    dataframe = get_sql_backend().read_dataframe(connection_url, query, params, query_metrics)
+    query_metrics.add_result(dataframe)
+    emit_query_metrics(query_metrics)
 
+    if query_cache is not None:
+        query_cache.put(cache_key, dataframe)
+    return dataframe
+
+
+def execute_query_and_yield_dataframe_chunks(connection_url, query, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                                             dtype: dict = None, parse_dates: list = None, params = None):
+    '''Generator that streams the query results as DataFrames of at most chunk_size rows.
+
+    A server side cursor (stream_results) is used, so only one chunk is fetched into memory at a time.
+    dtype and parse_dates are applied to every chunk, so chunks arrive typed instead of as object columns.'''
+    query_metrics = _create_query_metrics(query)
+    try:
+        for df_chunk in get_sql_backend().read_dataframe_chunks(connection_url, query, chunk_size, dtype,
+                                                                parse_dates, query_metrics, params):
+            query_metrics.add_result(df_chunk)
+            yield df_chunk
+    finally:
+        emit_query_metrics(query_metrics)
+
+
+
+def execute_queries_concurrently(connection_url, named_queries: dict,
+                                 max_concurrent_queries: int = DEFAULT_MAX_CONCURRENT_QUERIES) -> dict:
+    '''Function that runs independent queries concurrently and returns all results together.
+
+    named_queries maps a name to a query, the returned dict maps the same names to the result dataframes.
+    At most max_concurrent_queries connections are taken from the pool at once, so the wall clock cost
+    is that of the slowest query rather than the sum of all queries.'''
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrent_queries, len(named_queries)))) as executor:
+        futures = {name: executor.submit(execute_query_and_load_results_into_dataframe, connection_url, query)
+                   for name, query in named_queries.items()}
+        return {name: future.result() for name, future in futures.items()}
 
 
 def run_query_file_that_replaces_existing_MySQL_table(connection_url: str, relative_file_path: str, table_name: str, schema: str) -> None:
@@ -67,20 +450,21 @@ def run_query_file_that_replaces_existing_MySQL_table(connection_url: str, relat
 
 
 def execute_query(connection_url, query: str):
-    engine = create_engine(connection_url, fast_executemany = True)
+    engine = get_engine(connection_url)
     try:
-        with Session(engine) as session, session.begin():
+        with _measured(_create_query_metrics(query)), Session(engine) as session, session.begin():
             result = session.execute(query)
-        # config.QUERY_LOGGER.info(f'Succesfully ran query: {query}')
+        logging.info(f'Succesfully ran query: {query}')
         return result
     except:
-        print("error")
-        # config.QUERY_LOGGER.exception(f'Error in executing query: {query} ')
-    finally:
-        engine.dispose()
+        logging.exception(f'Error in executing query: {query} ')
 
     
 def connect_azure():
     """Get access key for sql database"""
+    sql_backend = get_sql_backend()
+    if sql_backend.is_offline:
+        # offline runs (replay / local database) do not need the keyvault
+        return sql_backend.resolve_connection_url(None)
     pass
     return connection
@@ -0,0 +1,194 @@
+"""Module for an opt-in on-disk cache of query results, stored as Parquet files"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from datetime import timedelta
+import pandas as pd
+
+DEFAULT_CACHE_DIRECTORY = "query_cache"
+DEFAULT_MAX_SIZE_BYTES = 2 * 1024 ** 3
+DEFAULT_TTL = timedelta(hours=1)
+
+# time to live per .sql file, slow changing data can be reused for longer
+QUERY_FILE_TTLS = {
+    "machine_data.sql": timedelta(days=1),
+    "stock_per_location.sql": timedelta(hours=1),
+    "average_daily_sales.sql": timedelta(hours=12),
+    "load_training_data.sql": timedelta(hours=12),
+}
+
+
+class QueryCache:
+    """
+    A class used to cache query results on disk.
+
+    Every result is stored as a Parquet file named after the hash of the connection, query text and
+    its parameters. A result is served while it is younger than its time to live, and the least
+    recently used results are evicted when the cache grows over max_size_bytes.
+
+    Attributes
+    ----------
+    directory : str
+        The directory in which the Parquet files are stored.
+    max_size_bytes : int
+        The maximum total size of the cache directory.
+    default_ttl : timedelta
+        The time to live of results of queries that have no entry in ttl_per_query_file.
+    ttl_per_query_file : dict
+        The time to live per .sql file name.
+    force_refresh : bool
+        If True, cached results are never served, but fresh results are still stored.
+
+    Methods
+    -------
+    create_key(connection_url, query: str, params):
+        Returns the cache key of a query.
+    get_ttl(query_file: str):
+        Returns the time to live for results of query_file.
+    get(key: str, ttl: timedelta):
+        Returns the cached result or None.
+    put(key: str, dataframe: pd.DataFrame):
+        Stores a result and evicts the least recently used results if needed.
+    clear():
+        Removes all cached results.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIRECTORY, max_size_bytes: int = DEFAULT_MAX_SIZE_BYTES,
+                 default_ttl: timedelta = DEFAULT_TTL, ttl_per_query_file: dict = None,
+                 force_refresh: bool = False) -> None:
+        self.directory = directory
+        self.max_size_bytes = max_size_bytes
+        self.default_ttl = default_ttl
+        self.ttl_per_query_file = dict(QUERY_FILE_TTLS if ttl_per_query_file is None else ttl_per_query_file)
+        self.force_refresh = force_refresh
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def create_key(connection_url, query: str, params=None) -> str:
+        """
+        Returns the cache key of a query, the sha256 of the connection, query text and parameters.
+        """
+        key_content = json.dumps([str(connection_url), query, params], sort_keys=True, default=str)
+        return hashlib.sha256(key_content.encode("utf-8")).hexdigest()
+
+    def get_ttl(self, query_file: str = None) -> timedelta:
+        """
+        Returns the time to live for results of query_file, or the default_ttl if it has none.
+        """
+        if query_file is None:
+            return self.default_ttl
+        return self.ttl_per_query_file.get(os.path.basename(query_file), self.default_ttl)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.parquet")
+
+    def get(self, key: str, ttl: timedelta = None):
+        """
+        Returns the cached result of key, or None if it is missing, expired or force_refresh is set.
+
+        Parameters
+        ----------
+        key : str
+            The cache key as created by create_key.
+        ttl : timedelta, optional
+            The time to live of the result. Default is the default_ttl.
+        """
+        path = self._path(key)
+        if self.force_refresh:
+            return None
+
+        ttl = self.default_ttl if ttl is None else ttl
+        # the result can be evicted by another process at any moment, which counts as a miss
+        try:
+            written_at = os.path.getmtime(path)
+            if time.time() - written_at > ttl.total_seconds():
+                return None
+
+            dataframe = pd.read_parquet(path)
+            # the access time tracks the least recent use, the modification time the moment of writing
+            os.utime(path, (time.time(), written_at))
+        except FileNotFoundError:
+            return None
+        return dataframe
+
+    def put(self, key: str, dataframe: pd.DataFrame) -> None:
+        """
+        Stores the result of key and evicts the least recently used results when over max_size_bytes.
+        Results that cannot be stored as Parquet are not cached.
+        """
+        # written to a temporary file first, so readers in other threads or processes never see a partial result
+        temporary_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            dataframe.to_parquet(temporary_path)
+            os.replace(temporary_path, self._path(key))
+        except Exception:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            logging.warning(f"Query result {key} could not be cached", exc_info=True)
+            return
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Removes the least recently used results until the cache is within max_size_bytes.
+        """
+        # other processes can evict the same results concurrently, results that are already gone are skipped
+        entries = []
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith(".parquet"):
+                continue
+            path = os.path.join(self.directory, file_name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+        entries.sort()
+        total_size = sum(size for _, size, _ in entries)
+
+        for _, size, path in entries:
+            if total_size <= self.max_size_bytes:
+                break
+            try:
+                os.remove(path)
+                logging.info(f"Evicted query result {os.path.basename(path)} from the cache")
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def clear(self) -> None:
+        """
+        Removes all cached results.
+        """
+        for file_name in os.listdir(self.directory):
+            if file_name.endswith(".parquet"):
+                try:
+                    os.remove(os.path.join(self.directory, file_name))
+                except FileNotFoundError:
+                    pass
+
+
+_QUERY_CACHE = None
+
+
+def enable_query_cache(**cache_settings) -> QueryCache:
+    '''Function that enables the query cache for every query routed through the AzureSqlCommunicator.
+    cache_settings are passed on to QueryCache.'''
+    global _QUERY_CACHE
+    _QUERY_CACHE = QueryCache(**cache_settings)
+    return _QUERY_CACHE
+
+
+def disable_query_cache() -> None:
+    '''Function that disables the query cache, the cached files are kept on disk'''
+    global _QUERY_CACHE
+    _QUERY_CACHE = None
+
+
+def get_query_cache():
+    '''Function that returns the enabled QueryCache, or None when caching is disabled'''
+    return _QUERY_CACHE
@@ -0,0 +1,153 @@
+"""Module for the metrics every query and write of the AzureSqlCommunicator emits, and the sinks they are sent to"""
+
+import os
+import json
+import time
+import logging
+import threading
+from dataclasses import dataclass, field, asdict
+import pandas as pd
+
+# frames with more rows are measured on a sample, deep memory usage of object columns is expensive
+_BYTES_SAMPLE_SIZE = 10_000
+
+
+def approximate_dataframe_bytes(dataframe: pd.DataFrame) -> int:
+    '''Function that returns the approximate in memory size of dataframe, extrapolated from a sample for large frames'''
+    if len(dataframe) <= _BYTES_SAMPLE_SIZE:
+        return int(dataframe.memory_usage(index=True, deep=True).sum())
+    sample_bytes = dataframe.sample(_BYTES_SAMPLE_SIZE, random_state=0).memory_usage(index=False, deep=True).sum()
+    return int(sample_bytes / _BYTES_SAMPLE_SIZE * len(dataframe))
+
+
+@dataclass
+class QueryMetrics:
+    """
+    A dataclass that holds the metrics of one query or write.
+
+    Attributes
+    ----------
+    query_file : str
+        The .sql file the query was read from, "<inline>", or "<write schema.table>" for a write.
+    backend : str
+        The name of the sql backend that served the query.
+    cache : str
+        "hit", "miss", or "disabled" when the query cache is not enabled.
+    connect_seconds : float
+        The time to get a connection from the pool.
+    execute_seconds : float
+        The time until the database returned the first results, or the time of the whole write.
+    fetch_seconds : float
+        The time to fetch the results into a DataFrame.
+    rows : int
+        The number of rows returned, or written.
+    bytes : int
+        The approximate in memory size of the returned, or written, DataFrame.
+    timestamp : float
+        The unix time at which the query was started.
+    """
+    query_file: str
+    backend: str = ""
+    cache: str = "disabled"
+    connect_seconds: float = 0.0
+    execute_seconds: float = 0.0
+    fetch_seconds: float = 0.0
+    rows: int = 0
+    bytes: int = 0
+    timestamp: float = field(default_factory=time.time)
+
+    @property
+    def total_seconds(self) -> float:
+        return self.connect_seconds + self.execute_seconds + self.fetch_seconds
+
+    def add_result(self, dataframe: pd.DataFrame) -> None:
+        """Adds the rows and bytes of a (chunk of the) result"""
+        self.rows += len(dataframe)
+        self.bytes += approximate_dataframe_bytes(dataframe)
+
+
+class LogMetricsSink:
+    """A sink that writes every QueryMetrics to the log."""
+
+    def emit(self, query_metrics: QueryMetrics) -> None:
+        logging.info(f"Query {query_metrics.query_file}: {query_metrics.rows} rows, {query_metrics.bytes} bytes, "
+                     f"connect {query_metrics.connect_seconds:.3f}s, execute {query_metrics.execute_seconds:.3f}s, "
+                     f"fetch {query_metrics.fetch_seconds:.3f}s, cache {query_metrics.cache}")
+
+
+class JsonLinesMetricsSink:
+    """A sink that appends every QueryMetrics as one json line to path."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, query_metrics: QueryMetrics) -> None:
+        with self._lock, open(self.path, "a") as file:
+            file.write(json.dumps(asdict(query_metrics)) + "\n")
+
+
+class PrometheusTextMetricsSink:
+    """A sink that keeps totals per query file and rewrites them in the Prometheus text format to path."""
+
+    _COUNTERS = {
+        "sql_query_total": "Number of queries executed",
+        "sql_query_cache_hits_total": "Number of queries served from the query cache",
+        "sql_query_connect_seconds_total": "Time spent getting a connection",
+        "sql_query_execute_seconds_total": "Time spent executing queries",
+        "sql_query_fetch_seconds_total": "Time spent fetching results",
+        "sql_query_rows_total": "Rows returned or written",
+        "sql_query_bytes_total": "Approximate bytes returned or written",
+    }
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def emit(self, query_metrics: QueryMetrics) -> None:
+        with self._lock:
+            totals = self.totals.setdefault(query_metrics.query_file, dict.fromkeys(self._COUNTERS, 0))
+            totals["sql_query_total"] += 1
+            totals["sql_query_cache_hits_total"] += query_metrics.cache == "hit"
+            totals["sql_query_connect_seconds_total"] += query_metrics.connect_seconds
+            totals["sql_query_execute_seconds_total"] += query_metrics.execute_seconds
+            totals["sql_query_fetch_seconds_total"] += query_metrics.fetch_seconds
+            totals["sql_query_rows_total"] += query_metrics.rows
+            totals["sql_query_bytes_total"] += query_metrics.bytes
+            self._write()
+
+    def _write(self) -> None:
+        lines = []
+        for counter, description in self._COUNTERS.items():
+            lines.append(f"# HELP {counter} {description}")
+            lines.append(f"# TYPE {counter} counter")
+            for query_file, totals in sorted(self.totals.items()):
+                lines.append(f'{counter}{{query_file="{query_file}"}} {totals[counter]}')
+
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w") as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(temporary_path, self.path)
+
+
+_METRICS_SINKS = [LogMetricsSink()]
+
+
+def set_metrics_sinks(sinks: list) -> None:
+    '''Function that replaces the sinks every QueryMetrics is emitted to'''
+    _METRICS_SINKS[:] = sinks
+
+
+def add_metrics_sink(sink) -> None:
+    '''Function that adds a sink (any object with an emit(query_metrics) method)'''
+    _METRICS_SINKS.append(sink)
+
+
+def emit_query_metrics(query_metrics: QueryMetrics) -> None:
+    '''Function that sends query_metrics to every sink, a failing sink never fails the query'''
+    for sink in _METRICS_SINKS:
+        try:
+            sink.emit(query_metrics)
+        except Exception:
+            logging.warning(f"Metrics sink {type(sink).__name__} failed", exc_info=True)
@@ -0,0 +1,262 @@
+"""Module with the pluggable backends that execute the queries of the AzureSqlCommunicator.
+
+The backend is selected with set_sql_backend, or with the SQL_BACKEND environment variable:
+    live   : run every query against the given connection url (default)
+    record : run against the given connection url and capture every query result to Parquet
+    replay : serve the recorded Parquet results, writes go to a local SQLite file
+    local  : run every query and write against a local database (SQLite, or DuckDB through duckdb_engine)
+            with the same schemas, set with SQL_BACKEND_DATABASE_URL
+
+SQLite has no schemas, so every SQLite engine attaches a database file per schema of SQLITE_SCHEMAS,
+next to its main database file, and tables such as datascience.VoorspellingLocatieProduct can be written as on Azure SQL.
+"""
+
+import os
+import json
+import glob
+import time
+import hashlib
+import logging
+import pandas as pd
+from sqlalchemy import event
+from azure_connectors.query_metrics import QueryMetrics
+
+DEFAULT_RECORDING_DIRECTORY = "sql_recordings"
+DEFAULT_LOCAL_DATABASE_URL = "sqlite:///local_database.db"
+
+# the schemas of the Azure SQL database that the pipeline reads from and writes to
+SQLITE_SCHEMAS = ("API", "datascience", "dbo")
+
+
+def create_recording_key(query: str, params=None) -> str:
+    '''Function that returns the key of a recorded query result, independent of the database it ran against'''
+    key_content = json.dumps([query, params], sort_keys=True, default=str)
+    return hashlib.sha256(key_content.encode("utf-8")).hexdigest()
+
+
+def attach_sqlite_schemas(engine, schemas: tuple = SQLITE_SCHEMAS) -> None:
+    '''Function that attaches a database per schema to every connection of a SQLite engine.
+    The database of a schema is <main database>.<schema>.db, or in memory for an in memory main database.'''
+    database = engine.url.database
+    in_memory = not database or database == ":memory:"
+
+    @event.listens_for(engine, "connect")
+    def attach_schemas(dbapi_connection, connection_record):
+        for schema in schemas:
+            schema_database = ":memory:" if in_memory else f"{os.path.splitext(database)[0]}.{schema}.db"
+            dbapi_connection.execute(f"ATTACH DATABASE '{schema_database}' AS \"{schema}\"")
+
+
+def apply_read_types(dataframe: pd.DataFrame, dtype: dict = None, parse_dates: list = None) -> pd.DataFrame:
+    '''Function that applies dtype and parse_dates to a query result as pd.read_sql does'''
+    if dtype:
+        dataframe = dataframe.astype(dtype)
+    for column in parse_dates or []:
+        if column in dataframe.columns:
+            dataframe = dataframe.assign(**{column: pd.to_datetime(dataframe[column])})
+    return dataframe
+
+
+class SqlBackend:
+    """
+    A class used to run queries against the database of the connection url, the live backend.
+
+    Attributes
+    ----------
+    is_offline : bool
+        True if the backend does not need a connection to Azure SQL.
+
+    Methods
+    -------
+    resolve_connection_url(connection_url):
+        Returns the connection url queries and writes should actually go to.
+    read_dataframe(connection_url, query: str, params, query_metrics: QueryMetrics):
+        Returns the query results in a DataFrame.
+    read_dataframe_chunks(connection_url, query: str, chunk_size: int, dtype: dict, parse_dates: list,
+                          query_metrics: QueryMetrics, params):
+        Yields the query results in DataFrame chunks.
+
+    The read methods record their connect, execute and fetch times in query_metrics when it is given.
+    """
+    is_offline = False
+
+    def resolve_connection_url(self, connection_url):
+        return connection_url
+
+    def read_dataframe(self, connection_url, query: str, params=None,
+                       query_metrics: QueryMetrics = None) -> pd.DataFrame:
+        # imported here as the AzureSqlCommunicator imports this module
+        from azure_connectors.AzureSqlCommunicator import get_engine
+        query_metrics = query_metrics or QueryMetrics(query_file="<inline>")
+
+        started = time.perf_counter()
+        with get_engine(connection_url).connect() as connection:
+            connected = time.perf_counter()
+            # same execution path as pd.read_sql for a string query, split up to time each step
+            result = connection.exec_driver_sql(query, params) if params else connection.exec_driver_sql(query)
+            executed = time.perf_counter()
+            dataframe = pd.DataFrame.from_records(result.fetchall(), columns=list(result.keys()), coerce_float=True)
+            fetched = time.perf_counter()
+
+        query_metrics.connect_seconds += connected - started
+        query_metrics.execute_seconds += executed - connected
+        query_metrics.fetch_seconds += fetched - executed
+        return dataframe
+
+    def read_dataframe_chunks(self, connection_url, query: str, chunk_size: int, dtype: dict = None,
+                              parse_dates: list = None, query_metrics: QueryMetrics = None, params=None):
+        from azure_connectors.AzureSqlCommunicator import get_engine
+        query_metrics = query_metrics or QueryMetrics(query_file="<inline>")
+
+        started = time.perf_counter()
+        engine = get_engine(connection_url)
+        with engine.connect().execution_options(stream_results=True, max_row_buffer=chunk_size) as connection:
+            query_metrics.connect_seconds += time.perf_counter() - started
+            chunk_started = time.perf_counter()
+            for chunk_number, df_chunk in enumerate(pd.read_sql(sql= query, con= connection, chunksize= chunk_size,
+                                                                dtype= dtype, parse_dates= parse_dates,
+                                                                params= params)):
+                # the wait for the first chunk is the execution, the wait for later chunks is fetching
+                if chunk_number == 0:
+                    query_metrics.execute_seconds += time.perf_counter() - chunk_started
+                else:
+                    query_metrics.fetch_seconds += time.perf_counter() - chunk_started
+                yield df_chunk
+                chunk_started = time.perf_counter()
+
+
+class LocalDatabaseSqlBackend(SqlBackend):
+    """
+    A class used to run all queries and writes against a local database with the same schemas.
+
+    Attributes
+    ----------
+    database_url : str
+        The SQLAlchemy url of the local database, e.g. sqlite:///local_database.db.
+    """
+    is_offline = True
+
+    def __init__(self, database_url: str = DEFAULT_LOCAL_DATABASE_URL) -> None:
+        self.database_url = database_url
+
+    def resolve_connection_url(self, connection_url):
+        return self.database_url
+
+
+class RecordingSqlBackend(SqlBackend):
+    """
+    A class used to run queries live and capture every result to Parquet, so it can be replayed.
+
+    Attributes
+    ----------
+    directory : str
+        The directory in which the recorded results are stored.
+    """
+
+    def __init__(self, directory: str = DEFAULT_RECORDING_DIRECTORY) -> None:
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def read_dataframe(self, connection_url, query: str, params=None,
+                       query_metrics: QueryMetrics = None) -> pd.DataFrame:
+        dataframe = super().read_dataframe(connection_url, query, params, query_metrics)
+        dataframe.to_parquet(os.path.join(self.directory, f"{create_recording_key(query, params)}.parquet"))
+        return dataframe
+
+    def read_dataframe_chunks(self, connection_url, query: str, chunk_size: int, dtype: dict = None,
+                              parse_dates: list = None, query_metrics: QueryMetrics = None, params=None):
+        chunk_directory = os.path.join(self.directory, create_recording_key(query, params))
+        os.makedirs(chunk_directory, exist_ok=True)
+        for path in glob.glob(os.path.join(chunk_directory, "part-*.parquet")):
+            os.remove(path)
+
+        for chunk_number, df_chunk in enumerate(super().read_dataframe_chunks(
+                connection_url, query, chunk_size, dtype, parse_dates, query_metrics, params)):
+            df_chunk.to_parquet(os.path.join(chunk_directory, f"part-{chunk_number:05d}.parquet"))
+            yield df_chunk
+
+
+class ReplaySqlBackend(SqlBackend):
+    """
+    A class used to serve recorded query results without a database connection.
+
+    Attributes
+    ----------
+    directory : str
+        The directory in which the results were recorded by the RecordingSqlBackend.
+    write_database_url : str
+        The SQLAlchemy url of the local database that receives the writes of the pipeline.
+    """
+    is_offline = True
+
+    def __init__(self, directory: str = DEFAULT_RECORDING_DIRECTORY,
+                 write_database_url: str = None) -> None:
+        self.directory = directory
+        self.write_database_url = write_database_url or f"sqlite:///{os.path.join(directory, 'replay_writes.db')}"
+
+    def resolve_connection_url(self, connection_url):
+        return self.write_database_url
+
+    def read_dataframe(self, connection_url, query: str, params=None,
+                       query_metrics: QueryMetrics = None) -> pd.DataFrame:
+        path = os.path.join(self.directory, f"{create_recording_key(query, params)}.parquet")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No recorded result for query in {self.directory}, record it first")
+
+        started = time.perf_counter()
+        dataframe = pd.read_parquet(path)
+        if query_metrics is not None:
+            query_metrics.fetch_seconds += time.perf_counter() - started
+        return dataframe
+
+    def read_dataframe_chunks(self, connection_url, query: str, chunk_size: int, dtype: dict = None,
+                              parse_dates: list = None, query_metrics: QueryMetrics = None, params=None):
+        chunk_paths = sorted(glob.glob(os.path.join(self.directory, create_recording_key(query, params),
+                                                    "part-*.parquet")))
+        if chunk_paths:
+            for path in chunk_paths:
+                started = time.perf_counter()
+                df_chunk = pd.read_parquet(path)
+                if query_metrics is not None:
+                    query_metrics.fetch_seconds += time.perf_counter() - started
+                yield df_chunk
+            return
+
+        # the query was recorded in one go, serve it in chunks typed as the live chunks
+        dataframe = self.read_dataframe(connection_url, query, params, query_metrics)
+        for start in range(0, len(dataframe), chunk_size):
+            yield apply_read_types(dataframe.iloc[start:start + chunk_size], dtype, parse_dates)
+
+
+_SQL_BACKEND = None
+
+
+def create_sql_backend_from_environment() -> SqlBackend:
+    '''Function that creates the backend named in the SQL_BACKEND environment variable (default live)'''
+    mode = os.environ.get("SQL_BACKEND", "live").lower()
+    directory = os.environ.get("SQL_BACKEND_DIRECTORY", DEFAULT_RECORDING_DIRECTORY)
+
+    if mode == "live":
+        return SqlBackend()
+    if mode == "record":
+        return RecordingSqlBackend(directory)
+    if mode == "replay":
+        return ReplaySqlBackend(directory, os.environ.get("SQL_BACKEND_DATABASE_URL"))
+    if mode == "local":
+        return LocalDatabaseSqlBackend(os.environ.get("SQL_BACKEND_DATABASE_URL", DEFAULT_LOCAL_DATABASE_URL))
+    raise ValueError(f"SQL backend {mode} not supported")
+
+
+def set_sql_backend(sql_backend: SqlBackend) -> None:
+    '''Function that sets the backend used by every query of the AzureSqlCommunicator'''
+    global _SQL_BACKEND
+    _SQL_BACKEND = sql_backend
+    logging.info(f"SQL backend is set to {type(sql_backend).__name__}")
+
+
+def get_sql_backend() -> SqlBackend:
+    '''Function that returns the active backend, created from the environment on first use'''
+    global _SQL_BACKEND
+    if _SQL_BACKEND is None:
+        _SQL_BACKEND = create_sql_backend_from_environment()
+    return _SQL_BACKEND
@@ -1,31 +1,175 @@
+import warnings
+from dataclasses import dataclass, field
+import numpy as np
 import pandas as pd
-    
+
 def integer_guard(dataframe : pd.Series):
-    assert pd.api.types.is_integer_dtype(dataframe), f"{dataframe.columns} is not of integer type"
+    assert pd.api.types.is_integer_dtype(dataframe), f"{dataframe.name} is not of integer type"
+
+def string_guard(dataframe : pd.Series):
+    assert pd.api.types.is_string_dtype(dataframe ), f"{dataframe.name} is not of string type"
 
-def string_guard(dataframe : pd.Series): 
-    assert pd.api.types.is_string_dtype(dataframe ), f"{dataframe.columns} is not of string type"
-                
 def datetime_guard(dataframe : pd.Series):
-    assert pd.api.types.is_datetime64_any_dtype(dataframe) , f"{dataframe.columns} is not of datetime64 type"
-    
+    assert pd.api.types.is_datetime64_any_dtype(dataframe) , f"{dataframe.name} is not of datetime64 type"
+
 def object_guard(dataframe : pd.Series):
-    assert pd.api.types.is_object_dtype(dataframe), f"{dataframe.columns} is not of object type"
+    assert pd.api.types.is_object_dtype(dataframe), f"{dataframe.name} is not of object type"
 
 def float_guard(dataframe : pd.Series):
-    assert pd.api.types.is_float_dtype(dataframe), f"{dataframe.columns} is not of float64 type"
-
-# def integer_guard_bool(dataframe : pd.Series):
-#     return pd.api.types.is_integer_dtype(dataframe)
-
-# def string_guard_bool(dataframe : pd.Series): 
-#     return dataframe != "Test"
-                
-# def datetime_guard_bool(dataframe : pd.Series):
-#     return pd.api.types.is_datetime64_any_dtype(dataframe) 
-    
-# def object_guard_bool(dataframe : pd.Series):
-#     return pd.api.types.is_object_dtype(dataframe)
-
-# def float_guard_bool(dataframe : pd.Series):
-#     return pd.api.types.is_any_real_numeric_dtype(dataframe)
+    assert pd.api.types.is_float_dtype(dataframe), f"{dataframe.name} is not of float64 type"
+
+def integer_guard_bool(dataframe : pd.Series):
+    """integer dtype, or a float dtype that only holds whole numbers (an integer column with NULLs)"""
+    if pd.api.types.is_integer_dtype(dataframe):
+        return True
+    if not pd.api.types.is_float_dtype(dataframe):
+        return False
+    values = dataframe.to_numpy(dtype="float64", na_value=np.nan)
+    return bool(np.all(np.isnan(values) | (np.mod(values, 1) == 0)))
+
+def string_like_guard_bool(dataframe : pd.Series):
+    """object, string or categorical dtype, the dtypes a text column can have in the standard format"""
+    return (pd.api.types.is_object_dtype(dataframe) or pd.api.types.is_string_dtype(dataframe)
+            or isinstance(dataframe.dtype, pd.CategoricalDtype))
+
+def datetime_guard_bool(dataframe : pd.Series):
+    return pd.api.types.is_datetime64_any_dtype(dataframe)
+
+def object_guard_bool(dataframe : pd.Series):
+    return pd.api.types.is_object_dtype(dataframe)
+
+def float_guard_bool(dataframe : pd.Series):
+    return pd.api.types.is_float_dtype(dataframe)
+
+DTYPE_GUARDS = {
+    "integer": integer_guard_bool,
+    "string_like": string_like_guard_bool,
+    "datetime": datetime_guard_bool,
+    "object": object_guard_bool,
+    "float": float_guard_bool,
+}
+
+
+@dataclass
+class ColumnRule:
+    """
+    A dataclass that holds the expectations for one column.
+
+    Attributes
+    ----------
+    column : str
+        The name of the column.
+    dtype : str
+        The expected kind of dtype, a key of DTYPE_GUARDS.
+    max_null_rate : float
+        The maximum fraction of missing values. Default is None, which does not check missing values.
+    min_value, max_value : float
+        The inclusive range of the non missing values. Default is None, which does not check that bound.
+    strict : bool
+        If True, null rate and range violations are errors and the null rate is checked on every row,
+        as for key columns that cleaning and encoding rely on. Default is False, which makes them warnings.
+    """
+    column: str
+    dtype: str
+    max_null_rate: float = None
+    min_value: float = None
+    max_value: float = None
+    strict: bool = False
+
+
+@dataclass
+class ValidationReport:
+    """
+    A dataclass that collects every violation found by validate_dataframe.
+
+    Errors (missing columns, column order, dtypes, null rates and value ranges of strict rules) make the
+    data unusable, warnings (null rates, value ranges) point at suspicious data.
+
+    Methods
+    -------
+    is_valid():
+        Returns True if there are no errors.
+    raise_for_errors():
+        Raises a ValueError listing every error, and warns for every warning.
+    """
+    errors: list = field(default_factory=list)
+    warnings: list = field(default_factory=list)
+    sampled_rows: int = None
+
+    def is_valid(self) -> bool:
+        return not self.errors
+
+    def raise_for_errors(self) -> None:
+        for message in self.warnings:
+            warnings.warn(message)
+        if self.errors:
+            raise ValueError("Data does not match the expected format:\n" + "\n".join(self.errors))
+
+    def __str__(self) -> str:
+        lines = [f"error: {message}" for message in self.errors] + [f"warning: {message}" for message in self.warnings]
+        return "\n".join(lines) if lines else "no violations"
+
+
+def validate_dataframe(dataframe : pd.DataFrame, rules : list, required_columns : list = None,
+                       sample_size : int = None) -> ValidationReport:
+    """
+    Validates dataframe against the column rules in one pass, without copying it.
+
+    Every violation is collected in the returned report instead of stopping at the first one.
+
+    Parameters
+    ----------
+    dataframe : pd.DataFrame
+        The data to validate.
+    rules : list
+        The ColumnRule per column.
+    required_columns : list, optional
+        The exact columns, in order, the dataframe should have.
+    sample_size : int, optional
+        If given and the dataframe is larger, the null rates and value ranges are checked on a
+        random sample of this many rows. Presence, order, dtypes and strict rules are always checked in full.
+    """
+    report = ValidationReport()
+
+    if required_columns is not None:
+        missing_columns = [column for column in required_columns if column not in dataframe.columns]
+        unexpected_columns = [column for column in dataframe.columns if column not in required_columns]
+        if missing_columns:
+            report.errors.append(f"{missing_columns} are not in the DataFrame")
+        if unexpected_columns:
+            report.errors.append(f"{unexpected_columns} are not expected in the DataFrame")
+        if not missing_columns and not unexpected_columns and list(dataframe.columns) != list(required_columns):
+            report.errors.append(f"columns are not in the required order {list(required_columns)}")
+
+    df_checked = dataframe
+    if sample_size is not None and len(dataframe) > sample_size:
+        row_positions = np.sort(np.random.default_rng(0).choice(len(dataframe), sample_size, replace=False))
+        df_checked = dataframe.iloc[row_positions]
+        report.sampled_rows = sample_size
+
+    for rule in rules:
+        if rule.column not in dataframe.columns:
+            if required_columns is None:
+                report.errors.append(f"{rule.column} is not in the DataFrame")
+            continue
+
+        if not DTYPE_GUARDS[rule.dtype](dataframe[rule.column]):
+            report.errors.append(f"{rule.column} is of {dataframe[rule.column].dtype}, expected {rule.dtype}")
+            continue
+
+        violations = report.errors if rule.strict else report.warnings
+        # a sample can miss the few missing keys of a strict rule, so those are checked on every row
+        series = dataframe[rule.column] if rule.strict else df_checked[rule.column]
+        if rule.max_null_rate is not None and len(series):
+            null_count = int(series.isna().sum())
+            null_rate = null_count / len(series)
+            if null_rate > rule.max_null_rate:
+                violations.append(f"{rule.column} has {null_count} ({null_rate:.2%}) missing values, "
+                                  f"at most {rule.max_null_rate:.2%} allowed")
+
+        if rule.min_value is not None and (series < rule.min_value).any():
+            violations.append(f"{rule.column} has values below {rule.min_value}, minimum {series.min()}")
+        if rule.max_value is not None and (series > rule.max_value).any():
+            violations.append(f"{rule.column} has values above {rule.max_value}, maximum {series.max()}")
+
+    return report
@@ -1,11 +1,22 @@
-from matplotlib.pylab import f
+import warnings
+import logging
+import threading
+from types import MappingProxyType
 import pandas as pd
 from azure_connectors.AzureSqlCommunicator import (
     execute_query_and_load_results_into_dataframe,
+    execute_queries_concurrently,
     connect_azure,
     get_query_from_file
 )
 
+# .sql file per auxiliary dataset, the datasets do not depend on each other and can be loaded concurrently
+AUXILIARY_QUERY_FILES = {
+    "machine_information": "sql/machine_data.sql",
+    "location_stock": "sql/stock_per_location.sql",
+    "average_daily_sales": "sql/average_daily_sales.sql",
+}
+
 class AuxDataLoader:
     """
     A class used to load auxiliary data from Azure SQL database.
@@ -16,8 +27,9 @@ class AuxDataLoader:
 
     Attributes
     ----------
-    connection : pyodbc.Connection
-        a pyodbc connection object to Azure SQL database
+    connection : sqlalchemy.engine.URL
+        the connection url of the Azure SQL database, its pooled engine is shared
+        process wide through azure_connectors.AzureSqlCommunicator.get_engine
 
     Methods
     -------
@@ -25,6 +37,12 @@ class AuxDataLoader:
         Returns a DataFrame with all machine information.
     load_location_stock():
         Returns the stock per location in a DataFrame.
+    load_gross_product_profit_lookup():
+        Returns the profit per product in a dictionary.
+    load_average_daily_sales():
+        Returns the average sales per day per location and product in a DataFrame.
+    load_concurrently(dataset_names: list):
+        Returns several auxiliary datasets at once, queried concurrently.
     """
 
     def __init__(self) -> None:
@@ -62,10 +80,9 @@ class AuxDataLoader:
             If query execution fails.
         """
         try:
-            query = get_query_from_file("sql/machine_data.sql")
+            query = get_query_from_file(AUXILIARY_QUERY_FILES["machine_information"])
             df_machines = execute_query_and_load_results_into_dataframe(self.connection, query)
-            df_machines.set_index("MachineId", inplace=True)
-            return df_machines
+            return AuxDataLoader._process_machine_information(df_machines)
         except Exception as e:
             raise Exception("Failed to execute query and load machine information.") from e
 
@@ -86,10 +103,9 @@ class AuxDataLoader:
             If query execution fails.
         """
         try:
-            query = get_query_from_file("sql/stock_per_location.sql")
+            query = get_query_from_file(AUXILIARY_QUERY_FILES["location_stock"])
             df_location_stock = execute_query_and_load_results_into_dataframe(self.connection, query)
-            df_location_stock.set_index(['Location', 'ProductId'], inplace=True)
-            return df_location_stock
+            return AuxDataLoader._process_location_stock(df_location_stock)
         except Exception as e:
             raise Exception("Failed to execute query and load location stock information.") from e
         
@@ -110,14 +126,92 @@ class AuxDataLoader:
             If query execution fails.
         """
         try:
-            query = get_query_from_file("sql/stock_per_location.sql")
+            query = get_query_from_file(AUXILIARY_QUERY_FILES["location_stock"])
             df_location_stock = execute_query_and_load_results_into_dataframe(self.connection, query)
-            df_location_stock.set_index("ProductId", inplace=True)
-            gross_profit_lookup_dict = dict(df_location_stock.to_dict()["GrossProfit"])
-            gross_profit_lookup_dict = AuxDataLoader.test_gross_profit_lookup_dict(gross_profit_lookup_dict)
-            return gross_profit_lookup_dict
+            return AuxDataLoader.gross_profit_lookup_from_location_stock(df_location_stock)
         except Exception as e:
             raise Exception("Failed to execute query and load product profit information.") from e
+
+    def load_average_daily_sales(self) -> pd.DataFrame:
+        """
+        Returns the average sales per day per location and product in a DataFrame.
+
+        ...
+
+        Returns
+        -------
+        df_average_sales_per_day : pd.DataFrame
+            a DataFrame with Location and ProductId as multi-index and the average sales as column.
+
+        Raises
+        ------
+        Exception
+            If query execution fails.
+        """
+        try:
+            query = get_query_from_file(AUXILIARY_QUERY_FILES["average_daily_sales"])
+            df_average_sales_per_day = execute_query_and_load_results_into_dataframe(self.connection, query)
+            return AuxDataLoader._process_average_daily_sales(df_average_sales_per_day)
+        except Exception as e:
+            raise Exception("Failed to execute query and load average daily sales.") from e
+
+    def load_concurrently(self, dataset_names: list) -> dict:
+        """
+        Returns several auxiliary datasets at once, the queries run concurrently.
+
+        ...
+
+        Parameters
+        ----------
+        dataset_names : list
+            names of the datasets to load, keys of AUXILIARY_QUERY_FILES.
+
+        Returns
+        -------
+        datasets : dict
+            the dataset name mapped to the DataFrame, processed as by its load_* method.
+
+        Raises
+        ------
+        Exception
+            If query execution fails.
+        """
+        processors = {
+            "machine_information": AuxDataLoader._process_machine_information,
+            "location_stock": AuxDataLoader._process_location_stock,
+            "average_daily_sales": AuxDataLoader._process_average_daily_sales,
+        }
+        try:
+            named_queries = {name: get_query_from_file(AUXILIARY_QUERY_FILES[name]) for name in dataset_names}
+            results = execute_queries_concurrently(self.connection, named_queries)
+            return {name: processors[name](df_result) for name, df_result in results.items()}
+        except Exception as e:
+            raise Exception(f"Failed to execute queries and load {dataset_names}.") from e
+
+    @staticmethod
+    def _process_machine_information(df_machines: pd.DataFrame) -> pd.DataFrame:
+        df_machines.set_index("MachineId", inplace=True)
+        return df_machines
+
+    @staticmethod
+    def _process_location_stock(df_location_stock: pd.DataFrame) -> pd.DataFrame:
+        df_location_stock.set_index(['Location', 'ProductId'], inplace=True)
+        return df_location_stock
+
+    @staticmethod
+    def _process_average_daily_sales(df_average_sales_per_day: pd.DataFrame) -> pd.DataFrame:
+        df_average_sales_per_day.dropna(inplace=True, axis=0)
+        df_average_sales_per_day['ProductId'] = df_average_sales_per_day['ProductId'].astype('int64')
+        df_average_sales_per_day.set_index(['Location','ProductId'], inplace=True)
+        return df_average_sales_per_day
+
+    @staticmethod
+    def gross_profit_lookup_from_location_stock(df_location_stock: pd.DataFrame) -> dict:
+        """
+        Returns the profit per product in a dictionary, derived from the stock per location.
+        """
+        gross_profit_lookup_dict = dict(df_location_stock.reset_index().set_index("ProductId").to_dict()["GrossProfit"])
+        return AuxDataLoader.test_gross_profit_lookup_dict(gross_profit_lookup_dict)
         
     @staticmethod
     def test_gross_profit_lookup_dict(gross_profit_lookup_dict):
@@ -128,4 +222,120 @@ class AuxDataLoader:
             elif value < 0:
                 warnings.warn(f"Product {key} has {value} GrossProfit which is negative. Setting it to 0.")
                 gross_profit_lookup_dict[key] = 0.0
-        return gross_profit_lookup_dict
\ No newline at end of file
+        return gross_profit_lookup_dict
+
+
+class AuxDataSession:
+    """
+    A class used to share auxiliary data between all stages of one deploy.
+
+    Every auxiliary dataset is loaded at most once per session and then memoized. The session
+    has the same load methods as the AuxDataLoader, so it can be injected in every stage that
+    would otherwise create its own AuxDataLoader.
+    DataFrames are handed out as shallow copies: a stage can add, drop or rename columns and reset or set
+    the index, also in place, without affecting the memoized data or the other stages, and no data is copied.
+    A stage that changes values in place copies the frame first. The gross profit lookup is handed out
+    as a read-only mapping.
+    ...
+
+    Attributes
+    ----------
+    aux_data_loader : AuxDataLoader
+        the loader used for datasets that are not memoized yet, created on first use.
+    connection : sqlalchemy.engine.URL
+        the connection url of the aux_data_loader.
+
+    Methods
+    -------
+    load_machine_information():
+        Returns the memoized machine information.
+    load_location_stock():
+        Returns the memoized stock per location.
+    load_gross_product_profit_lookup():
+        Returns the profit per product, derived from the memoized stock per location.
+    load_average_daily_sales():
+        Returns the memoized average sales per day.
+    load_concurrently(dataset_names: list):
+        Returns several datasets at once, the datasets that are not memoized are queried concurrently.
+    invalidate(dataset_name: str):
+        Forgets a memoized dataset, or all datasets if dataset_name is None.
+    """
+
+    def __init__(self, aux_data_loader: AuxDataLoader = None) -> None:
+        self._aux_data_loader = aux_data_loader
+        self._datasets = {}
+        self._lock = threading.RLock()
+
+    @property
+    def aux_data_loader(self) -> AuxDataLoader:
+        if self._aux_data_loader is None:
+            self._aux_data_loader = AuxDataLoader()
+        return self._aux_data_loader
+
+    @property
+    def connection(self):
+        return self.aux_data_loader.connection
+
+    def _load(self, dataset_name: str, load_function):
+        with self._lock:
+            if dataset_name not in self._datasets:
+                self._datasets[dataset_name] = load_function()
+                logging.info(f"Auxiliary dataset {dataset_name} is loaded into the session")
+            return self._datasets[dataset_name]
+
+    @staticmethod
+    def _view(dataset):
+        if isinstance(dataset, pd.DataFrame):
+            return dataset.copy(deep=False)
+        return dataset
+
+    def load_machine_information(self) -> pd.DataFrame:
+        return self._view(self._load("machine_information", self.aux_data_loader.load_machine_information))
+
+    def load_location_stock(self) -> pd.DataFrame:
+        return self._view(self._load("location_stock", self.aux_data_loader.load_location_stock))
+
+    def load_gross_product_profit_lookup(self) -> MappingProxyType:
+        return self._load("gross_product_profit_lookup", lambda: MappingProxyType(
+            AuxDataLoader.gross_profit_lookup_from_location_stock(self.load_location_stock())))
+
+    def load_average_daily_sales(self) -> pd.DataFrame:
+        return self._view(self._load("average_daily_sales", self.aux_data_loader.load_average_daily_sales))
+
+    def load_concurrently(self, dataset_names: list) -> dict:
+        with self._lock:
+            missing_dataset_names = [name for name in dataset_names if name not in self._datasets]
+            if missing_dataset_names:
+                self._datasets.update(self.aux_data_loader.load_concurrently(missing_dataset_names))
+                logging.info(f"Auxiliary datasets {missing_dataset_names} are loaded into the session")
+            return {name: self._view(self._datasets[name]) for name in dataset_names}
+
+    def __getstate__(self) -> dict:
+        # the lock cannot be sent to another process, the memoized datasets are
+        with self._lock:
+            state = self.__dict__.copy()
+            state["_datasets"] = dict(self._datasets)
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def invalidate(self, dataset_name: str = None) -> None:
+        """
+        Forgets a memoized dataset, so it is loaded again on next use.
+
+        Parameters
+        ----------
+        dataset_name : str, optional
+            The dataset to forget. Default is None, which forgets all datasets.
+        """
+        with self._lock:
+            if dataset_name is None:
+                self._datasets.clear()
+            else:
+                self._datasets.pop(dataset_name, None)
+                # the profit lookup is derived from the stock per location
+                if dataset_name == "location_stock":
+                    self._datasets.pop("gross_product_profit_lookup", None)
@@ -0,0 +1,79 @@
+import logging
+import numpy as np
+import pandas as pd
+
+CALENDAR_FEATURES = ["year", "month", "day", "weekday", "day_of_year", "week_of_year", "is_weekend", "is_holiday",
+                     "weekday_sin", "weekday_cos", "day_of_year_sin", "day_of_year_cos"]
+
+
+class CalendarFeatureTable:
+    """
+    A class used to compute calendar features once per day and join them onto transactions by day.
+
+    The features of every day between start and end are computed once, so adding a feature to the
+    transactions is a lookup by day code instead of a .dt computation over every row.
+
+    Attributes
+    ----------
+    first_day : np.datetime64
+        The first day of the table, in datetime64[D].
+    df_calendar : pd.DataFrame
+        The calendar features, one row per day from first_day onwards.
+
+    Methods
+    -------
+    covers(dates: pd.Series):
+        Returns True if every date is a day of the table.
+    join(df_transactions: pd.DataFrame, feature_columns: list, date_column: str):
+        Returns the feature_columns of the day of every transaction, aligned with its rows.
+    """
+
+    def __init__(self, start, end, holidays: list = None) -> None:
+        """
+        Parameters
+        ----------
+        start, end : datetime
+            The first and last day of the table, e.g. the start of the training data and the end of the prediction horizon.
+        holidays : list, optional
+            The dates of the holidays, flagged in the is_holiday feature. Default is None, no holidays.
+        """
+        days = pd.date_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize(), freq="D")
+        self.first_day = days[0].to_datetime64().astype("datetime64[D]") if len(days) else np.datetime64("1970-01-01", "D")
+
+        days_in_year = np.where(days.is_leap_year, 366, 365)
+        self.df_calendar = pd.DataFrame({
+            "year": days.year,
+            "month": days.month,
+            "day": days.day,
+            "weekday": days.weekday,
+            "day_of_year": days.day_of_year,
+            "week_of_year": days.isocalendar().week.to_numpy(dtype="int32"),
+            "is_weekend": days.weekday >= 5,
+            "is_holiday": days.isin(pd.to_datetime(holidays or []).normalize()),
+            "weekday_sin": np.sin(2 * np.pi * days.weekday / 7),
+            "weekday_cos": np.cos(2 * np.pi * days.weekday / 7),
+            "day_of_year_sin": np.sin(2 * np.pi * (days.day_of_year - 1) / days_in_year),
+            "day_of_year_cos": np.cos(2 * np.pi * (days.day_of_year - 1) / days_in_year),
+        })
+        logging.info(f"Calendar features of {len(days)} days are computed")
+
+    def _day_codes(self, dates: pd.Series) -> np.ndarray:
+        days = dates.to_numpy(dtype="datetime64[ns]").astype("datetime64[D]")
+        day_codes = np.where(np.isnat(days), -1, (days - self.first_day).astype(np.int64))
+        return np.where((day_codes >= 0) & (day_codes < len(self.df_calendar)), day_codes, -1)
+
+    def covers(self, dates: pd.Series) -> bool:
+        return bool((self._day_codes(dates.dropna()) >= 0).all())
+
+    def join(self, df_transactions: pd.DataFrame, feature_columns: list, date_column: str = "SaleDate") -> pd.DataFrame:
+        """
+        Returns the feature_columns of the day of every transaction as a DataFrame aligned with the
+        rows of df_transactions, missing for days outside the table.
+        """
+        unknown_features = [column for column in feature_columns if column not in self.df_calendar.columns]
+        if unknown_features:
+            raise ValueError(f"Calendar features {unknown_features} not supported")
+
+        day_codes = self._day_codes(df_transactions[date_column])
+        return pd.DataFrame({column: pd.api.extensions.take(self.df_calendar[column].to_numpy(), day_codes, allow_fill=True)
+                             for column in feature_columns}, index=df_transactions.index)
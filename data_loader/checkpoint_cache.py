@@ -0,0 +1,299 @@
+"""Module for an opt-in, content addressed cache of the outputs of pipeline stages, stored as Parquet and NumPy files.
+
+The output of a stage is keyed by the hash of the keys of its inputs, the version of its code and its
+parameters. The key of a data source is the fingerprint of its content, so a stage is only recomputed when
+its input data, its code or its parameters changed, and a stage whose key is cached does not even need
+its inputs to be computed.
+
+Inspect and purge the cache from the command line:
+    python -m data_loader.checkpoint_cache list
+    python -m data_loader.checkpoint_cache purge --stage enrich --older-than-days 7
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import inspect
+import hashlib
+import logging
+import argparse
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Callable
+import numpy as np
+import pandas as pd
+
+DEFAULT_CHECKPOINT_DIRECTORY = "pipeline_checkpoints"
+_CHECKPOINT_FILE = "checkpoint.json"
+
+
+def fingerprint_dataframe(dataframe: pd.DataFrame) -> str:
+    '''Function that returns the sha256 of the content of dataframe: its values, index, columns and dtypes'''
+    fingerprint = hashlib.sha256()
+    fingerprint.update(json.dumps([list(map(str, dataframe.columns)), list(map(str, dataframe.dtypes))]).encode("utf-8"))
+    fingerprint.update(pd.util.hash_pandas_object(dataframe, index=True).to_numpy().tobytes())
+    return fingerprint.hexdigest()
+
+
+def code_version(*code_objects) -> str:
+    '''Function that returns the sha256 of the source code of the given functions, classes or modules'''
+    version = hashlib.sha256()
+    for code_object in code_objects:
+        try:
+            source = inspect.getsource(code_object)
+        except (OSError, TypeError):
+            source = repr(code_object)
+        version.update(source.encode("utf-8"))
+    return version.hexdigest()
+
+
+def create_checkpoint_key(stage_name: str, input_keys: list, stage_code_version: str, params: dict) -> str:
+    '''Function that returns the key of a stage output, the sha256 of everything the output depends on'''
+    key_content = json.dumps([stage_name, input_keys, stage_code_version, params], sort_keys=True, default=str)
+    return hashlib.sha256(key_content.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class PipelineStage:
+    """
+    A dataclass that describes one stage of a CheckpointedPipeline.
+
+    Attributes
+    ----------
+    name : str
+        The name of the stage, unique within the pipeline.
+    function : Callable
+        The function that computes the output, called with the outputs of the inputs in order.
+    inputs : list
+        The names of the stages or sources the stage reads.
+    code_version : str
+        The version of the code of the stage, e.g. from code_version(...).
+    params : dict
+        The parameters the output depends on, they have to be json serializable or have a stable str.
+    """
+    name: str
+    function: Callable
+    inputs: list = field(default_factory=list)
+    code_version: str = ""
+    params: dict = field(default_factory=dict)
+
+
+class CheckpointCache:
+    """
+    A class used to store the outputs of pipeline stages on disk.
+
+    Every output is stored in a directory named after its key, with a checkpoint.json that describes the
+    stage and its parts. DataFrames are stored as Parquet and numpy arrays as .npy, an output can be one of
+    those or a tuple of them. Outputs of other types are not cached.
+
+    Attributes
+    ----------
+    directory : str
+        The directory in which the checkpoints are stored.
+
+    Methods
+    -------
+    get(key: str):
+        Returns the cached output or None.
+    put(key: str, stage_name: str, output, metadata: dict):
+        Stores the output of a stage.
+    entries():
+        Returns the description of every checkpoint.
+    purge(stage_name: str, older_than: timedelta):
+        Removes checkpoints, of one stage or older than a given age.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CHECKPOINT_DIRECTORY) -> None:
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    @staticmethod
+    def _write_part(part, directory: str, part_number: int) -> dict:
+        if isinstance(part, pd.DataFrame):
+            # Parquet needs string column names, the original labels are restored from the description
+            file_name = f"part-{part_number}.parquet"
+            part.set_axis([str(column) for column in part.columns], axis=1).to_parquet(os.path.join(directory, file_name))
+            return {"file": file_name, "format": "parquet", "columns": np.asarray(part.columns).tolist(),
+                    "columns_name": part.columns.name}
+        if isinstance(part, np.ndarray):
+            file_name = f"part-{part_number}.npy"
+            np.save(os.path.join(directory, file_name), part, allow_pickle=False)
+            return {"file": file_name, "format": "npy"}
+        raise TypeError(f"{type(part).__name__} can not be checkpointed")
+
+    @staticmethod
+    def _read_part(part_description: dict, directory: str):
+        path = os.path.join(directory, part_description["file"])
+        if part_description["format"] == "npy":
+            return np.load(path, allow_pickle=False)
+        dataframe = pd.read_parquet(path)
+        dataframe.columns = pd.Index(part_description["columns"], name=part_description["columns_name"])
+        return dataframe
+
+    def get(self, key: str):
+        """
+        Returns the cached output of key, or None if it is not cached.
+        """
+        path = self._path(key)
+        if not os.path.exists(os.path.join(path, _CHECKPOINT_FILE)):
+            return None
+
+        with open(os.path.join(path, _CHECKPOINT_FILE)) as file:
+            checkpoint = json.load(file)
+        parts = [self._read_part(part_description, path) for part_description in checkpoint["parts"]]
+        return tuple(parts) if checkpoint["is_tuple"] else parts[0]
+
+    def put(self, key: str, stage_name: str, output, metadata: dict = None) -> None:
+        """
+        Stores the output of a stage under key. Outputs that can not be stored are not cached.
+
+        Parameters
+        ----------
+        key : str
+            The key as created by create_checkpoint_key.
+        stage_name : str
+            The name of the stage, used to inspect and purge the cache.
+        output : pd.DataFrame, np.ndarray or a tuple of those
+            The output of the stage.
+        metadata : dict, optional
+            The code version, parameters and input keys of the stage, stored for inspection.
+        """
+        is_tuple = isinstance(output, tuple)
+        # written to a temporary directory first, so a checkpoint is either complete or missing
+        temporary_path = f"{self._path(key)}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(temporary_path, exist_ok=True)
+            parts = [self._write_part(part, temporary_path, part_number)
+                     for part_number, part in enumerate(output if is_tuple else (output,))]
+            with open(os.path.join(temporary_path, _CHECKPOINT_FILE), "w") as file:
+                json.dump({"key": key, "stage": stage_name, "created": time.time(), "is_tuple": is_tuple,
+                           "parts": parts, **(metadata or {})}, file, default=str)
+            shutil.rmtree(self._path(key), ignore_errors=True)
+            os.replace(temporary_path, self._path(key))
+        except Exception:
+            shutil.rmtree(temporary_path, ignore_errors=True)
+            logging.warning(f"Output of stage {stage_name} could not be checkpointed", exc_info=True)
+
+    def entries(self) -> list:
+        """
+        Returns the checkpoint.json of every checkpoint, with its size in bytes, oldest first.
+        """
+        entries = []
+        for key in os.listdir(self.directory):
+            checkpoint_path = os.path.join(self._path(key), _CHECKPOINT_FILE)
+            if not os.path.exists(checkpoint_path):
+                continue
+            with open(checkpoint_path) as file:
+                checkpoint = json.load(file)
+            checkpoint["size_bytes"] = sum(os.path.getsize(os.path.join(self._path(key), file_name))
+                                           for file_name in os.listdir(self._path(key)))
+            entries.append(checkpoint)
+        return sorted(entries, key=lambda checkpoint: checkpoint["created"])
+
+    def purge(self, stage_name: str = None, older_than: timedelta = None) -> int:
+        """
+        Removes the checkpoints of stage_name, or of every stage if None, that are older than
+        older_than, or of any age if None. Returns the number of removed checkpoints.
+        """
+        removed = 0
+        for checkpoint in self.entries():
+            if stage_name is not None and checkpoint["stage"] != stage_name:
+                continue
+            if older_than is not None and time.time() - checkpoint["created"] <= older_than.total_seconds():
+                continue
+            shutil.rmtree(self._path(checkpoint["key"]), ignore_errors=True)
+            removed += 1
+        logging.info(f"{removed} checkpoints are purged")
+        return removed
+
+
+class CheckpointedPipeline:
+    """
+    A class used to run pipeline stages as a small DAG, loading unchanged stage outputs from a CheckpointCache.
+
+    Attributes
+    ----------
+    checkpoint_cache : CheckpointCache
+        The cache the stage outputs are loaded from and stored in.
+    sources : dict
+        The input DataFrames of the pipeline by name, keyed by the fingerprint of their content.
+    stages : dict
+        The PipelineStage by name.
+
+    Methods
+    -------
+    key(name: str):
+        Returns the key of a source or stage output.
+    run(name: str):
+        Returns the output of a stage, loaded from the cache or computed.
+    """
+
+    def __init__(self, checkpoint_cache: CheckpointCache, sources: dict, stages: list) -> None:
+        self.checkpoint_cache = checkpoint_cache
+        self.sources = sources
+        self.stages = {stage.name: stage for stage in stages}
+        self._keys = {}
+        self._outputs = dict(sources)
+
+    def key(self, name: str) -> str:
+        if name not in self._keys:
+            if name in self.sources:
+                self._keys[name] = fingerprint_dataframe(self.sources[name])
+            else:
+                stage = self.stages[name]
+                self._keys[name] = create_checkpoint_key(stage.name, [self.key(input_name) for input_name in stage.inputs],
+                                                         stage.code_version, stage.params)
+        return self._keys[name]
+
+    def run(self, name: str):
+        """
+        Returns the output of stage name. A cached output is loaded without running the stages it depends on,
+        otherwise its inputs are run (or loaded) first and the computed output is cached.
+        """
+        if name in self._outputs:
+            return self._outputs[name]
+
+        stage = self.stages[name]
+        key = self.key(name)
+        output = self.checkpoint_cache.get(key)
+        if output is not None:
+            logging.info(f"Stage {name} is loaded from checkpoint {key[:12]}")
+        else:
+            output = stage.function(*[self.run(input_name) for input_name in stage.inputs])
+            self.checkpoint_cache.put(key, name, output, {"code_version": stage.code_version, "params": stage.params,
+                                                          "input_keys": [self.key(input_name) for input_name in stage.inputs]})
+            logging.info(f"Stage {name} is computed and checkpointed as {key[:12]}")
+
+        self._outputs[name] = output
+        return output
+
+
+def main(arguments: list = None) -> None:
+    '''Function that inspects or purges the checkpoint cache from the command line'''
+    parser = argparse.ArgumentParser(description="Inspect and purge the pipeline checkpoint cache")
+    parser.add_argument("--directory", default=DEFAULT_CHECKPOINT_DIRECTORY)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list the checkpoints, oldest first")
+    purge_parser = commands.add_parser("purge", help="remove checkpoints")
+    purge_parser.add_argument("--stage", help="only remove the checkpoints of this stage")
+    purge_parser.add_argument("--older-than-days", type=float, help="only remove checkpoints older than this")
+    arguments = parser.parse_args(arguments)
+
+    checkpoint_cache = CheckpointCache(arguments.directory)
+    if arguments.command == "list":
+        for checkpoint in checkpoint_cache.entries():
+            created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(checkpoint["created"]))
+            print(f"{checkpoint['key'][:12]}  {checkpoint['stage']:<12} {created}  "
+                  f"{checkpoint['size_bytes'] / 1024 ** 2:8.1f} MB  params={json.dumps(checkpoint.get('params'), default=str)}")
+    else:
+        older_than = timedelta(days=arguments.older_than_days) if arguments.older_than_days is not None else None
+        print(f"{checkpoint_cache.purge(arguments.stage, older_than)} checkpoints removed")
+
+
+if (__name__ == "__main__"):
+    main(sys.argv[1:])
@@ -1,6 +1,8 @@
+import numpy as np
 import pandas as pd
 from datetime import timedelta
-from data_loader.auxiliary_data_loader import AuxDataLoader
+from data_loader.auxiliary_data_loader import AuxDataSession
+from data_loader.sales_statistics import SalesStatistics
 import logging
 class DataCleaner:
     """
@@ -12,9 +14,20 @@ class DataCleaner:
         A DataFrame containing transaction data. It is expected to adhere to the standard format for transaction data.
     time_of_sales_column : str
         The name of the column in df_transactions that contains the time of sales. Default is 'SaleDate'.
+    aux_data_session : AuxDataSession
+        The session that provides the auxiliary data, such as the stock per location.
+    lazy : bool
+        If True, the cleaning steps are registered on a plan instead of applied one by one. The plan
+        computes the mask of every step against the original frame, combines them and filters the
+        frame once, when the data is requested with get_data or df_transactions.
+    sales_statistics : SalesStatistics
+        The per product sales statistics of the frame the cleaning rules are evaluated on. It is built
+        once and shared by all rules in lazy mode, and rebuilt after every step in eager mode.
 
     Methods
     -------
+    get_data():
+        Returns the cleaned transaction data, applying the plan first in lazy mode.
     remove_unstocked_products():
         Removes products that are no longer in stock from df_transactions.
     remove_products_with_no_recent_sales(per_machine: bool, recent_quantification: timedelta):
@@ -29,7 +42,9 @@ class DataCleaner:
         Removes rows from df_transactions that contain NaN values.
     """
 
-    def __init__(self, df_transactions: pd.DataFrame, time_of_sales_column = "SaleDate") -> None:
+    def __init__(self, df_transactions: pd.DataFrame, time_of_sales_column = "SaleDate",
+                 aux_data_session: AuxDataSession = None, lazy: bool = False,
+                 sales_statistics: SalesStatistics = None) -> None:
         """
         Constructs all the necessary attributes for the DataCleaner object.
 
@@ -39,26 +54,87 @@ class DataCleaner:
             A DataFrame containing transaction data.
         time_of_sales_column : str, optional
             The name of the column in df_transactions that contains the time of sales. Default is 'SaleDate'.
+        aux_data_session : AuxDataSession, optional
+            The session shared by the stages of a deploy. Default is None, which creates a new session.
+        lazy : bool, optional
+            If True, the cleaning steps are planned and applied at once by get_data. Default is False.
+        sales_statistics : SalesStatistics, optional
+            The statistics of df_transactions, if already built. Default is None, which builds them on first use.
         """
-        self.df_transactions = df_transactions
+        self._df_transactions = df_transactions
         self.time_of_sales_column = time_of_sales_column
+        self.aux_data_session = aux_data_session if aux_data_session is not None else AuxDataSession()
+        self.lazy = lazy
+        self._cleaning_plan = []
+        self.sales_statistics = sales_statistics
         logging.info("DataCleaner object created")
+
+    @property
+    def df_transactions(self) -> pd.DataFrame:
+        if self._cleaning_plan:
+            self._apply_cleaning_plan()
+        return self._df_transactions
+
+    @df_transactions.setter
+    def df_transactions(self, df_transactions: pd.DataFrame) -> None:
+        self._df_transactions = df_transactions
         
     def get_data(self):
-        logging.info("DataCleaner object created")
+        logging.info("Cleaned data is loaded")
         return self.df_transactions
-        
+
+    def _sales_statistics_of(self, df_transactions: pd.DataFrame) -> SalesStatistics:
+        """
+        Returns the sales statistics of df_transactions, built only when the frame changed since the last call.
+        """
+        if self.sales_statistics is None or self.sales_statistics.df_transactions is not df_transactions:
+            self.sales_statistics = SalesStatistics(df_transactions, self.time_of_sales_column)
+        return self.sales_statistics
+
+    def _add_cleaning_step(self, rule_name: str, keep_mask_function) -> None:
+        """
+        Applies a cleaning step, or registers it on the plan in lazy mode.
+
+        keep_mask_function takes the transactions and returns a boolean array that is True for the rows to keep.
+        """
+        if self.lazy:
+            self._cleaning_plan.append((rule_name, keep_mask_function))
+            return
+
+        keep_mask = np.asarray(keep_mask_function(self._df_transactions), dtype=bool)
+        logging.info(f"{rule_name} removed {int((~keep_mask).sum())} rows")
+        self._df_transactions = self._df_transactions[keep_mask]
+
+    def _apply_cleaning_plan(self) -> None:
+        """
+        Computes the mask of every planned step against the unfiltered transactions,
+        combines them and filters the transactions once.
+        """
+        combined_keep_mask = np.ones(len(self._df_transactions), dtype=bool)
+        for rule_name, keep_mask_function in self._cleaning_plan:
+            keep_mask = np.asarray(keep_mask_function(self._df_transactions), dtype=bool)
+            removed_rows = int((~keep_mask).sum())
+            newly_removed_rows = int((combined_keep_mask & ~keep_mask).sum())
+            logging.info(f"{rule_name} removes {removed_rows} rows, of which {newly_removed_rows} not removed by earlier rules")
+            combined_keep_mask &= keep_mask
+
+        self._cleaning_plan = []
+        self._df_transactions = self._df_transactions[combined_keep_mask]
+        logging.info(f"Cleaning plan is applied, {len(combined_keep_mask) - int(combined_keep_mask.sum())} rows are removed")
 
     def remove_unstocked_products(self) -> None:
         """
         Removes products that are no longer in stock from df_transactions.
 
-        This method uses the AuxDataLoader to load the current stock of all locations and removes any products from df_transactions 
+        This method uses the aux_data_session to load the current stock of all locations and removes any products from df_transactions 
         that are not in the current of each individual location.
         """
-        df_stocked_products = AuxDataLoader().load_location_stock().index
-        mask_stocked = self.df_transactions.set_index(['Location', 'ProductId']).index.isin(df_stocked_products)
-        self.df_transactions = self.df_transactions[mask_stocked]
+        df_stocked_products = self.aux_data_session.load_location_stock().index
+
+        def mask_stocked(df_transactions):
+            return pd.MultiIndex.from_arrays([df_transactions['Location'], df_transactions['ProductId']]).isin(df_stocked_products)
+
+        self._add_cleaning_step("remove_unstocked_products", mask_stocked)
 
     def remove_products_with_no_recent_sales(self, per_machine: bool, recent_quantification: timedelta) -> None:
         """
@@ -74,17 +150,22 @@ class DataCleaner:
         recent_quantification : timedelta
             The time period to consider for recent sales.
         """
-        cutoff_date = self.df_transactions[self.time_of_sales_column].max() - recent_quantification
-        grouped_columns = ['Location', 'ProductId'] if per_machine else ['ProductId']
+        grouped_columns = SalesStatistics.grouped_columns(per_machine)
+
+        def mask_recently_sold(df_transactions):
+            sales_statistics = self._sales_statistics_of(df_transactions)
+            cutoff_date = sales_statistics.reference_date - recent_quantification
 
-        # Get the date of the last sale for each product (and each machine if per_machine is True)
-        df_last_sale = self.df_transactions.groupby(grouped_columns, group_keys=False)[self.time_of_sales_column].max()
+            # Get the date of the last sale for each product (and each machine if per_machine is True)
+            df_last_sale = sales_statistics.last_sale(per_machine)
 
-        # Identify products with no recent sales
-        index_old_products = df_last_sale[df_last_sale <= cutoff_date].index
+            # Identify products with no recent sales
+            index_old_products = df_last_sale[df_last_sale <= cutoff_date].index
 
-        # Remove products with no recent sales from df_transactions
-        self.df_transactions = self.df_transactions[~self.df_transactions.set_index(grouped_columns).index.isin(index_old_products)]
+            # Keep the products with recent sales
+            return ~self._key_index(df_transactions, grouped_columns).isin(index_old_products)
+
+        self._add_cleaning_step("remove_products_with_no_recent_sales", mask_recently_sold)
         
     def remove_products_based_on_performance(self, percentage_of_total_sales: int, 
                                             amount_of_time: timedelta, per_machine: bool ) -> None:
@@ -104,21 +185,31 @@ class DataCleaner:
         per_machine : bool
             If True, considers each machine separately. If False, considers all machines together.
         """
-        def percentage_of_sales_after_cutoff(group , cutoff):
-            after_time = group[self.time_of_sales_column] > cutoff
-            return after_time.sum() / len(group) * 100
+        grouped_columns = SalesStatistics.grouped_columns(per_machine)
+
+        def mask_performing(df_transactions):
+            sales_statistics = self._sales_statistics_of(df_transactions)
+
+            # Calculate the percentage of sales after the cutoff date for each product (and each machine if per_machine is True)
+            df_sales_performance = (sales_statistics.sales_in_trailing_window(amount_of_time, per_machine)
+                                    / sales_statistics.sales_count(per_machine) * 100)
 
-        cutoff_date = self.df_transactions[self.time_of_sales_column].max() - amount_of_time
-        grouped_columns = ['Location', 'ProductId'] if per_machine else ['ProductId']
+            # Identify products with insufficient sales performance
+            index_poor_performance = df_sales_performance[df_sales_performance < percentage_of_total_sales].index
 
-        # Calculate the percentage of sales after the cutoff date for each product (and each machine if per_machine is True)
-        df_sales_performance = self.df_transactions.groupby(grouped_columns).apply(percentage_of_sales_after_cutoff, cutoff_date)
+            # Keep the products with sufficient sales performance
+            return ~self._key_index(df_transactions, grouped_columns).isin(index_poor_performance)
 
-        # Identify products with insufficient sales performance
-        index_poor_performance = df_sales_performance[df_sales_performance < percentage_of_total_sales].index
+        self._add_cleaning_step("remove_products_based_on_performance", mask_performing)
 
-        # Remove products with insufficient sales performance from df_transactions
-        self.df_transactions = self.df_transactions[~self.df_transactions.set_index(grouped_columns).index.isin(index_poor_performance)]
+    @staticmethod
+    def _key_index(df_transactions: pd.DataFrame, columns: list) -> pd.Index:
+        """
+        Returns the values of columns as an index aligned with the rows, without copying the frame like set_index.
+        """
+        if len(columns) == 1:
+            return pd.Index(df_transactions[columns[0]])
+        return pd.MultiIndex.from_arrays([df_transactions[column] for column in columns])
         
     def split_locations_that_are_not_together(self) -> None:
         
@@ -135,4 +226,5 @@ class DataCleaner:
         """
         Removes rows from df_transactions that contain NaN values.
         """
-        self.df_transactions.dropna(inplace=True)
\ No newline at end of file
+        self._add_cleaning_step("remove_rows_containing_nan",
+                                lambda df_transactions: df_transactions.notna().all(axis=1).values)
\ No newline at end of file
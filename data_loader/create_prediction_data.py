@@ -1,7 +1,7 @@
 import logging
 from dataclasses import dataclass, field
-from data_loader.auxiliary_data_loader import AuxDataLoader
-from data_loader.transaction_data_loader import REQUIRED_TRANSACTION_COLUMNS
+from data_loader.auxiliary_data_loader import AuxDataSession
+from data_loader.transaction_data_loader import REQUIRED_TRANSACTION_COLUMNS, apply_transaction_schema
 
 import pandas as pd 
 from datetime import datetime, timedelta
@@ -15,6 +15,8 @@ class PredictionData:
     ----------
     days_of_prediction : int
         The number of days in the future for which to make predictions.
+    aux_data_session : AuxDataSession
+        The session that provides the machine information and stock per location.
     df_prediction_transactions : pd.DataFrame
         A DataFrame containing the base transactions for each location.
 
@@ -24,6 +26,7 @@ class PredictionData:
         Creates a DataFrame in the form of the model transactions.
     """
     days_of_prediction: int
+    aux_data_session: AuxDataSession = field(default_factory=AuxDataSession, repr=False)
     df_prediction_transactions: pd.DataFrame = field(init=False, default_factory=pd.DataFrame)
 
     def __post_init__(self):
@@ -41,9 +44,9 @@ class PredictionData:
         df_prediction_transactions : pd.DataFrame
             A DataFrame containing the base transactions for each location.
         """
-        ADL = AuxDataLoader()
-        df_machines = ADL.load_machine_information().reset_index(drop=False)
-        df_stock = ADL.load_location_stock().reset_index(drop=False)\
+        auxiliary_data = self.aux_data_session.load_concurrently(["machine_information", "location_stock"])
+        df_machines = auxiliary_data["machine_information"].reset_index(drop=False)
+        df_stock = auxiliary_data["location_stock"].reset_index(drop=False)\
             .drop(columns=["MaxCount","AvailableCount","DateTimeStock"])
         df_base_transactions = pd.merge(df_machines, df_stock, on="Location")
 
@@ -72,9 +75,9 @@ class PredictionData:
     
     def order_columns_to_transactions_format(self, df: pd.DataFrame) -> pd.DataFrame:
         """
-        Orders the columns of a the transaction to the required transaction format
+        Orders the columns of a the transaction to the required transaction format, with its compact dtypes
 
-        REQUIRED_TRANSACTION_COLUMNS is defined in the transaction_data_loader .
+        REQUIRED_TRANSACTION_COLUMNS and TRANSACTION_SCHEMA are defined in the transaction_data_loader .
         
         Parameters
         ----------
@@ -87,7 +90,7 @@ class PredictionData:
         """
         columns = REQUIRED_TRANSACTION_COLUMNS
         
-        df = df[columns]
+        df = apply_transaction_schema(df[columns])
 
         return df
 
@@ -0,0 +1,89 @@
+import logging
+import numpy as np
+import pandas as pd
+
+
+class DailyFeatureIndex:
+    """
+    A class used to join daily features per Location, such as weather, holidays or events, onto transactions.
+
+    The features are indexed once on (location code, day): every Location gets an integer code and every
+    day an offset from the first day, and a dense grid holds the feature row of every (location, day).
+    A join then normalizes the transaction dates to days, and takes the feature rows with one vectorized
+    lookup, without building date objects or merging on an object key.
+
+    Attributes
+    ----------
+    df_features : pd.DataFrame
+        The daily features, one row per Location and day.
+    locations : pd.Index
+        The indexed locations, the position of a location is its code.
+    first_day : np.datetime64
+        The first indexed day, in datetime64[D].
+
+    Methods
+    -------
+    row_positions(df_transactions: pd.DataFrame, date_column: str):
+        Returns the position in df_features of the features of every transaction, -1 if there are none.
+    join(df_transactions: pd.DataFrame, feature_columns: list, date_column: str):
+        Returns the feature_columns of every transaction, aligned with its rows.
+    """
+
+    def __init__(self, df_features: pd.DataFrame, location_column: str = "Location",
+                 date_column: str = "SaleDate") -> None:
+        """
+        Parameters
+        ----------
+        df_features : pd.DataFrame
+            The daily features, with a location and a date column. If a location has several rows
+            on one day, the last one is used.
+        location_column : str, optional
+            The name of the location column of df_features and of the transactions. Default is 'Location'.
+        date_column : str, optional
+            The name of the date column of df_features. Default is 'SaleDate'.
+        """
+        self.df_features = df_features.reset_index(drop=True)
+        self.location_column = location_column
+
+        location_codes, self.locations = pd.factorize(self.df_features[location_column].astype(object))
+        days = self.df_features[date_column].to_numpy(dtype="datetime64[ns]").astype("datetime64[D]")
+        has_key = (location_codes >= 0) & ~np.isnat(days)
+
+        self.first_day = days[has_key].min() if has_key.any() else np.datetime64("1970-01-01", "D")
+        self.number_of_days = int((days[has_key].max() - self.first_day).astype(int)) + 1 if has_key.any() else 0
+
+        self._row_position_grid = np.full(len(self.locations) * self.number_of_days, -1, dtype=np.int64)
+        grid_positions = location_codes[has_key] * self.number_of_days + (days[has_key] - self.first_day).astype(np.int64)
+        self._row_position_grid[grid_positions] = np.flatnonzero(has_key)
+        logging.info(f"Daily features of {len(self.locations)} locations over {self.number_of_days} days are indexed")
+
+    def row_positions(self, df_transactions: pd.DataFrame, date_column: str = "SaleDate") -> np.ndarray:
+        """
+        Returns the position in df_features of the features of every transaction, -1 if there are none.
+        """
+        transaction_locations = df_transactions[self.location_column]
+        if isinstance(transaction_locations.dtype, pd.CategoricalDtype):
+            # the codes of the categories are looked up once, then taken per row
+            category_codes = self.locations.get_indexer(transaction_locations.cat.categories.astype(object))
+            category_positions = transaction_locations.cat.codes.to_numpy()
+            location_codes = np.where(category_positions >= 0, category_codes[category_positions], -1)
+        else:
+            location_codes = self.locations.get_indexer(transaction_locations.astype(object))
+
+        days = df_transactions[date_column].to_numpy(dtype="datetime64[ns]").astype("datetime64[D]")
+        day_codes = np.where(np.isnat(days), -1, (days - self.first_day).astype(np.int64))
+
+        has_features = (location_codes >= 0) & (day_codes >= 0) & (day_codes < self.number_of_days)
+        positions = np.full(len(df_transactions), -1, dtype=np.int64)
+        positions[has_features] = self._row_position_grid[
+            location_codes[has_features] * self.number_of_days + day_codes[has_features]]
+        return positions
+
+    def join(self, df_transactions: pd.DataFrame, feature_columns: list, date_column: str = "SaleDate") -> pd.DataFrame:
+        """
+        Returns the feature_columns of every transaction as a DataFrame aligned with the rows of
+        df_transactions, missing where a Location has no features on the day of the transaction.
+        """
+        positions = self.row_positions(df_transactions, date_column)
+        return pd.DataFrame({column: pd.api.extensions.take(self.df_features[column].values, positions, allow_fill=True)
+                             for column in feature_columns}, index=df_transactions.index)
@@ -1,9 +1,11 @@
 import logging
+import numpy as np
 import pandas as pd
 import datetime
-import time
-from meteostat import Point, Daily
-from data_loader.auxiliary_data_loader import AuxDataLoader
+from data_loader.auxiliary_data_loader import AuxDataSession
+from data_loader.weather_fetcher import WeatherFetcher
+from data_loader.daily_feature_index import DailyFeatureIndex
+from data_loader.calendar_features import CalendarFeatureTable, CALENDAR_FEATURES
 
 class DataEnricher:
     """
@@ -16,22 +18,41 @@ class DataEnricher:
         'Location', 'SaleDate', and other transaction-related columns.
     df_machine_weather_data : pd.DataFrame
         a DataFrame containing weather data for each machine location. It is None until create_weather_data is called.
+    aux_data_session : AuxDataSession
+        the session that provides the auxiliary data, such as the machine information.
+    weather_fetcher : WeatherFetcher
+        the fetcher that requests the weather of the locations concurrently and rate limited.
+    calendar_table : CalendarFeatureTable
+        the calendar features per day, computed on first use over the days of df_transactions if not given.
+    rows_by_location_and_day : bool
+        True once add_missing_days has ordered the rows by Location and day, the other methods keep the row order.
 
     Methods
     -------
     add_time_feature_column(timefeature: str, column_name: str):
         Adds a new column to df_transactions based on the specified time feature.
+    add_calendar_features(feature_columns: list):
+        Adds calendar features, such as weekday, holiday flags or cyclical encodings, to df_transactions.
     create_weather_data(start: datetime.datetime, end: datetime.datetime, _weather_properties: list):
         Creates a DataFrame with weather data for each machine location.
     replace_unknown_weather_data():
         Placeholder method for replacing unknown weather data. Currently, it does nothing.
+    add_daily_features(daily_feature_index: DailyFeatureIndex, feature_columns: list, column_names: dict):
+        Adds daily features per Location, such as weather, holidays or events, to df_transactions.
     add_weather_data(weather_properties: list):
         Adds weather data to df_transactions.
+    add_missing_days(fill_policies: dict):
+        Adds a row for every day without transactions of a Location, with a fill policy per column.
     """
 
-    def __init__(self, df_transactions: pd.DataFrame) -> None:
+    def __init__(self, df_transactions: pd.DataFrame, aux_data_session: AuxDataSession = None,
+                 weather_fetcher: WeatherFetcher = None, calendar_table: CalendarFeatureTable = None) -> None:
         self.df_transactions = df_transactions
         self.df_machine_weather_data = None
+        self.aux_data_session = aux_data_session if aux_data_session is not None else AuxDataSession()
+        self.weather_fetcher = weather_fetcher if weather_fetcher is not None else WeatherFetcher()
+        self.calendar_table = calendar_table
+        self.rows_by_location_and_day = False
         logging.info("Enriched object is created")
         
     def get_data(self):
@@ -52,9 +73,29 @@ class DataEnricher:
         if timefeature.lower() not in ["year", "month", "day", "weekday", "hour", "minute", "second"]:
             raise ValueError("Timefeature not supported")
 
-        self.df_transactions[timefeature.lower()] = getattr(self.df_transactions["SaleDate"].dt, timefeature)
+        # features of the day come from the calendar table, only the time of day is computed per row
+        if timefeature.lower() in CALENDAR_FEATURES:
+            self.add_calendar_features([timefeature.lower()])
+        else:
+            self.df_transactions[timefeature.lower()] = getattr(self.df_transactions["SaleDate"].dt, timefeature)
         logging.info("Time feature is added : " + timefeature.lower())
 
+    def add_calendar_features(self, feature_columns: list) -> None:
+        """
+        Adds calendar features to df_transactions, looked up by the day of the sale in the calendar table.
+
+        Parameters
+        ----------
+        feature_columns : list
+            The calendar features to be added, see calendar_features.CALENDAR_FEATURES.
+        """
+        if self.calendar_table is None or not self.calendar_table.covers(self.df_transactions["SaleDate"]):
+            self.calendar_table = CalendarFeatureTable(min(self.df_transactions.SaleDate), max(self.df_transactions.SaleDate))
+
+        df_calendar_features = self.calendar_table.join(self.df_transactions, feature_columns)
+        for column in feature_columns:
+            self.df_transactions[column] = df_calendar_features[column].to_numpy()
+
     def create_weather_data(self, start: datetime.datetime, end: datetime.datetime, _weather_properties: list) -> None:
         """
         Creates a DataFrame with weather data for each machine location.
@@ -71,21 +112,10 @@ class DataEnricher:
         if isinstance(self.df_machine_weather_data, pd.DataFrame):
             return
 
-        df_machines = AuxDataLoader().load_machine_information()
-        df_all_weather = pd.DataFrame()
-
-        for row in df_machines.itertuples():
-            if row.Latitude == 0 and row.Longitude == 0:
-                continue
-
-            meteo_data = Daily(Point(row.Latitude, row.Longitude), start, end).aggregate('1D').fetch()
-            meteo_data["Location"] = row.Location
-            meteo_data = meteo_data.reset_index(drop=False).rename({"temp": "tavg", "time": "SaleDate"}, axis=1)
-
-            if not meteo_data.empty:
-                df_all_weather = pd.concat([df_all_weather, meteo_data], axis=0) if not df_all_weather.empty else meteo_data.copy()
-
-            time.sleep(0.05)  # reduce request load on the public server
+        df_machines = self.aux_data_session.load_machine_information()
+        # only the locations of the transactions are merged, so only those need weather data
+        df_machines = df_machines[df_machines["Location"].isin(self.df_transactions["Location"].unique())]
+        df_all_weather = self.weather_fetcher.fetch(df_machines, start, end)
 
         self.df_machine_weather_data = df_all_weather.convert_dtypes()
         logging.info("Weather data is loaded from the api")
@@ -108,33 +138,90 @@ class DataEnricher:
         weather_properties : list
             The weather properties to be added to df_transactions.
         """
-        _indexed_weather_properties = ["Location", "SaleDate"] + weather_properties
-
         start = min(self.df_transactions.SaleDate)
         end = max(self.df_transactions.SaleDate)
 
         self.create_weather_data(start, end, weather_properties)
-        df_enriched = pd.merge(
-            self.df_transactions,
-            self.df_machine_weather_data[_indexed_weather_properties],
-            left_on=["Location", self.df_transactions.SaleDate.dt.date],
-            right_on=["Location", self.df_machine_weather_data.SaleDate.dt.date],
-            how="left",
-            suffixes=('', '_date')
-        )
-        df_enriched.drop(columns=["key_1"], inplace=True)
+        # the day of the matched weather is kept as SaleDate_date, the column the former merge on the date added
+        df_enriched = self.add_daily_features(DailyFeatureIndex(self.df_machine_weather_data),
+                                              ["SaleDate"] + weather_properties, {"SaleDate": "SaleDate_date"})
 
         self.replace_unknown_weather_data()
 
-        self.df_transactions = df_enriched
         logging.info("Weather data is added to the data")
         return df_enriched
-    
-    def add_missing_days(self): #WIP
-        """Adds missing days to the data"""
-        # add missing days
-        df_enriched = self.df_transactions.set_index("SaleDate").groupby("Location").apply(lambda x: x.reindex(pd.date_range(min(x.index), max(x.index), freq="D"))).reset_index(level=0)
-        df_enriched = df_enriched.drop(columns=["Location"]).reset_index()
+
+    def add_daily_features(self, daily_feature_index: DailyFeatureIndex, feature_columns: list,
+                           column_names: dict = None) -> pd.DataFrame:
+        """
+        Adds daily features per Location to df_transactions, matched on the Location and the day of the sale.
+
+        Parameters
+        ----------
+        daily_feature_index : DailyFeatureIndex
+            The indexed daily features, such as weather, holidays or events.
+        feature_columns : list
+            The columns of the daily features to be added to df_transactions.
+        column_names : dict, optional
+            The new names of feature columns that should be added under another name.
+        """
+        df_features = daily_feature_index.join(self.df_transactions, feature_columns).rename(columns=column_names or {})
+        df_enriched = pd.concat([self.df_transactions.reset_index(drop=True), df_features.reset_index(drop=True)], axis=1)
+
+        self.df_transactions = df_enriched
+        return df_enriched
+
+    def add_missing_days(self, fill_policies: dict = None) -> pd.DataFrame:
+        """
+        Adds a row for every day without transactions of a Location, between its first and last day of sales.
+
+        The full (Location, day) calendar is built from the first and last day of every Location at once,
+        and left joined with the transactions, so days with sales keep all their transactions. The added
+        rows have the day as SaleDate and are missing everything else, such as ProductId, unless a fill
+        policy is given for the column. Transactions without a SaleDate have no day and are left out.
+
+        Parameters
+        ----------
+        fill_policies : dict, optional
+            The fill policy per column for the added rows: "ffill" or "bfill" take the previous or next
+            value of the same Location, any other value is used as is. Default is None, which fills nothing.
+        """
+        df_transactions = self.df_transactions.reset_index(drop=True)
+        sale_days = df_transactions["SaleDate"].dt.normalize()
+
+        # the calendar of every Location runs from its first to its last day of sales
+        df_sales_period = sale_days.groupby(df_transactions["Location"], observed=True).agg(["min", "max"])
+        days_per_location = ((df_sales_period["max"] - df_sales_period["min"]).dt.days + 1).to_numpy()
+        first_calendar_row = np.repeat(np.cumsum(days_per_location) - days_per_location, days_per_location)
+        day_offsets = np.arange(days_per_location.sum()) - first_calendar_row
+        calendar = pd.MultiIndex.from_arrays(
+            [df_sales_period.index.repeat(days_per_location),
+             np.repeat(df_sales_period["min"].to_numpy(), days_per_location) + pd.to_timedelta(day_offsets, unit="D").to_numpy()],
+            names=["Location", "_SaleDay"])
+
+        df_enriched = calendar.to_frame(index=False).merge(df_transactions.assign(_SaleDay=sale_days),
+                                                           on=["Location", "_SaleDay"], how="left", indicator=True)
+
+        added_rows = (df_enriched["_merge"] == "left_only").to_numpy()
+        df_enriched.loc[added_rows, "SaleDate"] = df_enriched.loc[added_rows, "_SaleDay"]
+
+        for column, fill_policy in (fill_policies or {}).items():
+            if fill_policy in ("ffill", "bfill"):
+                filled_values = getattr(df_enriched.groupby("Location", observed=True)[column], fill_policy)()
+            else:
+                # a categorical column only takes a constant that is one of its categories
+                if isinstance(df_enriched[column].dtype, pd.CategoricalDtype) and \
+                        fill_policy not in df_enriched[column].cat.categories:
+                    df_enriched[column] = df_enriched[column].cat.add_categories([fill_policy])
+                filled_values = df_enriched[column].fillna(fill_policy)
+            df_enriched[column] = df_enriched[column].where(~added_rows, filled_values)
+            # the added rows made e.g. an integer column float, once filled the column gets its own dtype back
+            original_dtype = df_transactions[column].dtype
+            if not isinstance(original_dtype, pd.CategoricalDtype) and df_enriched[column].notna().all():
+                df_enriched[column] = df_enriched[column].astype(original_dtype)
+
+        df_enriched = df_enriched[list(df_transactions.columns)]
         self.df_transactions = df_enriched
-        logging.info("Missing days are added to the data")
-        return df_enriched
\ No newline at end of file
+        self.rows_by_location_and_day = True
+        logging.info(f"Missing days are added to the data, {int(added_rows.sum())} days without sales")
+        return df_enriched
@@ -0,0 +1,123 @@
+import logging
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+
+
+class SalesStatistics:
+    """
+    A class used to hold per product sales statistics of a transaction frame.
+
+    The statistics are computed with vectorized groupby aggregations, once per granularity and
+    cached, so cleaning and correction rules become lookups per product instead of scans over
+    all transactions. Granularity is per ProductId, or per Location and ProductId when per_machine is True.
+
+    Attributes
+    ----------
+    df_transactions : pd.DataFrame
+        The transactions the statistics are computed from.
+    time_of_sales_column : str
+        The name of the column that contains the time of sales. Default is 'SaleDate'.
+    reference_date : pd.Timestamp
+        The time of the most recent sale, trailing windows end here.
+
+    Methods
+    -------
+    last_sale(per_machine: bool):
+        Returns the time of the last sale per product.
+    sales_count(per_machine: bool):
+        Returns the number of sales per product.
+    sales_in_trailing_window(window: timedelta, per_machine: bool):
+        Returns the number of sales per product after reference_date - window.
+    daily_sales(per_machine: bool):
+        Returns the mean and standard deviation of the number of sales per day per product.
+    """
+
+    def __init__(self, df_transactions: pd.DataFrame, time_of_sales_column: str = "SaleDate",
+                 trailing_windows: list = None) -> None:
+        """
+        Parameters
+        ----------
+        df_transactions : pd.DataFrame
+            The transactions in the standard transaction format.
+        time_of_sales_column : str, optional
+            The name of the column that contains the time of sales. Default is 'SaleDate'.
+        trailing_windows : list, optional
+            The trailing windows (timedelta) to precompute, other windows are computed on first use.
+        """
+        self.df_transactions = df_transactions
+        self.time_of_sales_column = time_of_sales_column
+        self.reference_date = df_transactions[time_of_sales_column].max()
+        self._statistics = {}
+
+        for window in trailing_windows or []:
+            self.sales_in_trailing_window(window, per_machine=False)
+            self.sales_in_trailing_window(window, per_machine=True)
+
+    @staticmethod
+    def grouped_columns(per_machine: bool) -> list:
+        return ['Location', 'ProductId'] if per_machine else ['ProductId']
+
+    def _cached(self, key: tuple, compute_function) -> pd.Series:
+        if key not in self._statistics:
+            self._statistics[key] = compute_function()
+        return self._statistics[key]
+
+    def _group_by(self, df_transactions: pd.DataFrame, per_machine: bool):
+        return df_transactions.groupby(self.grouped_columns(per_machine), observed=True)[self.time_of_sales_column]
+
+    def last_sale(self, per_machine: bool) -> pd.Series:
+        return self._cached(("last_sale", per_machine),
+                            lambda: self._group_by(self.df_transactions, per_machine).max())
+
+    def first_sale(self, per_machine: bool) -> pd.Series:
+        return self._cached(("first_sale", per_machine),
+                            lambda: self._group_by(self.df_transactions, per_machine).min())
+
+    def sales_count(self, per_machine: bool) -> pd.Series:
+        return self._cached(("sales_count", per_machine),
+                            lambda: self._group_by(self.df_transactions, per_machine).size())
+
+    def sales_in_trailing_window(self, window: timedelta, per_machine: bool) -> pd.Series:
+        """
+        Returns the number of sales per product strictly after reference_date - window,
+        with 0 for products without sales in the window.
+        """
+        def compute():
+            cutoff_date = self.reference_date - window
+            mask_in_window = (self.df_transactions[self.time_of_sales_column] > cutoff_date).values
+            sales_in_window = self._group_by(self.df_transactions[mask_in_window], per_machine).size()
+            return sales_in_window.reindex(self.sales_count(per_machine).index, fill_value=0)
+
+        return self._cached(("sales_in_trailing_window", window, per_machine), compute)
+
+    def daily_sales(self, per_machine: bool) -> pd.DataFrame:
+        """
+        Returns the mean and standard deviation of the number of sales per day per product, in the
+        columns daily_mean and daily_std. Days without sales between the first sale of a product and
+        reference_date count as 0 sales.
+        """
+        def compute():
+            grouped_columns = self.grouped_columns(per_machine)
+            sale_days = self.df_transactions[self.time_of_sales_column].dt.floor("D").rename("SaleDay")
+            sales_per_day = self.df_transactions.groupby(
+                [self.df_transactions[column] for column in grouped_columns] + [sale_days], observed=True).size()
+
+            sum_of_squares = (sales_per_day.astype("float64") ** 2).groupby(level=grouped_columns, observed=True).sum()
+            total_sales = self.sales_count(per_machine).astype("float64")
+            number_of_days = ((self.reference_date.floor("D") - self.first_sale(per_machine).dt.floor("D")).dt.days + 1).astype("float64")
+
+            daily_mean = total_sales / number_of_days
+            daily_variance = (sum_of_squares / number_of_days - daily_mean ** 2) * number_of_days / (number_of_days - 1)
+            daily_std = np.sqrt(daily_variance.clip(lower=0)).where(number_of_days > 1)
+            return pd.DataFrame({"daily_mean": daily_mean, "daily_std": daily_std})
+
+        return self._cached(("daily_sales", per_machine), compute)
+
+    def average_daily_sales(self) -> pd.DataFrame:
+        """
+        Returns the mean sales per day per Location and ProductId in the format of the
+        sql/average_daily_sales.sql query, a GemiddeldVerkochtPerDag column.
+        """
+        logging.info("Average daily sales are taken from the sales statistics")
+        return self.daily_sales(per_machine=True)[["daily_mean"]].rename(columns={"daily_mean": "GemiddeldVerkochtPerDag"})
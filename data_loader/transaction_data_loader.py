@@ -1,8 +1,10 @@
 import os
+import re
 import pandas as pd
-from data_loader.Type_guard import string_guard, integer_guard, float_guard, object_guard, datetime_guard
+from datetime import timedelta
+from data_loader.Type_guard import ColumnRule, validate_dataframe
 from azure_connectors.AzureSqlCommunicator import execute_query_and_load_results_into_dataframe, \
-    connect_azure, get_query_from_file
+    execute_query_and_yield_dataframe_chunks, connect_azure, get_query_from_file, DEFAULT_CHUNK_SIZE
 import logging
 
 REQUIRED_TRANSACTION_COLUMNS = ['ProductId', 'ProductName', 'PackagingType', 
@@ -11,75 +13,245 @@ REQUIRED_TRANSACTION_COLUMNS = ['ProductId', 'ProductName', 'PackagingType',
                 'LocationType', 'Environment','InServiceHours', 'InServiceDays'
                 ]
 
+# compact dtypes of the standard transaction format, "integer" is downcast to the smallest integer type
+TRANSACTION_SCHEMA = {'ProductId': 'integer', 'ProductName': 'category', 'PackagingType': 'category',
+                      'Brand': 'category', 'ProductCategory': 'category', 'GrossProfit': 'float32',
+                      'SaleDate': 'datetime64[ns]', 'MachineId': 'integer', 'MachineName': 'category',
+                      'Latitude': 'float32', 'Longitude': 'float32', 'Location': 'category',
+                      'LocationType': 'category', 'Environment': 'category', 'InServiceHours': 'category',
+                      'InServiceDays': 'category'}
+
+# expectations per column of the standard transaction format, checked by _test_transactions.
+# The keys of cleaning and encoding are strict, a missing key fails the load
+TRANSACTION_VALIDATION_RULES = [
+    ColumnRule('ProductId', 'integer', max_null_rate=0.0, strict=True),
+    ColumnRule('ProductName', 'string_like'),
+    ColumnRule('GrossProfit', 'float', min_value=0.0),
+    ColumnRule('SaleDate', 'datetime', max_null_rate=0.0, strict=True),
+    ColumnRule('MachineId', 'integer', max_null_rate=0.0),
+    ColumnRule('MachineName', 'string_like'),
+    ColumnRule('Latitude', 'float', min_value=-90.0, max_value=90.0),
+    ColumnRule('Longitude', 'float', min_value=-180.0, max_value=180.0),
+    ColumnRule('Location', 'string_like', max_null_rate=0.0, strict=True),
+    ColumnRule('LocationType', 'string_like'),
+    ColumnRule('Environment', 'string_like'),
+    ColumnRule('InServiceHours', 'string_like'),
+    ColumnRule('InServiceDays', 'string_like'),
+]
+
+# larger frames have their null rates and value ranges validated on a sample of this many rows
+VALIDATION_SAMPLE_SIZE = 100_000
+
+# transactions that can still arrive late, they are reloaded by every incremental load
+DEFAULT_INCREMENTAL_OVERLAP = timedelta(days=3)
+
+# optional query of the transactions since a moment, with one ? parameter for that moment. Without it,
+# the query of load_training_data.sql is wrapped in a SaleDate filter
+INCREMENTAL_TRANSACTIONS_QUERY_FILE = "sql/load_training_data_since.sql"
+
+# dtypes applied to every streamed chunk, so chunks do not arrive as object columns
+TRANSACTION_CHUNK_DTYPES = {'ProductId': 'int64', 'GrossProfit': 'float64', 'MachineId': 'int64',
+                            'Latitude': 'float64', 'Longitude': 'float64'}
+
+def apply_transaction_schema(df_transactions: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns df_transactions with the compact dtypes of TRANSACTION_SCHEMA.
+
+    Low cardinality strings become categoricals, ids the smallest integer type, coordinates and
+    profit float32 and the time of sales datetime64[ns]. Columns outside the schema are kept as they are.
+    """
+    columns = {}
+    for column, dtype in TRANSACTION_SCHEMA.items():
+        if column not in df_transactions.columns:
+            continue
+        if dtype == 'integer':
+            columns[column] = pd.to_numeric(df_transactions[column], downcast='integer')
+        elif dtype == 'datetime64[ns]':
+            columns[column] = pd.to_datetime(df_transactions[column]).astype(dtype)
+        else:
+            columns[column] = df_transactions[column].astype(dtype)
+    return df_transactions.assign(**columns)
+
+
+def create_incremental_transactions_query(query: str) -> str:
+    '''Function that wraps the transaction query in a filter on SaleDate >= ?.
+    T-SQL does not allow a CTE or an ORDER BY without TOP or OFFSET in a derived table, so such queries
+    raise a ValueError and need their own INCREMENTAL_TRANSACTIONS_QUERY_FILE.'''
+    query = query.strip().rstrip(";")
+    # comments and string literals can not contain the clauses that are checked
+    code = re.sub(r"--[^\n]*|/\*.*?\*/|'(?:[^']|'')*'", " ", query, flags=re.DOTALL)
+
+    depth, top_level_code = 0, []
+    for character in code:
+        depth += character == "("
+        top_level_code.append(character if depth == 0 else " ")
+        depth -= character == ")"
+    top_level_code = "".join(top_level_code)
+
+    if re.match(r"\s*WITH\b", code, flags=re.IGNORECASE):
+        raise ValueError(f"The transaction query starts with a CTE and can not be filtered incrementally, "
+                         f"write the incremental query to {INCREMENTAL_TRANSACTIONS_QUERY_FILE}")
+    if (re.search(r"\bORDER\s+BY\b", top_level_code, flags=re.IGNORECASE)
+            and not re.search(r"\bOFFSET\b|\bSELECT\s+(DISTINCT\s+)?TOP\b", top_level_code, flags=re.IGNORECASE)):
+        raise ValueError(f"The transaction query has an ORDER BY without TOP or OFFSET and can not be filtered "
+                         f"incrementally, remove it or write the incremental query to {INCREMENTAL_TRANSACTIONS_QUERY_FILE}")
+    # the closing parenthesis on its own line, so a trailing line comment does not swallow it
+    return f"SELECT * FROM ({query}\n) AS transactions WHERE SaleDate >= ?"
+
+
+def concat_transactions(df_transactions_list: list) -> pd.DataFrame:
+    """
+    Concatenates transaction frames, keeping categoricals with different categories categorical.
+
+    pd.concat falls back to object columns when the categories of the frames differ, as they do
+    between chunks and partitions, so the categories are unified first.
+    """
+    categorical_columns = [column for column, dtype in df_transactions_list[0].dtypes.items()
+                           if isinstance(dtype, pd.CategoricalDtype)]
+    for column in categorical_columns:
+        categories = pd.api.types.union_categoricals(
+            [df[column] for df in df_transactions_list], ignore_order=True).categories
+        df_transactions_list = [df.assign(**{column: df[column].cat.set_categories(categories)})
+                                for df in df_transactions_list]
+    return pd.concat(df_transactions_list, ignore_index=True)
+
+
 class ModelDataLoader:
     """
     A class used to load data for the model.
 
     Attributes
     ----------
-    connection : object
-        The connection object to the Azure SQL database.
+    connection : sqlalchemy.engine.URL
+        The connection url of the Azure SQL database, its pooled engine is shared process wide.
+    transaction_store : TransactionStore
+        The local store of the transaction history, if given the transactions are loaded incrementally.
 
     Methods
     -------
     load_transactions():
         Loads transaction data from the Azure SQL database.
+    load_transactions_in_chunks(chunk_size: int):
+        Yields the transaction data from the Azure SQL database in typed chunks.
+    load_transactions_incrementally(overlap: timedelta):
+        Loads only the new transactions from the Azure SQL database and merges them into the transaction_store.
     _test_transactions(df_training_data: pd.DataFrame):
         Tests the loaded transaction data to ensure it has the correct format and data types.
     load_model_data():
         Loads the model data, which currently is just the transaction data.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, transaction_store = None) -> None:
         self.connection = connect_azure()
+        self.transaction_store = transaction_store
 
 
     def load_transactions(self) -> pd.DataFrame:
         """
         Loads transaction data from the Azure SQL database.
+        The full history is loaded as one frame, use load_transactions_in_chunks to process it chunk by chunk.
 
         Returns
         -------
         pd.DataFrame
-            The loaded transaction data.
+            The loaded transaction data, with the compact dtypes of TRANSACTION_SCHEMA.
         """
         query = get_query_from_file("sql/load_training_data.sql")
         df_transactions = execute_query_and_load_results_into_dataframe(self.connection, query)
 
         self._test_transactions(df_transactions)
+        df_transactions = apply_transaction_schema(df_transactions)
         logging.info("Transactions are loaded")
         return df_transactions
 
+    def load_transactions_in_chunks(self, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        Yields the transaction data from the Azure SQL database in chunks, the streaming entry point for large histories.
+
+        The query result is streamed with a server side cursor, so peak memory is bounded by
+        chunk_size rather than by the size of the transaction history. Every chunk is read with
+        TRANSACTION_CHUNK_DTYPES, tested, and converted to the compact TRANSACTION_SCHEMA before it is yielded.
+
+        Parameters
+        ----------
+        chunk_size : int
+            The maximum number of transactions per chunk.
+
+        Yields
+        ------
+        pd.DataFrame
+            A chunk of the transaction data in the standard transaction format.
+        """
+        query = get_query_from_file("sql/load_training_data.sql")
+        for number_of_chunks, df_chunk in enumerate(execute_query_and_yield_dataframe_chunks(
+                self.connection, query, chunk_size, dtype=TRANSACTION_CHUNK_DTYPES, parse_dates=['SaleDate']), 1):
+            self._test_transactions(df_chunk)
+            logging.info(f"Transaction chunk {number_of_chunks} is loaded")
+            yield apply_transaction_schema(df_chunk)
+
+    def load_transactions_incrementally(self, overlap: timedelta = DEFAULT_INCREMENTAL_OVERLAP) -> pd.DataFrame:
+        """
+        Loads only the new transactions from the Azure SQL database and returns the merged history.
+
+        Only transactions after the high-water mark of the transaction_store minus the overlap are queried,
+        with INCREMENTAL_TRANSACTIONS_QUERY_FILE if it exists, the overlap reloads transactions that arrived late. The stored transactions in the overlap are
+        replaced by the queried ones, so no transaction is counted twice. An empty store is filled with
+        the full history chunk by chunk, so only one chunk is held in memory while the store is filled.
+
+        Parameters
+        ----------
+        overlap : timedelta
+            The period before the high-water mark that is queried again. Default is 3 days.
+
+        Returns
+        -------
+        pd.DataFrame
+            The full transaction history.
+        """
+        high_water_mark = self.transaction_store.high_water_mark()
+        if high_water_mark is None:
+            for df_chunk in self.load_transactions_in_chunks(DEFAULT_CHUNK_SIZE):
+                self.transaction_store.append(df_chunk)
+            return self.transaction_store.load()
+
+        since = (high_water_mark - overlap).to_pydatetime()
+        if os.path.exists(INCREMENTAL_TRANSACTIONS_QUERY_FILE):
+            incremental_query = get_query_from_file(INCREMENTAL_TRANSACTIONS_QUERY_FILE)
+        else:
+            incremental_query = create_incremental_transactions_query(get_query_from_file("sql/load_training_data.sql"))
+        df_new_chunks = list(execute_query_and_yield_dataframe_chunks(
+            self.connection, incremental_query, DEFAULT_CHUNK_SIZE, dtype=TRANSACTION_CHUNK_DTYPES,
+            parse_dates=['SaleDate'], params=(since,)))
+        if not df_new_chunks:
+            return self.transaction_store.load()
+        df_new_transactions = pd.concat(df_new_chunks, ignore_index=True)
+
+        self._test_transactions(df_new_transactions)
+        df_new_transactions = apply_transaction_schema(df_new_transactions)
+        self.transaction_store.replace_from(since, df_new_transactions)
+        logging.info(f"{len(df_new_transactions)} transactions since {since} are loaded incrementally")
+        return self.transaction_store.load()
+
     def _test_transactions(self, df_training_data: pd.DataFrame) -> None:
         """
         Tests the loaded transaction data to ensure it has the correct format and data types.
 
+        Column presence, order, dtypes and missing keys are checked on the full frame, other null rates and
+        value ranges on a sample of VALIDATION_SAMPLE_SIZE rows. Every violation is reported at once.
+
         Parameters
         ----------
         df_training_data : pd.DataFrame
             The loaded transaction data.
+
+        Raises
+        ------
+        ValueError
+            If the columns or dtypes do not match the standard transaction format, or a key is missing.
         """
-        required_columns = REQUIRED_TRANSACTION_COLUMNS
-        for column in required_columns:
-            assert column in df_training_data.columns, f"{column} is not in the DataFrame"
-            
-        for i, column in enumerate(df_training_data.columns):
-            assert column == required_columns[i], f"{column} is not at required column position {i}"
-
-        df_training_data = df_training_data.convert_dtypes(convert_string=False) 
-
-        integer_guard(df_training_data['ProductId']) 
-        object_guard(df_training_data['ProductName'])
-        datetime_guard(df_training_data['SaleDate'])
-        integer_guard(df_training_data['MachineId'])
-        object_guard(df_training_data['MachineName'])
-        float_guard(df_training_data['Latitude'])
-        float_guard(df_training_data['Longitude'])
-        object_guard(df_training_data['Location'])
-        object_guard(df_training_data['LocationType'])
-        object_guard(df_training_data['Environment'])
-        object_guard(df_training_data['InServiceHours'])
-        object_guard(df_training_data['InServiceDays'])
+        report = validate_dataframe(df_training_data, TRANSACTION_VALIDATION_RULES,
+                                    REQUIRED_TRANSACTION_COLUMNS, sample_size=VALIDATION_SAMPLE_SIZE)
+        report.raise_for_errors()
 
     def load_model_data(self) -> pd.DataFrame:
         """
@@ -91,4 +263,6 @@ class ModelDataLoader:
             The loaded model data.
         """
         logging.info("Model data is loaded")
+        if self.transaction_store is not None:
+            return self.load_transactions_incrementally()
         return self.load_transactions()
\ No newline at end of file
@@ -0,0 +1,134 @@
+import os
+import glob
+import logging
+import pandas as pd
+
+from data_loader.transaction_data_loader import REQUIRED_TRANSACTION_COLUMNS, apply_transaction_schema, concat_transactions
+
+DEFAULT_TRANSACTION_STORE_DIRECTORY = "transaction_store"
+
+
+class TransactionStore:
+    """
+    A class used to keep the transaction history locally, as Parquet files partitioned by month.
+
+    The store is updated with the transactions of the last days only: all stored transactions from
+    a given moment onwards are replaced by a fresh query result from that moment, which removes the
+    transactions that were loaded twice and adds the ones that arrived late.
+
+    Attributes
+    ----------
+    directory : str
+        The directory of the store, with one SaleMonth=YYYY-MM/transactions.parquet file per month.
+    time_of_sales_column : str
+        The name of the column that contains the time of sales. Default is 'SaleDate'.
+
+    Methods
+    -------
+    is_empty():
+        Returns True if no transactions are stored.
+    high_water_mark():
+        Returns the time of the most recent stored transaction.
+    load():
+        Returns the full stored transaction history.
+    replace_from(since: datetime, df_transactions: pd.DataFrame):
+        Replaces all stored transactions from since onwards by df_transactions.
+    append(df_transactions: pd.DataFrame):
+        Adds df_transactions to the stored transactions.
+    """
+
+    def __init__(self, directory: str = DEFAULT_TRANSACTION_STORE_DIRECTORY,
+                 time_of_sales_column: str = "SaleDate") -> None:
+        self.directory = directory
+        self.time_of_sales_column = time_of_sales_column
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _partition_path(self, month: str) -> str:
+        return os.path.join(self.directory, f"SaleMonth={month}", "transactions.parquet")
+
+    def _partition_months(self) -> list:
+        paths = glob.glob(os.path.join(self.directory, "SaleMonth=*", "transactions.parquet"))
+        return sorted(os.path.basename(os.path.dirname(path)).split("=", 1)[1] for path in paths)
+
+    def is_empty(self) -> bool:
+        return not self._partition_months()
+
+    def high_water_mark(self):
+        """
+        Returns the time of the most recent stored transaction, or None if the store is empty.
+        """
+        months = self._partition_months()
+        if not months:
+            return None
+        df_last_month = pd.read_parquet(self._partition_path(months[-1]), columns=[self.time_of_sales_column])
+        return df_last_month[self.time_of_sales_column].max()
+
+    def load(self) -> pd.DataFrame:
+        """
+        Returns the full stored transaction history, ordered by time of sales.
+        """
+        df_partitions = [pd.read_parquet(self._partition_path(month)) for month in self._partition_months()]
+        if not df_partitions:
+            return apply_transaction_schema(pd.DataFrame(columns=REQUIRED_TRANSACTION_COLUMNS))
+        return concat_transactions(df_partitions)
+
+    def _write_month(self, month: str, df_month: pd.DataFrame) -> None:
+        path = self._partition_path(month)
+        # a month without transactions has no partition, so an empty load leaves an empty store
+        if df_month.empty:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        df_month = df_month.sort_values(self.time_of_sales_column, kind="stable")[REQUIRED_TRANSACTION_COLUMNS]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df_month.to_parquet(path, index=False)
+
+    def replace_from(self, since, df_transactions: pd.DataFrame) -> None:
+        """
+        Replaces all stored transactions from since onwards by df_transactions.
+        Only the partitions of the months from since onwards are rewritten.
+
+        Parameters
+        ----------
+        since : datetime
+            The moment from which the stored transactions are replaced, None replaces everything.
+        df_transactions : pd.DataFrame
+            The transactions from since onwards, in the standard transaction format.
+        """
+        if df_transactions.empty:
+            # an empty query result has object columns, without the datetime SaleDate the months are taken from
+            df_transactions = apply_transaction_schema(df_transactions.reindex(columns=REQUIRED_TRANSACTION_COLUMNS))
+        sale_months = df_transactions[self.time_of_sales_column].dt.strftime("%Y-%m")
+        first_month = since.strftime("%Y-%m") if since is not None else ""
+        months = sorted(set(sale_months.unique()) | {month for month in self._partition_months() if month >= first_month})
+
+        for month in months:
+            path = self._partition_path(month)
+            df_month = df_transactions[(sale_months == month).values]
+            if since is not None and os.path.exists(path):
+                df_stored = pd.read_parquet(path)
+                df_stored = df_stored[(df_stored[self.time_of_sales_column] < since).values]
+                df_month = concat_transactions([df_stored, df_month])
+            self._write_month(month, df_month)
+
+        logging.info(f"Transaction store is updated with {len(df_transactions)} transactions in {len(months)} months")
+
+    def append(self, df_transactions: pd.DataFrame) -> None:
+        """
+        Adds df_transactions to the stored transactions, such as the chunks of a full load.
+        Only the partitions of the months of df_transactions are rewritten.
+
+        Parameters
+        ----------
+        df_transactions : pd.DataFrame
+            The transactions that are not stored yet, in the standard transaction format.
+        """
+        sale_months = df_transactions[self.time_of_sales_column].dt.strftime("%Y-%m")
+        for month in sorted(sale_months.unique()):
+            path = self._partition_path(month)
+            df_month = df_transactions[(sale_months == month).values]
+            if os.path.exists(path):
+                df_month = concat_transactions([pd.read_parquet(path), df_month])
+            self._write_month(month, df_month)
+
+        logging.info(f"{len(df_transactions)} transactions are added to the transaction store")
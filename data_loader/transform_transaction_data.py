@@ -1,6 +1,56 @@
 import logging
+from dataclasses import dataclass
 import pandas as pd
 import numpy as np
+from scipy import sparse
+from data_loader.transaction_data_loader import REQUIRED_TRANSACTION_COLUMNS
+
+# the declared columns of X, the static attributes of a Location and the features of a day at a Location
+LOCATION_DIMENSION_COLUMNS = ["Latitude", "Longitude", "LocationType", "Environment", "InServiceHours", "InServiceDays"]
+DAILY_DIMENSION_COLUMNS = ["tavg", "prcp", "weekday"]
+# partial results of the StreamingFrequencyEncoder that are kept before they are compacted into one
+DEFAULT_COMPACT_AFTER_PARTS = 16
+
+
+def location_dimension_from_locations(df_locations: pd.DataFrame, location_columns: list) -> pd.DataFrame:
+    '''Function that returns the location_columns of the first row of every Location in df_locations, indexed by Location'''
+    df_location_dimension = df_locations.drop_duplicates("Location").set_index("Location")
+    df_location_dimension.index = df_location_dimension.index.astype(object)
+    return df_location_dimension[[column for column in location_columns if column in df_location_dimension.columns]]
+
+
+def join_location_dimension(df_daily_features: pd.DataFrame, df_location_dimension: pd.DataFrame) -> pd.DataFrame:
+    '''Function that returns X: the static attributes of the Location of every (time, Location) group, followed by its daily features'''
+    group_locations = df_daily_features.index.get_level_values(1).astype(object)
+    df_location_attributes = df_location_dimension.reindex(group_locations).set_axis(df_daily_features.index)
+    return pd.concat([df_location_attributes, df_daily_features], axis=1)
+
+
+@dataclass
+class SparseFrequencyEncoding:
+    """
+    A dataclass that holds the frequency encoded target as a sparse matrix.
+
+    Attributes
+    ----------
+    matrix : sparse.csr_matrix
+        The number of sales per (time, Location) row and ProductId column.
+    index : pd.MultiIndex
+        The (SaleDate, Location) of every row.
+    columns : pd.Index
+        The ProductId of every column.
+
+    Methods
+    -------
+    to_dense():
+        Returns the encoding as a DataFrame, for models that do not accept sparse input.
+    """
+    matrix: sparse.csr_matrix
+    index: pd.MultiIndex
+    columns: pd.Index
+
+    def to_dense(self) -> pd.DataFrame:
+        return pd.DataFrame(self.matrix.toarray(), index=self.index, columns=self.columns)
 
 class DataTransformer:
     """
@@ -10,19 +60,43 @@ class DataTransformer:
     ----------
     df_transactions : pd.DataFrame
         a DataFrame containing transaction data.
+    df_locations : pd.DataFrame
+        the static attributes per Location, such as the machine information. If None, the attributes of
+        the first transaction of every Location are used.
+    location_columns : list
+        the static Location attributes that are columns of X.
+    daily_columns : list
+        the features per day and Location, added by the enrichment, that are columns of X.
 
     Methods
     -------
-    frequency_encode(group_per_time: str):
+    frequency_encode(group_per_time: str, sparse_target: bool):
         Frequency encodes the daily transactions.
+    location_dimension():
+        Returns the static attributes per Location.
     """
 
-    def __init__(self, df_transactions: pd.DataFrame) -> None:
+    def __init__(self, df_transactions: pd.DataFrame, df_locations: pd.DataFrame = None,
+                 location_columns: list = LOCATION_DIMENSION_COLUMNS,
+                 daily_columns: list = DAILY_DIMENSION_COLUMNS) -> None:
         self.df_transactions = df_transactions
+        self.df_locations = df_locations
+        self.location_columns = location_columns
+        self.daily_columns = daily_columns
         logging.info("Transformer object is created")
+
+    def location_dimension(self) -> pd.DataFrame:
+        """
+        Returns the location_columns per Location, indexed by Location, one row per Location.
+        """
+        if self.df_locations is not None:
+            return location_dimension_from_locations(self.df_locations, self.location_columns)
+        df_locations = self.df_transactions.groupby("Location", observed=True).first()
+        df_locations.index = df_locations.index.astype(object)
+        return df_locations[[column for column in self.location_columns if column in df_locations.columns]]
         
 
-    def frequency_encode(self, group_per_time: str = "D") -> tuple[pd.DataFrame, pd.DataFrame]:
+    def frequency_encode(self, group_per_time: str = "D", sparse_target: bool = False) -> tuple[pd.DataFrame, pd.DataFrame]:
         """
         Frequency encodes the daily transactions.
 
@@ -30,6 +104,8 @@ class DataTransformer:
         ----------
         group_per_time : str
             The frequency for grouping transactions. Default is 'D' for daily.
+        sparse_target : bool
+            If True, y is returned as a SparseFrequencyEncoding, counted in one vectorized pass. Default is False.
 
         Returns
         -------
@@ -39,17 +115,177 @@ class DataTransformer:
         grouped_transactions = self.df_transactions.groupby([
             pd.Grouper(key="SaleDate", freq=group_per_time),
             pd.Grouper(key="Location")
-        ])
+        ], observed=True)
 
         # Generate frequency encoding for y
-        product_id_list = pd.DataFrame(grouped_transactions["ProductId"].apply(list))
-        y = [dict(pd.Series(product_ids).value_counts()) for product_ids in product_id_list["ProductId"]]
-        df_y = pd.DataFrame(y).fillna(0).set_index(product_id_list.index)
-
-        # Generate X
-        constant_unique_columns = (grouped_transactions.nunique() <= 1).all()
-        constant_columns = np.unique((np.append(constant_unique_columns.loc[constant_unique_columns == True].index, ["Latitude", "Longitude", "tavg", "prcp"]))) # fix that there are locations that are widely spread apart
-        df_x = grouped_transactions[constant_columns].first()
-        
+        if sparse_target:
+            df_y = self.sparse_frequency_encode_target(grouped_transactions)
+        else:
+            product_id_list = pd.DataFrame(grouped_transactions["ProductId"].apply(list))
+            y = [dict(pd.Series(product_ids).value_counts()) for product_ids in product_id_list["ProductId"]]
+            df_y = pd.DataFrame(y).fillna(0).set_index(product_id_list.index)
+
+        # Generate X from the location dimension and the daily features, joined on the key of every group
+        daily_columns = [column for column in self.daily_columns if column in self.df_transactions.columns]
+        self._warn_for_undeclared_features()
+        df_x = join_location_dimension(grouped_transactions[daily_columns].first(), self.location_dimension())
+
         logging.info("frequency encoded data has loaded")
-        return df_x, df_y
\ No newline at end of file
+        return df_x, df_y
+
+    def _warn_for_undeclared_features(self) -> None:
+        """
+        Warns for the columns added to the standard transaction format, such as enriched features,
+        that are not declared as location or daily columns and so are left out of X.
+        """
+        undeclared_columns = [column for column, dtype in self.df_transactions.dtypes.items()
+                              if column not in REQUIRED_TRANSACTION_COLUMNS and column not in self.location_columns
+                              and column not in self.daily_columns and not pd.api.types.is_datetime64_any_dtype(dtype)]
+        if undeclared_columns:
+            logging.warning(f"Columns {undeclared_columns} are not declared as location_columns or daily_columns "
+                            f"and are left out of X")
+
+    def sparse_frequency_encode_target(self, grouped_transactions) -> SparseFrequencyEncoding:
+        """
+        Counts the sales per group and ProductId in one vectorized pass.
+
+        The groups and the products are numbered with integer codes, and every (group code, product code)
+        pair of a transaction adds one to a sparse matrix. Rows without a ProductId, such as the days
+        added by DataEnricher.add_missing_days, leave their group without sales.
+
+        Parameters
+        ----------
+        grouped_transactions : DataFrameGroupBy
+            The transactions grouped per time and Location.
+        """
+        group_codes = grouped_transactions.ngroup().to_numpy()
+        product_codes, product_ids = pd.factorize(self.df_transactions["ProductId"], sort=True)
+        is_counted = (group_codes >= 0) & (product_codes >= 0)
+
+        group_index = grouped_transactions.size().index
+        matrix = sparse.csr_matrix(
+            (np.ones(int(is_counted.sum()), dtype=np.int64), (group_codes[is_counted], product_codes[is_counted])),
+            shape=(len(group_index), len(product_ids)))
+        logging.info(f"Sparse frequency encoding of {matrix.shape[0]} groups and {matrix.shape[1]} products "
+                     f"has {matrix.nnz} non zero counts")
+        return SparseFrequencyEncoding(matrix, group_index, pd.Index(product_ids, name="ProductId"))
+
+
+class StreamingFrequencyEncoder:
+    """
+    A class used to frequency encode transactions that arrive in chunks, such as from
+    ModelDataLoader.load_transactions_in_chunks, without holding the transaction history in memory.
+
+    Every chunk adds its counts per (time, Location, ProductId) and its features per (time, Location)
+    as a partial result. The partial results are aggregated by result(), and compacted into one whenever
+    there are more than compact_after_parts, so memory is proportional to the encoded output plus
+    compact_after_parts chunks, not to the transactions. The result is the X and y of DataTransformer.frequency_encode
+    on the concatenated chunks, with the ProductId columns of y sorted.
+
+    Attributes
+    ----------
+    group_per_time : str
+        The frequency for grouping transactions, a fixed frequency that divides a day. Default is 'D' for daily.
+    df_locations : pd.DataFrame
+        the static attributes per Location. If None, the attributes of the first transaction of every Location are used.
+    location_columns : list
+        the static Location attributes that are columns of X.
+    daily_columns : list
+        the features per day and Location that are columns of X.
+    compact_after_parts : int
+        the number of partial results that are kept before they are compacted into one.
+
+    Methods
+    -------
+    update(df_chunk: pd.DataFrame):
+        Adds a chunk of transactions to the encoding.
+    result():
+        Returns the frequency encoded X and y of all chunks so far.
+    """
+
+    def __init__(self, group_per_time: str = "D", df_locations: pd.DataFrame = None,
+                 location_columns: list = LOCATION_DIMENSION_COLUMNS,
+                 daily_columns: list = DAILY_DIMENSION_COLUMNS,
+                 compact_after_parts: int = DEFAULT_COMPACT_AFTER_PARTS) -> None:
+        # chunks are binned independently, which only matches the binning of the whole frame
+        # when the bins are aligned to midnight
+        if pd.Timedelta(days=1) % pd.Timedelta(pd.tseries.frequencies.to_offset(group_per_time)) != pd.Timedelta(0):
+            raise ValueError(f"group_per_time {group_per_time} is not a fixed frequency that divides a day")
+
+        self.group_per_time = group_per_time
+        self.df_locations = df_locations
+        self.location_columns = location_columns
+        self.daily_columns = daily_columns
+        self.compact_after_parts = compact_after_parts
+        self._product_counts_parts = []
+        self._df_groups_parts = []
+        self._df_first_per_location_parts = []
+        self._location_categories = None
+
+    @staticmethod
+    def _aggregate_parts(parts: list, aggregation):
+        # the partial results are aggregated into one, which replaces them in parts
+        if len(parts) > 1:
+            combined = pd.concat(parts)
+            parts[:] = [combined.groupby(level=list(range(combined.index.nlevels)), sort=False).agg(aggregation)]
+        return parts[0]
+
+    def update(self, df_chunk: pd.DataFrame) -> None:
+        """
+        Adds a chunk of transactions to the encoding, chunks are expected in the order of the transactions.
+
+        The counts and features of the chunk are kept as a partial result, the partial results are
+        aggregated by result() and whenever there are more than compact_after_parts of them.
+        """
+        periods = df_chunk["SaleDate"].dt.floor(self.group_per_time).rename("SaleDate")
+        locations = df_chunk["Location"].astype(object).rename(None)
+
+        # the groupby of the whole frame orders the observed Locations by their first appearance
+        chunk_locations = pd.Index(locations.dropna().unique())
+        self._location_categories = chunk_locations if self._location_categories is None else \
+            self._location_categories.append(chunk_locations.difference(self._location_categories, sort=False))
+
+        self._product_counts_parts.append(df_chunk.groupby([periods, locations, df_chunk["ProductId"]], sort=False).size())
+
+        daily_columns = [column for column in self.daily_columns if column in df_chunk.columns]
+        self._df_groups_parts.append(df_chunk.groupby([periods, locations], sort=False)[daily_columns].first())
+
+        if self.df_locations is None:
+            self._df_first_per_location_parts.append(df_chunk.groupby(locations.rename("Location"), sort=False)[
+                [column for column in self.location_columns if column in df_chunk.columns]].first())
+
+        # the partial results are compacted now and then, so memory does not grow with the number of chunks
+        if len(self._df_groups_parts) > self.compact_after_parts:
+            self._aggregate_parts(self._product_counts_parts, "sum")
+            self._aggregate_parts(self._df_groups_parts, "first")
+            if self.df_locations is None:
+                self._aggregate_parts(self._df_first_per_location_parts, "first")
+
+    def result(self) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Returns the frequency encoded X and y of all chunks so far.
+        """
+        if not self._df_groups_parts:
+            raise ValueError("No transactions are encoded")
+
+        df_groups = self._aggregate_parts(self._df_groups_parts, "first")
+        group_locations = pd.Categorical(df_groups.index.get_level_values(1), categories=self._location_categories)
+        group_index = pd.MultiIndex.from_arrays([df_groups.index.get_level_values(0), group_locations],
+                                                names=["SaleDate", None])
+        df_groups = df_groups.set_axis(group_index).sort_index()
+
+        df_y = self._aggregate_parts(self._product_counts_parts, "sum").unstack("ProductId", fill_value=0).sort_index(axis=1)
+        df_y = df_y.set_axis(pd.MultiIndex.from_arrays(
+            [df_y.index.get_level_values(0), pd.Categorical(df_y.index.get_level_values(1), categories=self._location_categories)],
+            names=["SaleDate", None])).reindex(df_groups.index, fill_value=0).astype("float64")
+        df_y.columns = list(df_y.columns)
+
+        if self.df_locations is not None:
+            df_location_dimension = location_dimension_from_locations(self.df_locations, self.location_columns)
+        else:
+            df_location_dimension = self._aggregate_parts(self._df_first_per_location_parts, "first")
+            df_location_dimension.index = df_location_dimension.index.astype(object)
+        df_x = join_location_dimension(df_groups, df_location_dimension)
+
+        logging.info("frequency encoded data has loaded from the transaction chunks")
+        return df_x, df_y
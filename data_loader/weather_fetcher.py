@@ -0,0 +1,213 @@
+import time
+import logging
+import threading
+import datetime
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from meteostat import Point, Daily
+from data_loader.weather_store import WeatherStore, create_weather_store_from_environment
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_REQUESTS_PER_SECOND = 20.0
+DEFAULT_TIMEOUT_SECONDS = 30.0
+DEFAULT_RETRIES = 2
+DEFAULT_RETRY_BACKOFF_SECONDS = 1.0
+
+# the daily properties of meteostat, the columns of the weather next to SaleDate and Location
+WEATHER_PROPERTIES = ["tavg", "tmin", "tmax", "prcp", "snow", "wdir", "wspd", "wpgt", "pres", "tsun"]
+
+
+class TokenBucket:
+    """
+    A class used to limit the rate of requests over threads.
+
+    The bucket holds at most capacity tokens and is refilled with rate tokens per second,
+    every request takes one token and waits until one is available.
+
+    Attributes
+    ----------
+    rate : float
+        The number of tokens added per second.
+    capacity : float
+        The maximum number of tokens, the size of a burst of requests.
+    """
+
+    def __init__(self, rate: float, capacity: float = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Waits until a token is available and takes it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_seconds = (1 - self._tokens) / self.rate
+            time.sleep(wait_seconds)
+
+
+def _call_with_timeout(function, timeout: float):
+    '''Function that runs function in a daemon thread and raises a TimeoutError if it does not return within timeout.
+    meteostat has no timeout of its own, so a request that times out is abandoned, not cancelled.'''
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = function()
+        except BaseException as exception:
+            outcome["exception"] = exception
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise TimeoutError(f"No response within {timeout} seconds")
+    if "exception" in outcome:
+        raise outcome["exception"]
+    return outcome["result"]
+
+
+class WeatherFetcher:
+    """
+    A class used to fetch the daily meteostat weather of many locations concurrently.
+
+    Machines are collapsed to one point per Location, and optionally snapped to a grid, so every
+    unique point is requested once and its weather is fanned out to the locations at that point.
+    The points are requested on a bounded thread pool, rate limited by a shared token bucket,
+    with a timeout and retries per point. The results are concatenated once.
+    With a weather_store, only the days missing from the store are requested.
+
+    Attributes
+    ----------
+    max_workers : int
+        The maximum number of concurrent requests.
+    rate_limiter : TokenBucket
+        The limiter every request takes a token from.
+    timeout : float
+        The maximum number of seconds per request.
+    retries : int
+        The number of times a failed request is retried, with a linearly growing backoff.
+    grid_size : float
+        The size in degrees of the grid the points are snapped to, None uses the exact coordinates.
+    requests_saved : int
+        The number of requests the last fetch saved by deduplicating the machines.
+    weather_store : WeatherStore
+        The local store of fetched weather, None requests every day of every point.
+
+    Methods
+    -------
+    weather_points(df_locations: pd.DataFrame):
+        Returns the point the weather of every location is requested for.
+    fetch_point(latitude: float, longitude: float, start: datetime.datetime, end: datetime.datetime):
+        Returns the daily weather of one point.
+    fetch(df_locations: pd.DataFrame, start: datetime.datetime, end: datetime.datetime):
+        Returns the daily weather of every location in df_locations.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS,
+                 requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+                 timeout: float = DEFAULT_TIMEOUT_SECONDS, retries: int = DEFAULT_RETRIES,
+                 retry_backoff: float = DEFAULT_RETRY_BACKOFF_SECONDS, grid_size: float = None,
+                 weather_store: WeatherStore = None) -> None:
+        self.max_workers = max_workers
+        self.rate_limiter = TokenBucket(requests_per_second)
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.grid_size = grid_size
+        self.requests_saved = 0
+        self.weather_store = weather_store if weather_store is not None else create_weather_store_from_environment()
+
+    def weather_points(self, df_locations: pd.DataFrame) -> pd.DataFrame:
+        """
+        Returns one row per Location with the Latitude and Longitude its weather is requested for:
+        the first machine with coordinates, snapped to the grid if grid_size is set.
+        Locations without coordinates (0, 0) are left out.
+        """
+        df_points = df_locations[(df_locations["Latitude"] != 0) | (df_locations["Longitude"] != 0)]
+        df_points = df_points.drop_duplicates("Location")[["Location", "Latitude", "Longitude"]]
+        if self.grid_size:
+            df_points = df_points.assign(
+                Latitude=(df_points["Latitude"] / self.grid_size).round() * self.grid_size,
+                Longitude=(df_points["Longitude"] / self.grid_size).round() * self.grid_size)
+        return df_points
+
+    def _request_point(self, latitude: float, longitude: float,
+                       start: datetime.datetime, end: datetime.datetime) -> pd.DataFrame:
+        """
+        Requests the daily weather of one point from meteostat, or returns None if every attempt failed.
+        """
+        for attempt in range(self.retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                meteo_data = _call_with_timeout(
+                    lambda: Daily(Point(latitude, longitude), start, end).aggregate('1D').fetch(), self.timeout)
+                break
+            except Exception as exception:
+                if attempt == self.retries:
+                    logging.warning(f"Weather data of point ({latitude}, {longitude}) could not be fetched: {exception}")
+                    return None
+                time.sleep(self.retry_backoff * (attempt + 1))
+
+        return meteo_data.reset_index(drop=False).rename({"temp": "tavg", "time": "SaleDate"}, axis=1)
+
+    def fetch_point(self, latitude: float, longitude: float,
+                    start: datetime.datetime, end: datetime.datetime) -> pd.DataFrame:
+        """
+        Returns the daily weather of one point with the columns SaleDate and the meteostat
+        properties (temp renamed to tavg), or None if it could not be fetched.
+        With a weather_store only the missing and recent days are requested.
+        """
+        if self.weather_store is None:
+            return self._request_point(latitude, longitude, start, end)
+
+        df_stored = self.weather_store.load(latitude, longitude)
+        fetched_ranges = []
+        for range_start, range_end in self.weather_store.missing_ranges(df_stored, start, end):
+            df_weather = self._request_point(latitude, longitude, range_start, range_end)
+            if df_weather is not None:
+                fetched_ranges.append((range_start, range_end, df_weather))
+
+        if fetched_ranges:
+            df_stored = self.weather_store.update(latitude, longitude, df_stored, fetched_ranges)
+        df_weather = self.weather_store.select(df_stored, start, end)
+        return df_weather if not df_weather.empty else None
+
+    def fetch(self, df_locations: pd.DataFrame, start: datetime.datetime, end: datetime.datetime) -> pd.DataFrame:
+        """
+        Returns the daily weather of every location in df_locations, which has the columns
+        Location, Latitude and Longitude and may have several machines per Location.
+        Locations of which the weather could not be fetched, or is not stored in offline mode, have no rows,
+        so they get missing weather instead of failing the run.
+        """
+        df_points = self.weather_points(df_locations)
+        unique_points = list(df_points[["Latitude", "Longitude"]].drop_duplicates().itertuples(index=False, name=None))
+
+        machines_with_coordinates = int(((df_locations["Latitude"] != 0) | (df_locations["Longitude"] != 0)).sum())
+        self.requests_saved = machines_with_coordinates - len(unique_points)
+        logging.info(f"Weather is requested for {len(unique_points)} unique points of {machines_with_coordinates} machines, "
+                     f"{self.requests_saved} requests saved")
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(unique_points)))) as executor:
+            futures = {point: executor.submit(self.fetch_point, *point, start, end) for point in unique_points}
+            weather_per_point = {point: future.result() for point, future in futures.items()}
+
+        df_weather_per_location = []
+        for row in df_points.itertuples():
+            df_weather = weather_per_point[(row.Latitude, row.Longitude)]
+            if df_weather is not None and not df_weather.empty:
+                df_weather_per_location.append(df_weather.assign(Location=row.Location))
+
+        logging.info(f"Weather data of {len(df_weather_per_location)} of {len(df_points)} locations is fetched")
+        if not df_weather_per_location:
+            return pd.DataFrame({"SaleDate": pd.Series(dtype="datetime64[ns]"),
+                                 **{weather_property: pd.Series(dtype="Float64") for weather_property in WEATHER_PROPERTIES},
+                                 "Location": pd.Series(dtype="object")})
+        return pd.concat(df_weather_per_location, axis=0, ignore_index=True)
@@ -0,0 +1,125 @@
+import os
+import logging
+import datetime
+import pandas as pd
+
+DEFAULT_WEATHER_STORE_DIRECTORY = "weather_store"
+# observations of the last days can still be revised, and later days are forecasts
+DEFAULT_REFRESH_DAYS = 3
+
+
+class WeatherStore:
+    """
+    A class used to keep the daily weather of every point locally, as one Parquet file per point.
+
+    A point is the (grid snapped) coordinate the WeatherFetcher requests the weather of a Location for.
+    Only the days missing from the store, and the recent days that can still change, are fetched.
+    Days without observations are stored as empty rows, so they are not requested again.
+
+    Attributes
+    ----------
+    directory : str
+        The directory of the store, with one <latitude>_<longitude>.parquet file per point.
+    refresh_days : int
+        The number of days before today from which stored weather is always fetched again.
+    offline : bool
+        If True, the weather is served from the store only and nothing is fetched.
+
+    Methods
+    -------
+    load(latitude: float, longitude: float):
+        Returns the stored weather of a point.
+    missing_ranges(df_stored: pd.DataFrame, start: datetime.datetime, end: datetime.datetime):
+        Returns the ranges of days between start and end that have to be fetched.
+    update(latitude: float, longitude: float, df_stored: pd.DataFrame, fetched_ranges: list):
+        Adds the fetched weather to the stored weather of a point and saves it.
+    select(df_stored: pd.DataFrame, start: datetime.datetime, end: datetime.datetime):
+        Returns the stored days between start and end.
+    """
+
+    def __init__(self, directory: str = DEFAULT_WEATHER_STORE_DIRECTORY,
+                 refresh_days: int = DEFAULT_REFRESH_DAYS, offline: bool = False) -> None:
+        self.directory = directory
+        self.refresh_days = refresh_days
+        self.offline = offline
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _point_path(self, latitude: float, longitude: float) -> str:
+        return os.path.join(self.directory, f"{latitude:.5f}_{longitude:.5f}.parquet")
+
+    def load(self, latitude: float, longitude: float) -> pd.DataFrame:
+        """
+        Returns the stored weather of a point, with a SaleDate column per day, or an empty frame.
+        """
+        path = self._point_path(latitude, longitude)
+        if not os.path.exists(path):
+            return pd.DataFrame({"SaleDate": pd.Series(dtype="datetime64[ns]")})
+        return pd.read_parquet(path)
+
+    def missing_ranges(self, df_stored: pd.DataFrame, start: datetime.datetime, end: datetime.datetime) -> list:
+        """
+        Returns the (first day, last day) ranges of consecutive days between start and end that are
+        not stored or are recent enough to be refreshed. In offline mode nothing is fetched.
+        """
+        days = pd.date_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize(), freq="D")
+        refresh_from = pd.Timestamp(datetime.date.today()) - pd.Timedelta(days=self.refresh_days)
+        missing_days = days[~days.isin(df_stored["SaleDate"]) | (days >= refresh_from)]
+
+        if self.offline:
+            if len(missing_days):
+                logging.warning(f"Weather store is offline, {len(missing_days)} days are missing or not refreshed")
+            return []
+
+        if missing_days.empty:
+            return []
+        # a new range starts at every gap between missing days
+        range_numbers = (missing_days.to_series().diff() != pd.Timedelta(days=1)).cumsum()
+        return [(range_days.min(), range_days.max())
+                for _, range_days in missing_days.to_series().groupby(range_numbers.values)]
+
+    def update(self, latitude: float, longitude: float, df_stored: pd.DataFrame, fetched_ranges: list) -> pd.DataFrame:
+        """
+        Adds the fetched weather to the stored weather of a point and saves it.
+
+        Parameters
+        ----------
+        df_stored : pd.DataFrame
+            The stored weather of the point, as returned by load.
+        fetched_ranges : list
+            The (first day, last day, df_weather) of every fetched range, df_weather with a SaleDate column.
+        """
+        df_fetched = []
+        for range_start, range_end, df_weather in fetched_ranges:
+            # every day of the range is stored, also the days without observations
+            days = pd.DataFrame({"SaleDate": pd.date_range(range_start, range_end, freq="D")})
+            df_fetched.append(days.merge(df_weather, on="SaleDate", how="left"))
+
+        df_updated = pd.concat([df_stored] + df_fetched, axis=0, ignore_index=True)
+        df_updated = df_updated.drop_duplicates("SaleDate", keep="last").sort_values("SaleDate", ignore_index=True)
+
+        # written to a temporary file first, as partitions in other processes can share a point
+        path = self._point_path(latitude, longitude)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        df_updated.to_parquet(temporary_path, index=False)
+        os.replace(temporary_path, path)
+        return df_updated
+
+    @staticmethod
+    def select(df_stored: pd.DataFrame, start: datetime.datetime, end: datetime.datetime) -> pd.DataFrame:
+        """
+        Returns the stored days between start and end, leaving out the days without observations.
+        """
+        in_range = (df_stored["SaleDate"] >= pd.Timestamp(start).normalize()) & (df_stored["SaleDate"] <= pd.Timestamp(end))
+        df_selected = df_stored[in_range.values]
+        df_selected = df_selected[df_selected.drop(columns=["SaleDate"]).notna().any(axis=1).values]
+        return df_selected.reset_index(drop=True)
+
+
+def create_weather_store_from_environment():
+    '''Function that creates the WeatherStore in the WEATHER_STORE_DIRECTORY environment variable, or None if it is not set.
+    WEATHER_OFFLINE=1 serves the weather from the store only.'''
+    directory = os.environ.get("WEATHER_STORE_DIRECTORY")
+    if not directory:
+        return None
+    offline = os.environ.get("WEATHER_OFFLINE", "0").lower() in ("1", "true", "yes")
+    return WeatherStore(directory, offline=offline)
@@ -28,7 +28,8 @@ class DumyModel(DeployableModel):
         # use instead of df_x, due to the encoding in the data transformer messing up the indexes. 
         
         df_prediction_hrf = self.process_prediction_to_human_readable_format(ProcessPrediction(prediction),df_p_y, df_y)
-        self.process_hrf_to_business_impact(BusinessTranslator(df_prediction_hrf))
+        self.process_hrf_to_business_impact(BusinessTranslator(df_prediction_hrf, self.aux_data_session,
+                                                              self.sales_statistics))
     
     def clean_model_data(self, cleaner_object:DataCleaner) -> pd.DataFrame:
         cleaner_object.remove_unstocked_products()
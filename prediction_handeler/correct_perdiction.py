@@ -1,24 +1,17 @@
-from azure_connectors.AzureSqlCommunicator import get_query_from_file, execute_query_and_load_results_into_dataframe,connect_azure
+from data_loader.auxiliary_data_loader import AuxDataSession
 import pandas as pd
 import datetime
 import logging
 
 
-def load_product_average_sales_per_day() -> pd.DataFrame:
-    """Returns average sales per day per productid
+def load_product_average_sales_per_day(aux_data_session: AuxDataSession = None) -> pd.DataFrame:
+    """Returns average sales per day per productid, from the aux_data_session if given
     Output:
         index: [productid, weekday]
         values: average sales
     """
-    connection = connect_azure()
-    avg_daily_sales = get_query_from_file("sql/average_daily_sales.sql")
-    df_average_sales_per_day = execute_query_and_load_results_into_dataframe(connection,  avg_daily_sales)
-    df_average_sales_per_day.dropna(inplace=True, axis=0)
-    df_average_sales_per_day['ProductId'] = df_average_sales_per_day['ProductId'].astype('int64')
-    df_average_sales_per_day.set_index(['Location','ProductId'], inplace=True)
-    
-    
-    return df_average_sales_per_day
+    aux_data_session = aux_data_session if aux_data_session is not None else AuxDataSession()
+    return aux_data_session.load_average_daily_sales()
 
 
 
@@ -66,7 +59,8 @@ def create_sales_next_week(df_average_sales_per_day:pd.DataFrame):
 
 
 def replace_statistical_outliers(df_predicted_sales:pd.DataFrame, 
-                                 standard_deviations_off = 1) -> pd.DataFrame:
+                                 standard_deviations_off = 1,
+                                 df_average_sales_per_day:pd.DataFrame = None) -> pd.DataFrame:
     """Automaticly replace predictions that are more than x standard diviations of the original model
     
     The predicted sales are imported as this has to be updated, 
@@ -77,10 +71,12 @@ def replace_statistical_outliers(df_predicted_sales:pd.DataFrame,
         - compare statistics and differences
         - update the predictions based on the outliers
     
+    df_average_sales_per_day can be passed when it is already loaded, otherwise it is queried.
     """
     df_predicted_average_sales = select_how_many_days_to_average_over(df_predicted_sales,3)
     # process the data into a workable format
-    df_average_sales_per_day = load_product_average_sales_per_day()
+    if df_average_sales_per_day is None:
+        df_average_sales_per_day = load_product_average_sales_per_day()
     df_averge_sales_next_week = create_sales_next_week(df_average_sales_per_day)
     
     # compare statistics and differences
@@ -5,9 +5,10 @@ import logging
 from datetime import datetime
 
 from zmq import has
-from azure_connectors.AzureSqlCommunicator import replace_sql_table_by_dataframe
+from azure_connectors.AzureSqlCommunicator import upsert_dataframe_delta_to_sql_table
 from azure_connectors.config import Config
-from data_loader.auxiliary_data_loader import AuxDataLoader
+from data_loader.auxiliary_data_loader import AuxDataSession
+from data_loader.sales_statistics import SalesStatistics
 from prediction_handeler.correct_perdiction import replace_statistical_outliers
 
 
@@ -15,9 +16,11 @@ import logging
 
 class BusinessTranslator:
 
-    def __init__(self, df_sales):
+    def __init__(self, df_sales, aux_data_session: AuxDataSession = None, sales_statistics: SalesStatistics = None):
         self.df_sales = df_sales
-        self.aux_data_loader = AuxDataLoader() 
+        self.aux_data_loader = aux_data_session if aux_data_session is not None else AuxDataSession()
+        # when given, the average daily sales of the outlier correction come from the statistics instead of sql
+        self.sales_statistics = sales_statistics
         # self.dev_connect_str = self.connect_to_dev_db()
 
     def connect_to_dev_db(self):
@@ -28,16 +31,28 @@ class BusinessTranslator:
         
         return dev_connect_str
     
-    def process_sales_to_business_impact(self):
+    def process_sales_to_business_impact(self, upload_mode:str = "delta"):
         """
         Process the sales data to generate business impact.
 
+        Args:
+            upload_mode (str): "delta" uploads only the rows that changed since the last upload,
+                "replace" rewrites both prediction tables.
+
         Returns:
             Tuple: A tuple containing two DataFrames - df_refill_advice and df_refill_advice_per_location.
         """
         
+        # the auxiliary datasets are independent, so they are queried concurrently up front
+        if self.sales_statistics is not None:
+            self.aux_data_loader.load_location_stock()
+            df_average_sales_per_day = self.sales_statistics.average_daily_sales()
+        else:
+            auxiliary_data = self.aux_data_loader.load_concurrently(["location_stock", "average_daily_sales"])
+            df_average_sales_per_day = auxiliary_data["average_daily_sales"]
+        
         # replace statistical outliers 
-        df_corrected_sales = replace_statistical_outliers(self.df_sales,1)
+        df_corrected_sales = replace_statistical_outliers(self.df_sales,1, df_average_sales_per_day)
         
         # translate predicted sales to missed turnover
         df_missed_sales = self.generate_lost_sales(df_corrected_sales)
@@ -60,12 +75,32 @@ class BusinessTranslator:
         # index[location, (productid)] are needed information and are dropped if not saved in columns 
         df_refill_advice.reset_index(inplace=True, drop=False)
         df_refill_advice_per_location.reset_index(inplace=True, drop=False)
-        replace_sql_table_by_dataframe(self.aux_data_loader.connection, "VoorspellingLocatieProduct", df_refill_advice, schema='datascience')
-        replace_sql_table_by_dataframe(self.aux_data_loader.connection, "VoorspellingLocatieOmzet", df_refill_advice_per_location, schema='datascience')
+        self.upload_refill_advice(df_refill_advice, df_refill_advice_per_location, upload_mode)
         
         return df_refill_advice, df_refill_advice_per_location
         
     
+    def upload_refill_advice(self, df_refill_advice:pd.DataFrame, df_refill_advice_per_location:pd.DataFrame,
+                             upload_mode:str = "delta"):
+        """
+        Upload the refill advice to the prediction tables.
+
+        Args:
+            df_refill_advice (DataFrame): refill advice per Location and ProductId.
+            df_refill_advice_per_location (DataFrame): refill advice per Location.
+            upload_mode (str): "delta" or "replace", see process_sales_to_business_impact.
+        """
+        if upload_mode not in ("delta", "replace"):
+            raise ValueError(f"Upload mode {upload_mode} not supported")
+
+        # a replace also rewrites the snapshot of the delta upload, so a later delta is diffed against the new table
+        connection = self.aux_data_loader.connection
+        force_replace = upload_mode == "replace"
+        upsert_dataframe_delta_to_sql_table(connection, "VoorspellingLocatieProduct", df_refill_advice,
+                                            ["Location", "ProductId"], schema='datascience', force_replace=force_replace)
+        upsert_dataframe_delta_to_sql_table(connection, "VoorspellingLocatieOmzet", df_refill_advice_per_location,
+                                            ["Location"], schema='datascience', force_replace=force_replace)
+    
     def generate_lost_sales(self, df_predicted_sales:pd.DataFrame)->pd.DataFrame:
         """
         Generate a dataframe with the lost sales.
@@ -130,7 +165,7 @@ class BusinessTranslator:
                 warnings.warn(f"Product {ProductId} seems to no longer be in active inventory")
                 return row * 0
             
-        gross_profit_lookup_dict = AuxDataLoader().load_gross_product_profit_lookup()
+        gross_profit_lookup_dict = self.aux_data_loader.load_gross_product_profit_lookup()
         df_turnover = df_sales.apply((lambda x : 
             calculate_turnover_per_sale(x, gross_profit_lookup_dict) ),
             axis=1) 
@@ -205,15 +240,12 @@ class BusinessTranslator:
         """
         if hasattr(self, "product_information"):
             return self.product_information
-        
-        if not hasattr(self, "location_stock"):
-            self.location_stock = self.aux_data_loader.load_location_stock()
     
-        product_information = self.location_stock.reset_index()[["ProductId","ProductName"]]
+        product_information = self.aux_data_loader.load_location_stock().reset_index()[["ProductId","ProductName"]]
         product_information = product_information.drop_duplicates(ignore_index=True)
         product_information.set_index("ProductId", inplace=True)
-        product_name_lookup_dict = dict(product_information.to_dict()["ProductName"])
-        return product_name_lookup_dict
+        self.product_information = dict(product_information.to_dict()["ProductName"])
+        return self.product_information
     
     def load_location_information(self)->pd.DataFrame:
         """
@@ -224,15 +256,12 @@ class BusinessTranslator:
         """
         if hasattr(self, "location_information"):
             return self.location_information
-        
-        if not hasattr(self, "location_stock"):
-            self.location_stock = self.aux_data_loader.load_location_stock()
     
-        location_information = self.location_stock.reset_index()[["Location","LocationName"]]
+        location_information = self.aux_data_loader.load_location_stock().reset_index()[["Location","LocationName"]]
         location_information = location_information.drop_duplicates(ignore_index=True)
         location_information.set_index("Location", inplace=True)
-        location_name_lookup_dict = dict(location_information.to_dict()["LocationName"])
-        return location_name_lookup_dict
+        self.location_information = dict(location_information.to_dict()["LocationName"])
+        return self.location_information
         
     
     def add_product_name_to_refill_advice(self, df_refill_advice:pd.DataFrame)->pd.DataFrame:
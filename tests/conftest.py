@@ -0,0 +1,6 @@
+import os
+import sys
+
+# config reads the writer login at import, the tests only write to local SQLite databases
+os.environ.setdefault("AzureFunctionWriterLoginPassword", "")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
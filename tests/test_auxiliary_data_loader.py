@@ -0,0 +1,90 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_loader.auxiliary_data_loader import AuxDataSession
+
+
+class CountingAuxDataLoader:
+    """the auxiliary data of two Locations, counting how often every dataset is loaded"""
+
+    connection = None
+
+    def __init__(self):
+        self.load_counts = {}
+
+    def _count(self, dataset_name):
+        self.load_counts[dataset_name] = self.load_counts.get(dataset_name, 0) + 1
+
+    def load_machine_information(self):
+        self._count("machine_information")
+        return pd.DataFrame({"MachineId": [1, 2], "Location": ["L1", "L2"], "Latitude": [52.0, 53.0]}) \
+            .set_index("MachineId")
+
+    def load_location_stock(self):
+        self._count("location_stock")
+        return pd.DataFrame({"Location": ["L1", "L2"], "ProductId": [1, 2], "GrossProfit": [0.5, -1.0]}) \
+            .set_index(["Location", "ProductId"])
+
+    def load_concurrently(self, dataset_names):
+        return {name: getattr(self, f"load_{name}")() for name in dataset_names}
+
+
+@pytest.fixture
+def aux_data_loader():
+    return CountingAuxDataLoader()
+
+
+def test_datasets_are_loaded_once_per_session(aux_data_loader):
+    aux_data_session = AuxDataSession(aux_data_loader)
+    aux_data_session.load_machine_information()
+    aux_data_session.load_concurrently(["machine_information", "location_stock"])
+    aux_data_session.load_location_stock()
+
+    assert aux_data_loader.load_counts == {"machine_information": 1, "location_stock": 1}
+
+
+def test_changes_of_a_stage_do_not_reach_the_memoized_data(aux_data_loader):
+    aux_data_session = AuxDataSession(aux_data_loader)
+    df_machines = aux_data_session.load_machine_information()
+    df_machines.reset_index(inplace=True)
+    df_machines["Longitude"] = 4.0
+
+    df_memoized_machines = aux_data_session.load_machine_information()
+    assert df_memoized_machines.index.name == "MachineId"
+    assert list(df_memoized_machines.columns) == ["Location", "Latitude"]
+
+
+def test_handed_out_frames_share_the_memoized_data(aux_data_loader):
+    aux_data_session = AuxDataSession(aux_data_loader)
+
+    assert np.shares_memory(aux_data_session.load_machine_information()["Latitude"].to_numpy(),
+                            aux_data_session.load_machine_information()["Latitude"].to_numpy())
+
+
+def test_gross_profit_lookup_is_read_only_and_clipped(aux_data_loader):
+    gross_profit_lookup = AuxDataSession(aux_data_loader).load_gross_product_profit_lookup()
+
+    assert dict(gross_profit_lookup) == {1: 0.5, 2: 0.0}
+    with pytest.raises(TypeError):
+        gross_profit_lookup[1] = 1.0
+
+
+def test_invalidating_the_stock_forgets_the_profit_lookup(aux_data_loader):
+    aux_data_session = AuxDataSession(aux_data_loader)
+    aux_data_session.load_gross_product_profit_lookup()
+    aux_data_session.invalidate("location_stock")
+    aux_data_session.load_gross_product_profit_lookup()
+
+    assert aux_data_loader.load_counts == {"location_stock": 2}
+
+
+def test_session_can_be_sent_to_another_process(aux_data_loader):
+    aux_data_session = AuxDataSession(aux_data_loader)
+    aux_data_session.load_machine_information()
+
+    unpickled_session = pickle.loads(pickle.dumps(aux_data_session))
+    pd.testing.assert_frame_equal(unpickled_session.load_machine_information(),
+                                  aux_data_session.load_machine_information())
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_loader.calendar_features import CALENDAR_FEATURES, CalendarFeatureTable
+from data_loader.enrich_transaction_data import DataEnricher
+
+
+@pytest.fixture
+def df_transactions():
+    rng = np.random.default_rng(0)
+    number_of_transactions = 300
+    return pd.DataFrame({
+        "Location": rng.choice(["L1", "L2"], number_of_transactions),
+        "SaleDate": pd.Timestamp("2023-12-20") + pd.to_timedelta(rng.integers(0, 80 * 24 * 60, number_of_transactions), unit="min")})
+
+
+def test_calendar_features_equal_the_features_computed_per_row(df_transactions):
+    calendar_table = CalendarFeatureTable("2023-12-01", "2024-03-31")
+
+    df_features = calendar_table.join(df_transactions, CALENDAR_FEATURES)
+
+    sale_dates = df_transactions["SaleDate"].dt
+    for feature in ["year", "month", "day", "weekday", "day_of_year"]:
+        assert (df_features[feature] == getattr(sale_dates, feature)).all(), feature
+    assert (df_features["week_of_year"] == sale_dates.isocalendar().week).all()
+    assert (df_features["is_weekend"] == (sale_dates.weekday >= 5)).all()
+    np.testing.assert_allclose(df_features["weekday_sin"], np.sin(2 * np.pi * sale_dates.weekday / 7))
+    assert df_features.index.equals(df_transactions.index)
+
+
+def test_holidays_are_flagged():
+    calendar_table = CalendarFeatureTable("2024-12-20", "2024-12-31", holidays=["2024-12-25", "2024-12-26"])
+
+    df_features = calendar_table.join(pd.DataFrame({"SaleDate": pd.to_datetime(["2024-12-24 10:00", "2024-12-25 10:00"])}),
+                                      ["is_holiday"])
+
+    assert df_features["is_holiday"].tolist() == [False, True]
+
+
+def test_days_outside_the_table_are_missing():
+    calendar_table = CalendarFeatureTable("2024-01-01", "2024-01-31")
+    sale_dates = pd.Series(pd.to_datetime(["2023-12-31 23:00", "2024-01-15 00:00", "2024-02-01 00:00", None]))
+
+    df_features = calendar_table.join(pd.DataFrame({"SaleDate": sale_dates}), ["month"])
+
+    assert df_features["month"].isna().tolist() == [True, False, True, True]
+    assert not calendar_table.covers(sale_dates)
+    assert calendar_table.covers(sale_dates[1:2])
+
+
+def test_unknown_calendar_feature_raises():
+    with pytest.raises(ValueError, match="not supported"):
+        CalendarFeatureTable("2024-01-01", "2024-01-31").join(pd.DataFrame({"SaleDate": [pd.Timestamp("2024-01-02")]}), ["hour"])
+
+
+def test_enricher_builds_a_table_that_covers_the_transactions(df_transactions):
+    data_enricher = DataEnricher(df_transactions.copy(), aux_data_session=object(), weather_fetcher=object(),
+                                 calendar_table=CalendarFeatureTable("2024-01-01", "2024-01-02"))
+
+    data_enricher.add_time_feature_column("weekday")
+    data_enricher.add_time_feature_column("hour")
+
+    assert data_enricher.calendar_table.covers(df_transactions["SaleDate"])
+    assert (data_enricher.df_transactions["weekday"] == df_transactions["SaleDate"].dt.weekday).all()
+    assert (data_enricher.df_transactions["hour"] == df_transactions["SaleDate"].dt.hour).all()
@@ -0,0 +1,110 @@
+import importlib.util
+import sys
+import textwrap
+
+import pandas as pd
+import pytest
+
+from data_loader.auxiliary_data_loader import AuxDataSession
+from data_loader.checkpoint_cache import CheckpointCache
+
+MODEL_SOURCE = '''
+import pandas as pd
+from abc_deployable_model import DeployableModel
+
+
+class CheckpointedModel(DeployableModel):
+    def __init__(self, df_model_data, aux_data_session):
+        self.n_partitions = None
+        self.aux_data_session = aux_data_session
+        self.df_model_data = df_model_data
+        self.df_p_model_data = None
+
+    def deploy(self):
+        pass
+
+    def clean_model_data(self, cleaner_object):
+        return cleaner_object.df_transactions
+
+    def enrich_model_data(self, enricher_object):
+        return enricher_object.df_transactions
+
+    @staticmethod
+    def define_target_scale():
+        return {target_scale}
+
+    def transform_model_data(self, transformer_object, train):
+        df_x, df_y = transformer_object.frequency_encode()
+        if train:
+            self.target_scale = self.define_target_scale()
+        return df_x, df_y * self.target_scale
+
+    def define_model(self):
+        pass
+
+    def train_model(self, model, df_x, df_y):
+        pass
+
+    def predict_on_model(self, model, df_p_x):
+        pass
+
+    def process_prediction_to_human_readable_format(self, prediction, process_prediction_object):
+        pass
+
+    def process_hrf_to_business_impact(self, df_sales, business_translator):
+        pass
+'''
+
+
+class StaticAuxDataLoader:
+    """the auxiliary data of two Locations, instead of the Azure SQL database"""
+
+    connection = None
+
+    def load_machine_information(self):
+        return pd.DataFrame({"MachineId": [1, 2], "Location": ["L1", "L2"], "Latitude": [52.0, 53.0],
+                             "Longitude": [4.0, 5.0]}).set_index("MachineId")
+
+    def load_location_stock(self):
+        return pd.DataFrame({"Location": ["L1", "L2"], "ProductId": [1, 1], "AvailableCount": [3, 4]}) \
+            .set_index(["Location", "ProductId"])
+
+
+def load_model_class(tmp_path, monkeypatch, version, target_scale):
+    '''Function that imports CheckpointedModel from its own file, as a model module that is edited between runs'''
+    model_path = tmp_path / f"version_{version}" / "checkpointed_model.py"
+    model_path.parent.mkdir()
+    model_path.write_text(textwrap.dedent(MODEL_SOURCE.format(target_scale=target_scale)))
+    spec = importlib.util.spec_from_file_location("checkpointed_model", model_path)
+    module = importlib.util.module_from_spec(spec)
+    monkeypatch.setitem(sys.modules, "checkpointed_model", module)
+    spec.loader.exec_module(module)
+    return module.CheckpointedModel
+
+
+@pytest.fixture
+def df_transactions():
+    return pd.DataFrame({"ProductId": [1, 2, 1, 1], "Location": ["L1", "L1", "L2", "L1"],
+                         "SaleDate": pd.to_datetime(["2024-01-01 09:00", "2024-01-01 10:00",
+                                                     "2024-01-01 11:00", "2024-01-02 09:00"])})
+
+
+def run_deployment(model_class, tmp_path, df_transactions):
+    model_class.checkpoint_cache = CheckpointCache(str(tmp_path / "checkpoints"))
+    model = model_class(df_transactions, AuxDataSession(StaticAuxDataLoader()))
+    model.transform_df_model_data_to_df_x_df_y(df_transactions, True)
+    return model.transform_df_model_data_to_df_x_df_y(df_transactions, False)
+
+
+def test_cached_training_transform_fits_the_model(tmp_path, monkeypatch, df_transactions):
+    model_class = load_model_class(tmp_path, monkeypatch, 1, 1.0)
+    df_p_x, df_p_y = run_deployment(model_class, tmp_path, df_transactions)
+
+    pd.testing.assert_frame_equal(run_deployment(model_class, tmp_path, df_transactions)[1], df_p_y)
+
+
+def test_changed_model_helper_does_not_serve_a_stale_prediction(tmp_path, monkeypatch, df_transactions):
+    _, df_p_y = run_deployment(load_model_class(tmp_path, monkeypatch, 1, 1.0), tmp_path, df_transactions)
+    _, df_p_y_rescaled = run_deployment(load_model_class(tmp_path, monkeypatch, 2, 2.0), tmp_path, df_transactions)
+
+    pd.testing.assert_frame_equal(df_p_y_rescaled, df_p_y * 2.0)
@@ -0,0 +1,85 @@
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_loader.auxiliary_data_loader import AuxDataSession
+from data_loader.clean_transaction_data import DataCleaner
+
+
+class StaticAuxDataLoader:
+    """the stock of two Locations, product 3 is no longer stocked at L1"""
+
+    connection = None
+
+    def load_location_stock(self):
+        return pd.DataFrame({"Location": ["L1", "L1", "L1", "L2", "L2", "L2"], "ProductId": [1, 2, 4, 1, 3, 4],
+                             "GrossProfit": 0.5}).set_index(["Location", "ProductId"])
+
+
+@pytest.fixture
+def df_transactions():
+    rng = np.random.default_rng(0)
+    number_of_transactions = 300
+    df_transactions = pd.DataFrame({
+        "Location": rng.choice(["L1", "L2"], number_of_transactions),
+        "ProductId": rng.integers(1, 4, number_of_transactions),
+        "SaleDate": pd.Timestamp("2024-03-01") - pd.to_timedelta(rng.integers(0, 60 * 24, number_of_transactions), unit="min"),
+        "Price": rng.choice([1.0, 2.0, np.nan], number_of_transactions, p=[0.45, 0.45, 0.1])})
+    # product 4 was last sold months ago
+    df_old_sales = pd.DataFrame({"Location": ["L1", "L2"], "ProductId": 4,
+                                 "SaleDate": pd.Timestamp("2023-11-01"), "Price": 1.0})
+    return pd.concat([df_transactions, df_old_sales], ignore_index=True)
+
+
+def clean(df_transactions, lazy):
+    data_cleaner = DataCleaner(df_transactions, aux_data_session=AuxDataSession(StaticAuxDataLoader()), lazy=lazy)
+    data_cleaner.remove_unstocked_products()
+    data_cleaner.remove_rows_containing_nan()
+    data_cleaner.remove_products_with_no_recent_sales(per_machine=True, recent_quantification=timedelta(days=30))
+    return data_cleaner
+
+
+def test_lazy_cleaning_equals_eager_cleaning(df_transactions):
+    df_lazy = clean(df_transactions, lazy=True).get_data()
+    df_eager = clean(df_transactions, lazy=False).get_data()
+
+    pd.testing.assert_frame_equal(df_lazy, df_eager)
+    assert not df_lazy["Price"].isna().any()
+    assert not ((df_lazy["Location"] == "L1") & (df_lazy["ProductId"] == 3)).any()
+    assert not (df_lazy["ProductId"] == 4).any()
+
+
+def test_lazy_cleaning_filters_only_when_the_data_is_requested(df_transactions):
+    data_cleaner = clean(df_transactions, lazy=True)
+
+    assert data_cleaner._df_transactions is df_transactions
+    assert len(data_cleaner._cleaning_plan) == 3
+
+    df_cleaned = data_cleaner.get_data()
+    assert data_cleaner._cleaning_plan == []
+    assert data_cleaner.get_data() is df_cleaned
+
+
+def test_steps_after_the_plan_is_applied_are_planned_again(df_transactions):
+    data_cleaner = DataCleaner(df_transactions, aux_data_session=AuxDataSession(StaticAuxDataLoader()), lazy=True)
+    data_cleaner.remove_rows_containing_nan()
+    df_without_nan = data_cleaner.get_data()
+    data_cleaner.remove_unstocked_products()
+
+    eager_data_cleaner = DataCleaner(df_transactions, aux_data_session=AuxDataSession(StaticAuxDataLoader()))
+    eager_data_cleaner.remove_rows_containing_nan()
+    eager_data_cleaner.remove_unstocked_products()
+
+    df_cleaned = data_cleaner.get_data()
+    pd.testing.assert_frame_equal(df_cleaned, eager_data_cleaner.get_data())
+    assert len(df_cleaned) < len(df_without_nan)
+
+
+def test_lazy_rules_share_the_sales_statistics_of_the_original_frame(df_transactions):
+    data_cleaner = clean(df_transactions, lazy=True)
+    data_cleaner.remove_products_based_on_performance(10, timedelta(hours=6), per_machine=False)
+    data_cleaner.get_data()
+
+    assert data_cleaner.sales_statistics.df_transactions is df_transactions
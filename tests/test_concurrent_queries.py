@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+import azure_connectors.AzureSqlCommunicator as AzureSqlCommunicator
+from azure_connectors.AzureSqlCommunicator import execute_queries_concurrently, \
+    execute_query_and_load_results_into_dataframe, replace_sql_table_by_dataframe
+from azure_connectors.sql_backend import SqlBackend, set_sql_backend
+from data_loader.auxiliary_data_loader import AUXILIARY_QUERY_FILES, AuxDataLoader
+
+
+@pytest.fixture
+def connection_url(tmp_path):
+    set_sql_backend(SqlBackend())
+    connection_url = f"sqlite:///{tmp_path / 'auxiliary.db'}"
+    replace_sql_table_by_dataframe(connection_url, "Machines", pd.DataFrame(
+        {"MachineId": [1, 2], "Location": ["L1", "L2"], "Latitude": [52.0, 53.0], "Longitude": [4.0, 5.0]}), schema=None)
+    replace_sql_table_by_dataframe(connection_url, "Stock", pd.DataFrame(
+        {"Location": ["L1", "L2"], "ProductId": [1, 2], "Stock": [3, 4], "GrossProfit": [0.5, -1.0]}), schema=None)
+    replace_sql_table_by_dataframe(connection_url, "AverageSales", pd.DataFrame(
+        {"Location": ["L1", "L2", "L2"], "ProductId": [1.0, 2.0, None], "AverageSales": [1.5, 2.5, 3.5]}), schema=None)
+    return connection_url
+
+
+@pytest.fixture
+def aux_data_loader(connection_url, tmp_path, monkeypatch):
+    """an AuxDataLoader on the SQLite database, with the .sql files of the datasets in the working directory"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "sql").mkdir()
+    tables = {"machine_information": "Machines", "location_stock": "Stock", "average_daily_sales": "AverageSales"}
+    for dataset_name, query_file in AUXILIARY_QUERY_FILES.items():
+        (tmp_path / query_file).write_text(f'SELECT * FROM "{tables[dataset_name]}"')
+
+    aux_data_loader = AuxDataLoader.__new__(AuxDataLoader)
+    aux_data_loader.connection = connection_url
+    return aux_data_loader
+
+
+def test_results_are_returned_by_name(connection_url):
+    named_queries = {"machines": 'SELECT * FROM "Machines"', "stock": 'SELECT * FROM "Stock"'}
+
+    results = execute_queries_concurrently(connection_url, named_queries)
+
+    assert list(results) == ["machines", "stock"]
+    for name, query in named_queries.items():
+        pd.testing.assert_frame_equal(results[name], execute_query_and_load_results_into_dataframe(connection_url, query))
+
+
+def test_no_more_than_max_concurrent_queries_run_at_once(monkeypatch):
+    lock = threading.Lock()
+    running = {"now": 0, "most": 0}
+
+    def slow_query(connection_url, query):
+        with lock:
+            running["now"] += 1
+            running["most"] = max(running["most"], running["now"])
+        time.sleep(0.05)
+        with lock:
+            running["now"] -= 1
+        return pd.DataFrame({"query": [query]})
+
+    monkeypatch.setattr(AzureSqlCommunicator, "execute_query_and_load_results_into_dataframe", slow_query)
+    results = execute_queries_concurrently("sqlite://", {str(number): str(number) for number in range(6)},
+                                           max_concurrent_queries=2)
+
+    assert running["most"] == 2
+    assert [df_result["query"][0] for df_result in results.values()] == [str(number) for number in range(6)]
+
+
+def test_no_queries_return_no_results():
+    assert execute_queries_concurrently("sqlite://", {}) == {}
+
+
+def test_concurrently_loaded_datasets_equal_the_separately_loaded_datasets(aux_data_loader):
+    datasets = aux_data_loader.load_concurrently(list(AUXILIARY_QUERY_FILES))
+
+    pd.testing.assert_frame_equal(datasets["machine_information"], aux_data_loader.load_machine_information())
+    pd.testing.assert_frame_equal(datasets["location_stock"], aux_data_loader.load_location_stock())
+    pd.testing.assert_frame_equal(datasets["average_daily_sales"], aux_data_loader.load_average_daily_sales())
+    assert datasets["average_daily_sales"].index.names == ["Location", "ProductId"]
+    assert len(datasets["average_daily_sales"]) == 2
+
+
+def test_a_failing_query_fails_the_whole_load(aux_data_loader, tmp_path):
+    (tmp_path / AUXILIARY_QUERY_FILES["location_stock"]).write_text('SELECT * FROM "UnknownTable"')
+
+    with pytest.raises(Exception, match="Failed to execute queries"):
+        aux_data_loader.load_concurrently(["machine_information", "location_stock"])
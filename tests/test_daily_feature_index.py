@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_loader.daily_feature_index import DailyFeatureIndex
+from data_loader.enrich_transaction_data import DataEnricher
+
+
+@pytest.fixture
+def df_features():
+    days = pd.date_range("2024-01-01", "2024-01-10", freq="D")
+    df_features = pd.DataFrame({"Location": np.repeat(["L1", "L2"], len(days)), "SaleDate": np.tile(days, 2),
+                                "tavg": np.arange(2 * len(days), dtype="float64")})
+    # L2 has no features on 2024-01-05
+    return df_features[~((df_features["Location"] == "L2") & (df_features["SaleDate"] == "2024-01-05"))]
+
+
+@pytest.fixture
+def df_transactions():
+    rng = np.random.default_rng(0)
+    number_of_transactions = 200
+    return pd.DataFrame({
+        "Location": rng.choice(["L1", "L2", "L3"], number_of_transactions),
+        "SaleDate": pd.Timestamp("2023-12-30") + pd.to_timedelta(rng.integers(0, 15 * 24 * 60, number_of_transactions), unit="min"),
+        "ProductId": rng.integers(1, 5, number_of_transactions)})
+
+
+def merge_features(df_transactions, df_features, feature_columns):
+    df_merged = df_transactions.assign(_day=df_transactions["SaleDate"].dt.normalize()).merge(
+        df_features.rename(columns={"SaleDate": "_day"}), on=["Location", "_day"], how="left")
+    return df_merged[feature_columns]
+
+
+def test_join_equals_a_merge_on_location_and_day(df_features, df_transactions):
+    df_joined = DailyFeatureIndex(df_features).join(df_transactions, ["tavg"])
+
+    pd.testing.assert_frame_equal(df_joined.reset_index(drop=True), merge_features(df_transactions, df_features, ["tavg"]))
+    assert df_joined.index.equals(df_transactions.index)
+
+
+def test_categorical_locations_are_joined_like_strings(df_features, df_transactions):
+    daily_feature_index = DailyFeatureIndex(df_features)
+    df_categorical_transactions = df_transactions.astype({"Location": pd.CategoricalDtype(["L3", "L2", "L1", "L4"])})
+
+    pd.testing.assert_frame_equal(daily_feature_index.join(df_categorical_transactions, ["tavg"]),
+                                  daily_feature_index.join(df_transactions, ["tavg"]))
+
+
+def test_transactions_without_features_get_missing_features(df_features):
+    df_transactions = pd.DataFrame({"Location": ["L2", "L3", "L1", "L1", "L1"],
+                                    "SaleDate": pd.to_datetime(["2024-01-05 12:00", "2024-01-02 00:00", "2023-12-31 00:00",
+                                                                "2024-01-11 00:00", None])})
+
+    positions = DailyFeatureIndex(df_features).row_positions(df_transactions)
+
+    assert positions.tolist() == [-1] * 5
+
+
+def test_last_row_of_a_location_and_day_is_used():
+    df_features = pd.DataFrame({"Location": ["L1", "L1"], "SaleDate": pd.to_datetime(["2024-01-01 00:00", "2024-01-01 18:00"]),
+                                "holiday": [False, True]})
+
+    df_joined = DailyFeatureIndex(df_features).join(
+        pd.DataFrame({"Location": ["L1"], "SaleDate": pd.to_datetime(["2024-01-01 09:00"])}), ["holiday"])
+
+    assert df_joined["holiday"].tolist() == [True]
+
+
+def test_empty_features_join_missing_values(df_transactions):
+    df_features = pd.DataFrame({"Location": pd.Series(dtype="object"), "SaleDate": pd.Series(dtype="datetime64[ns]"),
+                                "tavg": pd.Series(dtype="float64")})
+
+    df_joined = DailyFeatureIndex(df_features).join(df_transactions, ["tavg"])
+
+    assert len(df_joined) == len(df_transactions)
+    assert df_joined["tavg"].isna().all()
+
+
+def test_enricher_adds_the_daily_features_under_their_new_names(df_features, df_transactions):
+    data_enricher = DataEnricher(df_transactions.copy(), aux_data_session=object(), weather_fetcher=object())
+
+    df_enriched = data_enricher.add_daily_features(DailyFeatureIndex(df_features), ["SaleDate", "tavg"],
+                                                   {"SaleDate": "SaleDate_date"})
+
+    assert list(df_enriched.columns) == ["Location", "SaleDate", "ProductId", "SaleDate_date", "tavg"]
+    pd.testing.assert_series_equal(df_enriched["tavg"], merge_features(df_transactions, df_features, ["tavg"])["tavg"])
@@ -0,0 +1,87 @@
+import pandas as pd
+import pytest
+
+from abc_deployable_model import DeployableModel, _enrich_partition
+from data_loader.auxiliary_data_loader import AuxDataSession
+from data_loader.weather_fetcher import DEFAULT_REQUESTS_PER_SECOND
+
+
+class StaticAuxDataLoader:
+    """the auxiliary data of three Locations, instead of the Azure SQL database"""
+
+    connection = None
+
+    def load_machine_information(self):
+        return pd.DataFrame({"MachineId": [1, 2, 3], "Location": ["L1", "L2", "L3"], "Latitude": [52.0, 53.0, 51.0],
+                             "Longitude": [4.0, 5.0, 6.0]}).set_index("MachineId")
+
+    def load_location_stock(self):
+        return pd.DataFrame({"Location": ["L1", "L2", "L3"], "ProductId": [1, 1, 1], "AvailableCount": [3, 4, 5]}) \
+            .set_index(["Location", "ProductId"])
+
+    def load_concurrently(self, dataset_names):
+        return {name: getattr(self, f"load_{name}")() for name in dataset_names}
+
+
+class WeatherRateModel(DeployableModel):
+    """a model whose enrichment records the request rate of its weather fetcher"""
+
+    def __init__(self, df_model_data):
+        self.n_partitions = None
+        self.aux_data_session = AuxDataSession(StaticAuxDataLoader())
+        self.df_model_data = df_model_data
+        self.df_p_model_data = None
+
+    def deploy(self):
+        pass
+
+    def clean_model_data(self, cleaner_object):
+        return cleaner_object.df_transactions
+
+    def enrich_model_data(self, enricher_object):
+        return enricher_object.df_transactions.assign(
+            WeatherRequestsPerSecond=enricher_object.weather_fetcher.rate_limiter.rate)
+
+    def transform_model_data(self, transformer_object, train):
+        return transformer_object.frequency_encode()
+
+    def define_model(self):
+        pass
+
+    def train_model(self, model, df_x, df_y):
+        pass
+
+    def predict_on_model(self, model, df_p_x):
+        pass
+
+    def process_prediction_to_human_readable_format(self, prediction, process_prediction_object):
+        pass
+
+    def process_hrf_to_business_impact(self, df_sales, business_translator):
+        pass
+
+
+@pytest.fixture
+def df_transactions():
+    return pd.DataFrame({"ProductId": [1, 2, 1, 1, 2], "Location": ["L2", "L1", "L3", "L1", "L2"],
+                         "SaleDate": pd.to_datetime(["2024-01-01 09:00", "2024-01-01 10:00", "2024-01-01 11:00",
+                                                     "2024-01-02 09:00", "2024-01-02 10:00"])},
+                        index=[10, 11, 12, 13, 14])
+
+
+def test_single_process_enrichment_requests_weather_at_the_configured_rate(df_transactions):
+    df_enriched = _enrich_partition(WeatherRateModel(df_transactions), df_transactions)
+
+    assert (df_enriched["WeatherRequestsPerSecond"] == DEFAULT_REQUESTS_PER_SECOND).all()
+
+
+def test_partitions_share_the_weather_request_rate(df_transactions):
+    df_enriched = WeatherRateModel(df_transactions).enrich_partitioned_by_location(df_transactions, 2)
+
+    assert (df_enriched["WeatherRequestsPerSecond"] == DEFAULT_REQUESTS_PER_SECOND / 2).all()
+
+
+def test_partitioned_enrichment_keeps_the_row_order_and_index(df_transactions):
+    df_enriched = WeatherRateModel(df_transactions).enrich_partitioned_by_location(df_transactions, 2)
+
+    pd.testing.assert_frame_equal(df_enriched.drop(columns=["WeatherRequestsPerSecond"]), df_transactions)
@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+
+from data_loader.auxiliary_data_loader import AuxDataSession
+from data_loader.enrich_transaction_data import DataEnricher
+from data_loader.transaction_data_loader import apply_transaction_schema
+
+
+@pytest.fixture
+def df_transactions():
+    return apply_transaction_schema(pd.DataFrame({
+        "ProductId": [1, 2, 1, 3], "MachineId": [7, 7, 8, 8], "Location": ["L1", "L1", "L2", "L2"],
+        "ProductName": ["Cola", "Chips", "Cola", "Water"],
+        "SaleDate": pd.to_datetime(["2024-01-01 09:00", "2024-01-03 10:00", "2024-01-01 11:00", "2024-01-02 12:00"])}))
+
+
+def add_missing_days(df_transactions, fill_policies=None):
+    return DataEnricher(df_transactions, AuxDataSession()).add_missing_days(fill_policies)
+
+
+def test_missing_days_are_added_per_location(df_transactions):
+    df_enriched = add_missing_days(df_transactions)
+
+    assert list(zip(df_enriched["Location"], df_enriched["SaleDate"].dt.day)) == \
+        [("L1", 1), ("L1", 2), ("L1", 3), ("L2", 1), ("L2", 2)]
+    assert df_enriched["ProductId"].isna().sum() == 1
+
+
+def test_filled_columns_keep_their_dtype(df_transactions):
+    df_enriched = add_missing_days(df_transactions, {"ProductId": 0, "MachineId": "ffill", "ProductName": "None"})
+
+    assert df_enriched.dtypes[["ProductId", "MachineId"]].tolist() == df_transactions.dtypes[["ProductId", "MachineId"]].tolist()
+    assert isinstance(df_enriched["ProductName"].dtype, pd.CategoricalDtype)
+    added_day = df_enriched[df_enriched["SaleDate"] == pd.Timestamp("2024-01-02")].iloc[0]
+    assert (added_day["ProductId"], added_day["MachineId"], added_day["ProductName"]) == (0, 7, "None")
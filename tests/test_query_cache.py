@@ -0,0 +1,120 @@
+import os
+import time
+from datetime import timedelta
+
+import pandas as pd
+import pytest
+
+from azure_connectors.AzureSqlCommunicator import execute_query_and_load_results_into_dataframe, \
+    replace_sql_table_by_dataframe
+from azure_connectors.query_cache import QueryCache, disable_query_cache, enable_query_cache
+from azure_connectors.query_metrics import LogMetricsSink, set_metrics_sinks
+from azure_connectors.sql_backend import SqlBackend, set_sql_backend
+
+
+class CollectingMetricsSink:
+    """a sink that keeps every emitted QueryMetrics"""
+
+    def __init__(self):
+        self.query_metrics = []
+
+    def emit(self, query_metrics):
+        self.query_metrics.append(query_metrics)
+
+
+@pytest.fixture
+def query_cache(tmp_path):
+    return QueryCache(directory=str(tmp_path / "query_cache"))
+
+
+@pytest.fixture
+def df_result():
+    return pd.DataFrame({"Location": ["L1", "L2"], "ProductId": [1, 2], "Stock": [3.0, 4.0]})
+
+
+def age_entry(query_cache, key, seconds):
+    written_at = time.time() - seconds
+    os.utime(query_cache._path(key), (written_at, written_at))
+
+
+def test_cached_result_is_served_until_its_ttl_passes(query_cache, df_result):
+    key = query_cache.create_key("sqlite://", "SELECT 1")
+    query_cache.put(key, df_result)
+
+    pd.testing.assert_frame_equal(query_cache.get(key, timedelta(minutes=10)), df_result)
+
+    age_entry(query_cache, key, 11 * 60)
+    assert query_cache.get(key, timedelta(minutes=10)) is None
+
+
+def test_ttl_is_looked_up_by_query_file_name(query_cache):
+    assert query_cache.get_ttl("sql_queries/machine_data.sql") == timedelta(days=1)
+    assert query_cache.get_ttl("sql_queries/unknown.sql") == query_cache.default_ttl
+    assert query_cache.get_ttl(None) == query_cache.default_ttl
+
+
+def test_key_depends_on_connection_query_and_params():
+    key = QueryCache.create_key("sqlite://", "SELECT * FROM t WHERE a = :a", {"a": 1})
+
+    assert key == QueryCache.create_key("sqlite://", "SELECT * FROM t WHERE a = :a", {"a": 1})
+    assert key != QueryCache.create_key("sqlite://", "SELECT * FROM t WHERE a = :a", {"a": 2})
+    assert key != QueryCache.create_key("sqlite:///other.db", "SELECT * FROM t WHERE a = :a", {"a": 1})
+
+
+def test_force_refresh_never_serves_but_still_stores(tmp_path, df_result):
+    query_cache = QueryCache(directory=str(tmp_path / "query_cache"), force_refresh=True)
+    key = query_cache.create_key("sqlite://", "SELECT 1")
+    query_cache.put(key, df_result)
+
+    assert query_cache.get(key) is None
+    assert os.path.exists(query_cache._path(key))
+
+
+def test_least_recently_used_results_are_evicted(tmp_path, df_result):
+    query_cache = QueryCache(directory=str(tmp_path / "query_cache"))
+    keys = [query_cache.create_key("sqlite://", f"SELECT {number}") for number in range(3)]
+    for key in keys:
+        query_cache.put(key, df_result)
+    entry_size = os.path.getsize(query_cache._path(keys[0]))
+
+    # the first result is used most recently, the second is the least recently used
+    for seconds_ago, key in zip([10, 30, 20], keys):
+        used_at = time.time() - seconds_ago
+        os.utime(query_cache._path(key), (used_at, os.path.getmtime(query_cache._path(key))))
+    query_cache.max_size_bytes = int(2.5 * entry_size)
+    query_cache.evict()
+
+    assert [os.path.exists(query_cache._path(key)) for key in keys] == [True, False, True]
+
+
+def test_evicted_result_is_a_miss(query_cache, df_result):
+    key = query_cache.create_key("sqlite://", "SELECT 1")
+    query_cache.put(key, df_result)
+    os.remove(query_cache._path(key))
+
+    assert query_cache.get(key) is None
+
+
+def test_put_leaves_no_temporary_files(query_cache, df_result):
+    query_cache.put(query_cache.create_key("sqlite://", "SELECT 1"), df_result)
+    query_cache.put(query_cache.create_key("sqlite://", "SELECT 2"), pd.DataFrame({"Mixed": [1, "a"]}))
+
+    assert [file_name for file_name in os.listdir(query_cache.directory) if not file_name.endswith(".parquet")] == []
+
+
+def test_second_query_is_served_from_the_cache(tmp_path, df_result):
+    set_sql_backend(SqlBackend())
+    connection_url = f"sqlite:///{tmp_path / 'cache.db'}"
+    replace_sql_table_by_dataframe(connection_url, "Stock", df_result, schema=None)
+    metrics_sink = CollectingMetricsSink()
+    set_metrics_sinks([metrics_sink])
+    enable_query_cache(directory=str(tmp_path / "query_cache"))
+    try:
+        df_first = execute_query_and_load_results_into_dataframe(connection_url, 'SELECT * FROM "Stock"')
+        df_second = execute_query_and_load_results_into_dataframe(connection_url, 'SELECT * FROM "Stock"')
+    finally:
+        disable_query_cache()
+        set_metrics_sinks([LogMetricsSink()])
+
+    pd.testing.assert_frame_equal(df_second, df_first)
+    assert [query_metrics.cache for query_metrics in metrics_sink.query_metrics] == ["miss", "hit"]
@@ -0,0 +1,73 @@
+import pandas as pd
+import pytest
+
+from azure_connectors.AzureSqlCommunicator import append_dataframe_to_sql_table, \
+    bulk_replace_sql_table_by_dataframe, execute_query_and_load_results_into_dataframe, \
+    replace_sql_table_by_dataframe, upsert_dataframe_delta_to_sql_table
+from azure_connectors.query_metrics import LogMetricsSink, set_metrics_sinks
+from azure_connectors.sql_backend import SqlBackend, set_sql_backend
+
+
+class CollectingMetricsSink:
+    """a sink that keeps every emitted QueryMetrics"""
+
+    def __init__(self):
+        self.query_metrics = []
+
+    def emit(self, query_metrics):
+        self.query_metrics.append(query_metrics)
+
+
+@pytest.fixture
+def metrics_sink():
+    metrics_sink = CollectingMetricsSink()
+    set_metrics_sinks([metrics_sink])
+    yield metrics_sink
+    set_metrics_sinks([LogMetricsSink()])
+
+
+@pytest.fixture
+def connection_url(tmp_path):
+    set_sql_backend(SqlBackend())
+    return f"sqlite:///{tmp_path / 'metrics.db'}"
+
+
+@pytest.fixture
+def df_advice():
+    return pd.DataFrame({"Location": ["L1", "L2"], "ProductId": [1, 2], "Advice": [1.0, 2.0]})
+
+
+def test_every_write_emits_its_metrics(connection_url, metrics_sink, df_advice, tmp_path):
+    replace_sql_table_by_dataframe(connection_url, "Advice", df_advice, schema=None)
+    append_dataframe_to_sql_table(connection_url, "Advice", df_advice, schema=None)
+    bulk_replace_sql_table_by_dataframe(connection_url, "Advice", df_advice, schema=None,
+                                        snapshot_directory=str(tmp_path / "snapshots"))
+
+    assert [query_metrics.query_file for query_metrics in metrics_sink.query_metrics] == ["<write None.Advice>"] * 3
+    assert all(query_metrics.rows == 2 and query_metrics.execute_seconds > 0
+               for query_metrics in metrics_sink.query_metrics)
+
+
+def test_delta_upload_emits_the_metrics_of_the_delta(connection_url, metrics_sink, df_advice, tmp_path):
+    upsert_dataframe_delta_to_sql_table(connection_url, "Advice", df_advice, ["Location", "ProductId"], schema=None,
+                                        snapshot_directory=str(tmp_path / "snapshots"))
+    upsert_dataframe_delta_to_sql_table(connection_url, "Advice", df_advice.assign(Advice=[1.0, 5.0]),
+                                        ["Location", "ProductId"], schema=None,
+                                        snapshot_directory=str(tmp_path / "snapshots"))
+
+    assert [query_metrics.rows for query_metrics in metrics_sink.query_metrics] == [2, 1]
+
+
+def test_failed_write_still_emits_its_metrics(connection_url, metrics_sink, df_advice):
+    append_dataframe_to_sql_table(connection_url, "Advice", df_advice, schema="unknown_schema")
+
+    assert len(metrics_sink.query_metrics) == 1
+    assert metrics_sink.query_metrics[0].rows == 0
+
+
+def test_queries_emit_their_metrics(connection_url, metrics_sink, df_advice):
+    replace_sql_table_by_dataframe(connection_url, "Advice", df_advice, schema=None)
+    execute_query_and_load_results_into_dataframe(connection_url, 'SELECT * FROM "Advice"')
+
+    assert metrics_sink.query_metrics[-1].query_file == "<inline>"
+    assert metrics_sink.query_metrics[-1].rows == 2
@@ -0,0 +1,50 @@
+import os
+
+import pandas as pd
+import pytest
+
+from azure_connectors.AzureSqlCommunicator import dispose_engines, get_engine
+from azure_connectors.sql_backend import ReplaySqlBackend, create_recording_key, set_sql_backend
+from data_loader.auxiliary_data_loader import AuxDataSession
+from prediction_handeler.predicted_sales_impact_uploader import BusinessTranslator
+
+
+@pytest.fixture
+def replay_backend(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "sql_recordings").mkdir()
+    replay_backend = ReplaySqlBackend(str(tmp_path / "sql_recordings"))
+    set_sql_backend(replay_backend)
+    yield replay_backend
+    dispose_engines()
+
+
+def test_replay_run_writes_the_prediction_tables(replay_backend):
+    df_refill_advice = pd.DataFrame({"Location": ["L1", "L1", "L2"], "ProductId": [1, 2, 1], "Advice": [1.0, 0.0, 3.0]})
+    df_refill_advice_per_location = pd.DataFrame({"Location": ["L1", "L2"], "Advice": [1.0, 3.0]})
+    business_translator = BusinessTranslator(None, aux_data_session=AuxDataSession())
+
+    for upload_mode in ("replace", "delta"):
+        business_translator.upload_refill_advice(df_refill_advice, df_refill_advice_per_location, upload_mode)
+
+        engine = get_engine(business_translator.aux_data_loader.connection)
+        pd.testing.assert_frame_equal(pd.read_sql('SELECT * FROM datascience."VoorspellingLocatieProduct"', engine),
+                                      df_refill_advice)
+        pd.testing.assert_frame_equal(pd.read_sql('SELECT * FROM datascience."VoorspellingLocatieOmzet"', engine),
+                                      df_refill_advice_per_location)
+
+
+def test_replay_writes_go_to_the_local_database(replay_backend):
+    assert str(get_engine(None).url) == replay_backend.write_database_url
+
+
+def test_replayed_chunks_of_a_query_recorded_in_one_go_are_typed(replay_backend):
+    query = "SELECT ProductId, SaleDate FROM Sales"
+    pd.DataFrame({"ProductId": [1.0, 2.0, 3.0], "SaleDate": ["2024-01-01 09:00", "2024-01-02 10:00", "2024-01-03 11:00"]}) \
+        .to_parquet(os.path.join(replay_backend.directory, f"{create_recording_key(query)}.parquet"))
+
+    df_chunks = list(replay_backend.read_dataframe_chunks(None, query, 2, dtype={"ProductId": "int64"},
+                                                          parse_dates=["SaleDate"]))
+
+    assert [len(df_chunk) for df_chunk in df_chunks] == [2, 1]
+    assert all(df_chunk.dtypes.to_dict() == {"ProductId": "int64", "SaleDate": "datetime64[ns]"} for df_chunk in df_chunks)
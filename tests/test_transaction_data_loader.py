@@ -0,0 +1,34 @@
+import pytest
+
+from data_loader.transaction_data_loader import create_incremental_transactions_query
+
+
+def test_incremental_query_filters_the_transaction_query():
+    query = create_incremental_transactions_query("SELECT * FROM Sales;\n")
+
+    assert query == "SELECT * FROM (SELECT * FROM Sales\n) AS transactions WHERE SaleDate >= ?"
+
+
+def test_incremental_query_keeps_a_trailing_line_comment_inside_the_derived_table():
+    query = create_incremental_transactions_query("SELECT * FROM Sales -- all sales")
+
+    assert query.endswith("-- all sales\n) AS transactions WHERE SaleDate >= ?")
+
+
+@pytest.mark.parametrize("transaction_query", [
+    "WITH Recent AS (SELECT * FROM Sales) SELECT * FROM Recent",
+    "SELECT * FROM Sales ORDER BY SaleDate",
+])
+def test_incremental_query_rejects_queries_that_can_not_be_a_derived_table(transaction_query):
+    with pytest.raises(ValueError):
+        create_incremental_transactions_query(transaction_query)
+
+
+@pytest.mark.parametrize("transaction_query", [
+    "SELECT TOP 100 * FROM Sales ORDER BY SaleDate",
+    "SELECT * FROM (SELECT TOP 10 * FROM Sales ORDER BY SaleDate) AS s",
+    "SELECT 'ORDER BY' AS Label FROM Sales",
+    "SELECT * FROM Sales /* ORDER BY SaleDate */",
+])
+def test_incremental_query_accepts_order_by_in_top_queries_subqueries_and_literals(transaction_query):
+    assert create_incremental_transactions_query(transaction_query).endswith("WHERE SaleDate >= ?")
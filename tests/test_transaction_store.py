@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+
+from data_loader.transaction_data_loader import REQUIRED_TRANSACTION_COLUMNS, apply_transaction_schema
+from data_loader.transaction_store import TransactionStore
+
+
+def create_transactions(sale_dates, product_ids=None):
+    product_ids = product_ids if product_ids is not None else list(range(1, len(sale_dates) + 1))
+    return apply_transaction_schema(pd.DataFrame({
+        "ProductId": product_ids, "ProductName": [f"Product {product_id}" for product_id in product_ids],
+        "PackagingType": "Can", "Brand": "Brand", "ProductCategory": "Drinks", "GrossProfit": 0.5,
+        "SaleDate": pd.to_datetime(sale_dates), "MachineId": 1, "MachineName": "Machine", "Latitude": 52.0,
+        "Longitude": 4.0, "Location": "L1", "LocationType": "Office", "Environment": "Indoor",
+        "InServiceHours": "8-17", "InServiceDays": "Mon-Fri"})[REQUIRED_TRANSACTION_COLUMNS])
+
+
+@pytest.fixture
+def transaction_store(tmp_path):
+    return TransactionStore(str(tmp_path / "transaction_store"))
+
+
+def test_appended_chunks_equal_a_full_replace(tmp_path, transaction_store):
+    df_transactions = create_transactions(["2024-01-30", "2024-02-02", "2024-01-31", "2024-02-01", "2024-03-01"])
+    full_store = TransactionStore(str(tmp_path / "full_store"))
+    full_store.replace_from(None, df_transactions)
+
+    transaction_store.append(df_transactions.iloc[:2])
+    transaction_store.append(df_transactions.iloc[2:])
+
+    pd.testing.assert_frame_equal(transaction_store.load(), full_store.load())
+    assert transaction_store.high_water_mark() == pd.Timestamp("2024-03-01")
+
+
+def test_replace_from_replaces_only_the_transactions_since(transaction_store):
+    transaction_store.replace_from(None, create_transactions(["2024-01-10", "2024-02-10", "2024-02-20"], [1, 2, 3]))
+
+    transaction_store.replace_from(pd.Timestamp("2024-02-15"), create_transactions(["2024-02-15", "2024-03-01"], [4, 5]))
+
+    df_stored = transaction_store.load()
+    assert df_stored["ProductId"].tolist() == [1, 2, 4, 5]
+    assert df_stored["SaleDate"].is_monotonic_increasing
+
+
+def test_empty_first_load_leaves_an_empty_store(transaction_store):
+    transaction_store.replace_from(None, pd.DataFrame(columns=REQUIRED_TRANSACTION_COLUMNS))
+
+    assert transaction_store.is_empty()
+    assert transaction_store.high_water_mark() is None
+    assert transaction_store.load()["SaleDate"].dtype == "datetime64[ns]"
+
+
+def test_empty_replace_removes_the_transactions_since(transaction_store):
+    transaction_store.replace_from(None, create_transactions(["2024-01-10", "2024-02-10", "2024-02-20"], [1, 2, 3]))
+
+    transaction_store.replace_from(pd.Timestamp("2024-02-01"), pd.DataFrame(columns=REQUIRED_TRANSACTION_COLUMNS))
+
+    df_stored = transaction_store.load()
+    assert df_stored["ProductId"].tolist() == [1]
+    assert df_stored["ProductId"].dtype == "int8"
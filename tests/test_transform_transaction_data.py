@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_loader.transaction_data_loader import apply_transaction_schema
+from data_loader.transform_transaction_data import DataTransformer, StreamingFrequencyEncoder
+
+
+@pytest.fixture
+def df_transactions():
+    rng = np.random.default_rng(0)
+    number_of_transactions = 400
+    df_transactions = apply_transaction_schema(pd.DataFrame({
+        "ProductId": rng.integers(1, 8, number_of_transactions),
+        "Location": rng.choice(["L1", "L2", "L3"], number_of_transactions),
+        "Latitude": 52.0, "Longitude": 4.0,
+        "SaleDate": pd.Timestamp("2024-01-01") + pd.to_timedelta(
+            np.sort(rng.integers(0, 20 * 24 * 60, number_of_transactions)), unit="min")}))
+    return df_transactions.assign(tavg=df_transactions["SaleDate"].dt.day.astype("float64"),
+                                  weekday=df_transactions["SaleDate"].dt.weekday)
+
+
+def split_in_chunks(df_transactions, chunk_size):
+    return [df_transactions.iloc[start:start + chunk_size] for start in range(0, len(df_transactions), chunk_size)]
+
+
+@pytest.mark.parametrize("compact_after_parts", [1, 3, 100])
+def test_streaming_encoding_equals_the_batch_encoding(df_transactions, compact_after_parts):
+    df_x, df_y = DataTransformer(df_transactions).frequency_encode()
+
+    encoder = StreamingFrequencyEncoder(compact_after_parts=compact_after_parts)
+    for df_chunk in split_in_chunks(df_transactions, 37):
+        encoder.update(df_chunk)
+    df_streamed_x, df_streamed_y = encoder.result()
+
+    pd.testing.assert_frame_equal(df_streamed_x, df_x)
+    pd.testing.assert_frame_equal(df_streamed_y, df_y.astype("float64"), check_like=True)
+
+
+def test_streaming_encoder_compacts_its_partial_results(df_transactions):
+    encoder = StreamingFrequencyEncoder(compact_after_parts=3)
+    for df_chunk in split_in_chunks(df_transactions, 37):
+        encoder.update(df_chunk)
+
+    assert len(encoder._df_groups_parts) <= 3
+    assert len(encoder._product_counts_parts) <= 3
+
+
+def test_repeated_results_are_equal(df_transactions):
+    encoder = StreamingFrequencyEncoder()
+    for df_chunk in split_in_chunks(df_transactions, 100):
+        encoder.update(df_chunk)
+
+    df_x, df_y = encoder.result()
+    pd.testing.assert_frame_equal(encoder.result()[0], df_x)
+    pd.testing.assert_frame_equal(encoder.result()[1], df_y)
+
+
+
+def test_sparse_target_equals_the_dense_target(df_transactions):
+    _, df_y = DataTransformer(df_transactions).frequency_encode()
+    _, sparse_y = DataTransformer(df_transactions).frequency_encode(sparse_target=True)
+
+    pd.testing.assert_frame_equal(sparse_y.to_dense(), df_y, check_like=True, check_dtype=False,
+                                  check_column_type=False, check_names=False)
+
+
+
+def test_sparse_target_counts_the_sales_per_group_and_product():
+    df_transactions = pd.DataFrame({
+        "ProductId": [3, 1, 3, 3, np.nan], "Location": ["L1", "L1", "L1", "L2", "L2"],
+        "SaleDate": pd.to_datetime(["2024-01-01 09:00", "2024-01-01 10:00", "2024-01-01 11:00",
+                                    "2024-01-01 12:00", "2024-01-02 00:00"])})
+
+    df_x, sparse_y = DataTransformer(df_transactions).frequency_encode(sparse_target=True)
+
+    assert sparse_y.columns.tolist() == [1, 3]
+    # the added day of L2 without a ProductId is a group without sales
+    assert sparse_y.matrix.toarray().tolist() == [[1, 2], [0, 1], [0, 0]]
+    assert sparse_y.matrix.nnz == 3
+    assert sparse_y.index.equals(df_x.index)
+
+
+def test_x_takes_the_location_attributes_from_the_location_dimension(df_transactions):
+    df_locations = pd.DataFrame({"MachineId": [1, 2, 3, 4], "Location": ["L1", "L1", "L2", "L3"],
+                                 "LocationType": ["Office", "School", "Station", "Office"], "Latitude": [52.0, 52.5, 53.0, 54.0]})
+
+    df_x, _ = DataTransformer(df_transactions, df_locations).frequency_encode()
+
+    assert list(df_x.columns) == ["Latitude", "LocationType", "tavg", "weekday"]
+    locations = df_x.index.get_level_values(1)
+    assert (df_x["LocationType"] == locations.map({"L1": "Office", "L2": "Station", "L3": "Office"})).all()
+    assert (df_x["Latitude"] == locations.map({"L1": 52.0, "L2": 53.0, "L3": 54.0}).astype("float64")).all()
+
+
+def test_x_has_the_daily_features_of_the_first_transaction_of_every_group(df_transactions):
+    df_x, _ = DataTransformer(df_transactions).frequency_encode()
+
+    df_first = df_transactions.groupby([df_transactions["SaleDate"].dt.floor("D"), "Location"], observed=True).first()
+    assert df_x["tavg"].tolist() == df_first["tavg"].tolist()
+    assert df_x[["Latitude", "Longitude"]].notna().all().all()
+
+
+def test_declared_daily_columns_are_in_x_and_undeclared_columns_are_warned_for(df_transactions, caplog):
+    df_transactions = df_transactions.assign(is_holiday=False, SaleDate_date=df_transactions["SaleDate"].dt.normalize())
+
+    df_x, _ = DataTransformer(df_transactions).frequency_encode()
+    assert "is_holiday" not in df_x.columns
+    assert "Columns ['is_holiday'] are not declared" in caplog.text
+
+    caplog.clear()
+    df_x, _ = DataTransformer(df_transactions, daily_columns=["tavg", "is_holiday"]).frequency_encode()
+    assert list(df_x.columns)[-2:] == ["tavg", "is_holiday"]
+    assert "['weekday'] are not declared" in caplog.text
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_loader.Type_guard import ColumnRule, integer_guard_bool, validate_dataframe
+from data_loader.transaction_data_loader import REQUIRED_TRANSACTION_COLUMNS, TRANSACTION_VALIDATION_RULES, \
+    apply_transaction_schema
+
+
+def create_transactions(number_of_transactions=6):
+    return apply_transaction_schema(pd.DataFrame({
+        "ProductId": np.arange(1, number_of_transactions + 1), "ProductName": "Product", "PackagingType": "Can",
+        "Brand": "Brand", "ProductCategory": "Drinks", "GrossProfit": 0.5,
+        "SaleDate": pd.date_range("2024-01-01", periods=number_of_transactions, freq="h"), "MachineId": 1,
+        "MachineName": "Machine", "Latitude": 52.0, "Longitude": 4.0, "Location": "L1", "LocationType": "Office",
+        "Environment": "Indoor", "InServiceHours": "8-17", "InServiceDays": "Mon-Fri"})[REQUIRED_TRANSACTION_COLUMNS])
+
+
+def validate_transactions(df_transactions, sample_size=None):
+    return validate_dataframe(df_transactions, TRANSACTION_VALIDATION_RULES, REQUIRED_TRANSACTION_COLUMNS,
+                              sample_size=sample_size)
+
+
+def test_standard_transactions_are_valid():
+    report = validate_transactions(create_transactions())
+
+    assert report.is_valid()
+    assert report.warnings == []
+
+
+def test_every_column_error_is_reported_at_once():
+    df_transactions = create_transactions().drop(columns="Brand").assign(Extra=1)
+    df_transactions["ProductId"] = df_transactions["ProductId"].astype(str)
+
+    report = validate_transactions(df_transactions)
+
+    assert report.errors == ["['Brand'] are not in the DataFrame", "['Extra'] are not expected in the DataFrame",
+                             "ProductId is of object, expected integer"]
+
+
+def test_columns_in_another_order_are_an_error():
+    report = validate_transactions(create_transactions()[REQUIRED_TRANSACTION_COLUMNS[::-1]])
+
+    assert report.errors == [f"columns are not in the required order {REQUIRED_TRANSACTION_COLUMNS}"]
+
+
+def test_integer_guard_accepts_whole_floats_with_missing_values():
+    assert integer_guard_bool(pd.Series([1.0, np.nan, 3.0]))
+    assert not integer_guard_bool(pd.Series([1.0, 1.5]))
+    assert not integer_guard_bool(pd.Series(["1"]))
+
+
+def test_missing_key_is_an_error_and_other_violations_are_warnings():
+    df_transactions = create_transactions()
+    df_transactions.loc[0, "SaleDate"] = pd.NaT
+    df_transactions.loc[1, "GrossProfit"] = -1.0
+    df_transactions.loc[2, "Latitude"] = 95.0
+
+    report = validate_transactions(df_transactions)
+
+    assert report.errors == ["SaleDate has 1 (16.67%) missing values, at most 0.00% allowed"]
+    assert report.warnings == ["GrossProfit has values below 0.0, minimum -1.0",
+                               "Latitude has values above 90.0, maximum 95.0"]
+
+
+def test_raise_for_errors_warns_and_raises():
+    report = validate_dataframe(pd.DataFrame({"Sales": [-1.0, np.nan]}),
+                                [ColumnRule("Sales", "float", min_value=0.0),
+                                 ColumnRule("Sales", "float", max_null_rate=0.0, strict=True)])
+
+    with pytest.warns(UserWarning, match="below 0.0"), pytest.raises(ValueError, match="missing values"):
+        report.raise_for_errors()
+
+
+def test_sample_checks_ranges_but_strict_rules_check_every_row():
+    df_transactions = create_transactions(1000)
+    df_transactions.loc[500, "Location"] = np.nan
+
+    report = validate_transactions(df_transactions, sample_size=10)
+
+    assert report.sampled_rows == 10
+    assert report.errors == ["Location has 1 (0.10%) missing values, at most 0.00% allowed"]
+
+
+def test_missing_rule_column_is_an_error_without_required_columns():
+    report = validate_dataframe(pd.DataFrame({"Sales": [1.0]}), [ColumnRule("Stock", "integer")])
+
+    assert report.errors == ["Stock is not in the DataFrame"]
@@ -0,0 +1,114 @@
+import pandas as pd
+import pytest
+from sqlalchemy import inspect
+
+from azure_connectors.AzureSqlCommunicator import bulk_replace_sql_table_by_dataframe, get_engine, \
+    upsert_dataframe_delta_to_sql_table
+from azure_connectors.sql_backend import SqlBackend, set_sql_backend
+
+
+@pytest.fixture
+def connection_url(tmp_path):
+    set_sql_backend(SqlBackend())
+    return f"sqlite:///{tmp_path / 'predictions.db'}"
+
+
+@pytest.fixture
+def snapshot_directory(tmp_path):
+    return str(tmp_path / "upload_snapshots")
+
+
+def read_table(connection_url, table_name="Advice"):
+    return pd.read_sql(f'SELECT * FROM "{table_name}"', get_engine(connection_url)) \
+        .sort_values(["Location", "ProductId"], ignore_index=True)
+
+
+def create_advice(rows):
+    return pd.DataFrame(rows, columns=["Location", "ProductId", "Advice"])
+
+
+def upsert(connection_url, snapshot_directory, dataframe, **kwargs):
+    return upsert_dataframe_delta_to_sql_table(connection_url, "Advice", dataframe, ["Location", "ProductId"],
+                                               schema=None, snapshot_directory=snapshot_directory, **kwargs)
+
+
+def test_first_upload_replaces_the_table(connection_url, snapshot_directory):
+    df_advice = create_advice([["L1", 1, 2.0], ["L1", 2, 3.0]])
+
+    assert upsert(connection_url, snapshot_directory, df_advice) == {"inserted": 2, "updated": 0, "deleted": 0}
+    pd.testing.assert_frame_equal(read_table(connection_url), df_advice)
+
+
+def test_delta_inserts_updates_and_deletes(connection_url, snapshot_directory):
+    upsert(connection_url, snapshot_directory, create_advice([["L1", 1, 2.0], ["L1", 2, 3.0], ["L2", 1, 1.0]]))
+    df_advice = create_advice([["L1", 1, 2.0], ["L1", 2, 5.0], ["L3", 4, 7.0]])
+
+    assert upsert(connection_url, snapshot_directory, df_advice) == {"inserted": 1, "updated": 1, "deleted": 1}
+    pd.testing.assert_frame_equal(read_table(connection_url), df_advice)
+
+
+def test_unchanged_upload_sends_nothing(connection_url, snapshot_directory):
+    df_advice = create_advice([["L1", 1, 2.0]])
+    upsert(connection_url, snapshot_directory, df_advice)
+
+    assert upsert(connection_url, snapshot_directory, df_advice) == {"inserted": 0, "updated": 0, "deleted": 0}
+
+
+def test_delta_after_replace_is_diffed_against_the_replaced_table(connection_url, snapshot_directory):
+    df_advice = create_advice([["L1", 1, 2.0], ["L1", 2, 3.0]])
+    upsert(connection_url, snapshot_directory, df_advice)
+    bulk_replace_sql_table_by_dataframe(connection_url, "Advice", create_advice([["L1", 1, 9.0]]), schema=None,
+                                        snapshot_directory=snapshot_directory)
+
+    upsert(connection_url, snapshot_directory, df_advice)
+    pd.testing.assert_frame_equal(read_table(connection_url), df_advice)
+
+
+def test_forced_replace_rewrites_the_snapshot(connection_url, snapshot_directory):
+    upsert(connection_url, snapshot_directory, create_advice([["L1", 1, 2.0], ["L1", 2, 3.0]]))
+    upsert(connection_url, snapshot_directory, create_advice([["L1", 1, 9.0]]), force_replace=True)
+    df_advice = create_advice([["L1", 1, 9.0], ["L2", 1, 1.0]])
+
+    assert upsert(connection_url, snapshot_directory, df_advice) == {"inserted": 1, "updated": 0, "deleted": 0}
+    pd.testing.assert_frame_equal(read_table(connection_url), df_advice)
+
+
+def test_changed_columns_replace_the_table(connection_url, snapshot_directory):
+    upsert(connection_url, snapshot_directory, create_advice([["L1", 1, 2.0]]))
+    df_advice = create_advice([["L1", 1, 2.0]]).assign(Turnover=[10.0])
+
+    assert upsert(connection_url, snapshot_directory, df_advice) == {"inserted": 1, "updated": 0, "deleted": 0}
+    pd.testing.assert_frame_equal(read_table(connection_url), df_advice)
+
+
+def test_string_columns_are_sized_for_later_upserts(connection_url, snapshot_directory):
+    upsert(connection_url, snapshot_directory, create_advice([["L1", 1, 2.0]]))
+
+    column_lengths = {column["name"]: getattr(column["type"], "length", None)
+                      for column in inspect(get_engine(connection_url)).get_columns("Advice")}
+    assert column_lengths["Location"] >= 4000
+
+
+def test_longer_strings_than_the_table_replace_it(connection_url, snapshot_directory):
+    df_advice = create_advice([["L1", 1, 2.0]])
+    upsert(connection_url, snapshot_directory, df_advice)
+    # a table created with the width of its first upload, as before the upserted tables were sized generously
+    bulk_replace_sql_table_by_dataframe(connection_url, "Advice", df_advice, schema=None,
+                                        snapshot_directory=f"{snapshot_directory}_of_other_uploads")
+    df_advice = create_advice([["L1", 1, 2.0], ["Location-with-a-long-code", 1, 1.0]])
+
+    assert upsert(connection_url, snapshot_directory, df_advice) == {"inserted": 2, "updated": 0, "deleted": 0}
+    pd.testing.assert_frame_equal(read_table(connection_url), df_advice)
+
+
+def test_failed_replace_keeps_the_table_and_snapshot_and_drops_the_staging_table(connection_url, snapshot_directory):
+    df_advice = create_advice([["L1", 1, 2.0], ["L1", 2, 3.0]])
+    upsert(connection_url, snapshot_directory, df_advice)
+    # a dict can not be bound as a SQLite parameter, so the insert into the staging table fails
+    df_unwritable = create_advice([["L1", 1, 2.0]]).assign(Advice=[{"not": "a number"}])
+
+    assert bulk_replace_sql_table_by_dataframe(connection_url, "Advice", df_unwritable, schema=None,
+                                               snapshot_directory=snapshot_directory) is None
+    assert not inspect(get_engine(connection_url)).has_table("Advice_staging")
+    pd.testing.assert_frame_equal(read_table(connection_url), df_advice)
+    assert upsert(connection_url, snapshot_directory, df_advice) == {"inserted": 0, "updated": 0, "deleted": 0}
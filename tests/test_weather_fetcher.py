@@ -0,0 +1,190 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+import data_loader.weather_fetcher as weather_fetcher
+from data_loader.weather_fetcher import WEATHER_PROPERTIES, TokenBucket, WeatherFetcher, _call_with_timeout
+from data_loader.weather_store import WeatherStore
+
+
+class FakeDaily:
+    """stands in for meteostat Daily, records every request and fails the first failures_per_point requests of a point"""
+
+    failures_per_point = 0
+    seconds_per_request = 0.0
+    requests = []
+    running = {"now": 0, "most": 0}
+    lock = threading.Lock()
+
+    def __init__(self, point, start, end):
+        self.point, self.start, self.end = point, start, end
+
+    def aggregate(self, frequency):
+        return self
+
+    def fetch(self):
+        with FakeDaily.lock:
+            FakeDaily.requests.append((self.point, self.start, self.end))
+            attempt = sum(point == self.point for point, _, _ in FakeDaily.requests)
+            FakeDaily.running["now"] += 1
+            FakeDaily.running["most"] = max(FakeDaily.running["most"], FakeDaily.running["now"])
+        time.sleep(FakeDaily.seconds_per_request)
+        with FakeDaily.lock:
+            FakeDaily.running["now"] -= 1
+        if attempt <= FakeDaily.failures_per_point:
+            raise ConnectionError("meteostat is not reachable")
+        days = pd.date_range(self.start, self.end, freq="D", name="time")
+        return pd.DataFrame({"temp": self.point[0] + days.day, "prcp": 0.0}, index=days)
+
+
+@pytest.fixture(autouse=True)
+def fake_meteostat(monkeypatch):
+    monkeypatch.delenv("WEATHER_STORE_DIRECTORY", raising=False)
+    monkeypatch.setattr(weather_fetcher, "Point", lambda latitude, longitude: (latitude, longitude))
+    monkeypatch.setattr(weather_fetcher, "Daily", FakeDaily)
+    FakeDaily.failures_per_point = 0
+    FakeDaily.seconds_per_request = 0.0
+    FakeDaily.requests = []
+    FakeDaily.running = {"now": 0, "most": 0}
+
+
+@pytest.fixture
+def df_locations():
+    return pd.DataFrame({"Location": ["L1", "L2", "L3", "L4"], "Latitude": [52.0, 53.0, 54.0, 55.0],
+                         "Longitude": [4.0, 5.0, 6.0, 7.0]})
+
+
+START, END = pd.Timestamp("2024-01-01"), pd.Timestamp("2024-01-05")
+
+
+def test_token_bucket_limits_the_rate():
+    token_bucket = TokenBucket(rate=20.0, capacity=1.0)
+
+    started_at = time.monotonic()
+    for _ in range(6):
+        token_bucket.acquire()
+
+    assert time.monotonic() - started_at >= 5 / 20.0 * 0.9
+
+
+def test_token_bucket_allows_a_burst_of_its_capacity():
+    token_bucket = TokenBucket(rate=1.0, capacity=5.0)
+
+    started_at = time.monotonic()
+    for _ in range(5):
+        token_bucket.acquire()
+
+    assert time.monotonic() - started_at < 0.5
+
+
+def test_call_with_timeout_raises_for_a_slow_call_and_passes_on_exceptions():
+    with pytest.raises(TimeoutError):
+        _call_with_timeout(lambda: time.sleep(1), 0.05)
+    with pytest.raises(ZeroDivisionError):
+        _call_with_timeout(lambda: 1 / 0, 1)
+    assert _call_with_timeout(lambda: 42, 1) == 42
+
+
+def test_weather_of_every_location_is_fetched(df_locations):
+    df_weather = WeatherFetcher().fetch(df_locations, START, END)
+
+    assert len(df_weather) == 4 * 5
+    assert set(df_weather.columns) == {"SaleDate", "tavg", "prcp", "Location"}
+    assert df_weather.groupby("Location")["tavg"].first().to_dict() == {"L1": 53.0, "L2": 54.0, "L3": 55.0, "L4": 56.0}
+
+
+def test_no_more_than_max_workers_requests_run_at_once(df_locations):
+    FakeDaily.seconds_per_request = 0.05
+
+    WeatherFetcher(max_workers=2, requests_per_second=1000.0).fetch(df_locations, START, END)
+
+    assert FakeDaily.running["most"] == 2
+
+
+def test_failed_requests_are_retried(df_locations):
+    FakeDaily.failures_per_point = 2
+
+    df_weather = WeatherFetcher(retries=2, retry_backoff=0.0).fetch(df_locations, START, END)
+
+    assert len(FakeDaily.requests) == 4 * 3
+    assert set(df_weather["Location"]) == {"L1", "L2", "L3", "L4"}
+
+
+def test_location_that_keeps_failing_gets_no_weather_instead_of_failing_the_run(df_locations):
+    FakeDaily.failures_per_point = 3
+
+    df_weather = WeatherFetcher(retries=1, retry_backoff=0.0).fetch(df_locations, START, END)
+
+    assert df_weather.empty
+
+
+def test_every_unique_point_is_requested_once():
+    df_machines = pd.DataFrame({"Location": ["L1", "L1", "L2", "L3"], "Latitude": [52.0, 52.0, 52.0, 53.0],
+                                "Longitude": [4.0, 4.0, 4.0, 5.0]})
+    fetcher = WeatherFetcher()
+
+    df_weather = fetcher.fetch(df_machines, START, END)
+
+    assert sorted(point for point, _, _ in FakeDaily.requests) == [(52.0, 4.0), (53.0, 5.0)]
+    assert fetcher.requests_saved == 2
+    # the weather of a shared point is fanned out to every Location at that point
+    pd.testing.assert_frame_equal(df_weather[df_weather["Location"] == "L1"].drop(columns="Location").reset_index(drop=True),
+                                  df_weather[df_weather["Location"] == "L2"].drop(columns="Location").reset_index(drop=True))
+
+
+def test_points_are_snapped_to_the_grid():
+    df_machines = pd.DataFrame({"Location": ["L1", "L2", "L3"], "Latitude": [52.01, 51.98, 52.3],
+                                "Longitude": [4.02, 3.99, 4.0]})
+    fetcher = WeatherFetcher(grid_size=0.1)
+
+    df_points = fetcher.weather_points(df_machines)
+    fetcher.fetch(df_machines, START, END)
+
+    assert df_points["Latitude"].tolist() == pytest.approx([52.0, 52.0, 52.3])
+    assert len(FakeDaily.requests) == 2
+    assert fetcher.requests_saved == 1
+
+
+def test_locations_without_coordinates_are_not_requested():
+    df_machines = pd.DataFrame({"Location": ["L1", "L2"], "Latitude": [52.0, 0.0], "Longitude": [4.0, 0.0]})
+
+    df_weather = WeatherFetcher().fetch(df_machines, START, END)
+
+    assert [point for point, _, _ in FakeDaily.requests] == [(52.0, 4.0)]
+    assert set(df_weather["Location"]) == {"L1"}
+
+
+def test_stored_weather_is_not_requested_again(df_locations, tmp_path):
+    fetcher = WeatherFetcher(weather_store=WeatherStore(str(tmp_path / "weather_store")))
+    df_weather = fetcher.fetch(df_locations, START, END)
+    FakeDaily.requests = []
+
+    df_stored_weather = fetcher.fetch(df_locations, START, END)
+
+    assert FakeDaily.requests == []
+    pd.testing.assert_frame_equal(df_stored_weather, df_weather)
+
+
+def test_only_the_days_missing_from_the_store_are_requested(df_locations, tmp_path):
+    fetcher = WeatherFetcher(weather_store=WeatherStore(str(tmp_path / "weather_store")))
+    fetcher.fetch(df_locations, START, END)
+    FakeDaily.requests = []
+
+    df_weather = fetcher.fetch(df_locations, START, END + pd.Timedelta(days=2))
+
+    assert {(start, end) for _, start, end in FakeDaily.requests} == {(END + pd.Timedelta(days=1), END + pd.Timedelta(days=2))}
+    assert len(df_weather) == 4 * 7
+
+
+def test_offline_fetch_without_stored_weather_returns_typed_empty_weather(df_locations, tmp_path):
+    fetcher = WeatherFetcher(weather_store=WeatherStore(str(tmp_path / "weather_store"), offline=True))
+
+    df_weather = fetcher.fetch(df_locations, START, END)
+
+    assert FakeDaily.requests == []
+    assert df_weather.empty
+    assert df_weather["SaleDate"].dtype == "datetime64[ns]"
+    assert set(WEATHER_PROPERTIES) < set(df_weather.columns)
+    assert (df_weather.dtypes[WEATHER_PROPERTIES] == "Float64").all()
@@ -0,0 +1,84 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_loader.weather_store import WeatherStore, create_weather_store_from_environment
+
+
+@pytest.fixture
+def weather_store(tmp_path):
+    return WeatherStore(str(tmp_path / "weather_store"))
+
+
+def create_weather(start, end):
+    days = pd.date_range(start, end, freq="D")
+    return pd.DataFrame({"SaleDate": days, "tavg": days.day.astype("float64")})
+
+
+def test_empty_store_misses_every_day(weather_store):
+    df_stored = weather_store.load(52.0, 4.0)
+
+    assert weather_store.missing_ranges(df_stored, datetime.datetime(2024, 1, 1, 13), datetime.datetime(2024, 1, 10)) == \
+        [(pd.Timestamp("2024-01-01"), pd.Timestamp("2024-01-10"))]
+
+
+def test_only_the_gaps_between_stored_days_are_missing(weather_store):
+    df_stored = weather_store.update(52.0, 4.0, weather_store.load(52.0, 4.0), [
+        ("2024-01-03", "2024-01-05", create_weather("2024-01-03", "2024-01-05")),
+        ("2024-01-08", "2024-01-08", create_weather("2024-01-08", "2024-01-08"))])
+
+    assert weather_store.missing_ranges(df_stored, "2024-01-01", "2024-01-10") == [
+        (pd.Timestamp("2024-01-01"), pd.Timestamp("2024-01-02")),
+        (pd.Timestamp("2024-01-06"), pd.Timestamp("2024-01-07")),
+        (pd.Timestamp("2024-01-09"), pd.Timestamp("2024-01-10"))]
+
+
+def test_recent_days_are_refreshed(weather_store):
+    today = pd.Timestamp(datetime.date.today())
+    start = today - pd.Timedelta(days=10)
+    df_stored = weather_store.update(52.0, 4.0, weather_store.load(52.0, 4.0),
+                                     [(start, today, create_weather(start, today))])
+
+    assert weather_store.missing_ranges(df_stored, start, today) == \
+        [(today - pd.Timedelta(days=weather_store.refresh_days), today)]
+
+
+def test_offline_store_fetches_nothing(tmp_path):
+    weather_store = WeatherStore(str(tmp_path / "weather_store"), offline=True)
+
+    assert weather_store.missing_ranges(weather_store.load(52.0, 4.0), "2024-01-01", "2024-01-10") == []
+
+
+def test_days_without_observations_are_stored_but_not_selected(weather_store):
+    # meteostat has no observations for 2024-01-02
+    df_weather = create_weather("2024-01-01", "2024-01-03").drop(index=1)
+    weather_store.update(52.0, 4.0, weather_store.load(52.0, 4.0), [("2024-01-01", "2024-01-03", df_weather)])
+
+    df_stored = weather_store.load(52.0, 4.0)
+    assert len(df_stored) == 3
+    assert np.isnan(df_stored["tavg"][1])
+    assert weather_store.missing_ranges(df_stored, "2024-01-01", "2024-01-03") == []
+    assert weather_store.select(df_stored, "2024-01-01", "2024-01-03")["SaleDate"].tolist() == \
+        [pd.Timestamp("2024-01-01"), pd.Timestamp("2024-01-03")]
+
+
+def test_refetched_days_replace_the_stored_days(weather_store):
+    weather_store.update(52.0, 4.0, weather_store.load(52.0, 4.0),
+                         [("2024-01-01", "2024-01-03", create_weather("2024-01-01", "2024-01-03"))])
+    weather_store.update(52.0, 4.0, weather_store.load(52.0, 4.0),
+                         [("2024-01-03", "2024-01-03", create_weather("2024-01-03", "2024-01-03").assign(tavg=10.0))])
+
+    assert weather_store.load(52.0, 4.0)["tavg"].tolist() == [1.0, 2.0, 10.0]
+
+
+def test_store_is_created_from_the_environment(tmp_path, monkeypatch):
+    monkeypatch.delenv("WEATHER_STORE_DIRECTORY", raising=False)
+    assert create_weather_store_from_environment() is None
+
+    monkeypatch.setenv("WEATHER_STORE_DIRECTORY", str(tmp_path / "weather_store"))
+    monkeypatch.setenv("WEATHER_OFFLINE", "true")
+    weather_store = create_weather_store_from_environment()
+    assert weather_store.directory == str(tmp_path / "weather_store")
+    assert weather_store.offline